@@ -1,8 +1,30 @@
-import re
+import time
+import uuid
+import threading
 import streamlit as st
+from streamlit.errors import StreamlitAPIException
 import pandas as pd
-from supabase import create_client, Client
-from datetime import datetime, timedelta
+from datetime import datetime
+from collections import OrderedDict
+from pm.config import (STATUS_CONFIG, STATUS_ZH_TO_KEY, STATUS_KEY_TO_ZH, STATUS_ZH_OPTIONS, SECTIONS,
+                       YEAR_OPTIONS, PROCESS_COLS, PROCESS_NAMES, DISPLAY_COLS, COL_DISPLAY_NAMES,
+                       CATEGORY_COLS, DATE_COLS, dt_col)
+from pm.data import ProjectStore
+from pm.views import (APP_CSS, TABLE_STATUS_CSS, TABLE_PAGE_ROWS, build_week_index, week_key, week_start,
+                      build_filter_index, query_filter_index, render_table_html, kpi_cards_html,
+                      section_badges_html, pdf_section_block)
+from pm.editing import editor_changes, with_typed_dates, write_batch, send_ops, INSERT_KEY
+from pm.jobs import ExportJobs, ExportJob
+from pm.analytics import (Pipeline, CALC_PAIRS, segment_days, current_stage, duration_frame,
+                          duration_summary, stage_percentiles, weekly_throughput, wip_counts,
+                          find_bottleneck)
+from pm.completion import completion_changes
+from pm.realtime import ChangeFeed, SupabaseRealtimeBackend
+from pm.outbox import Outbox, TRANSIENT_ERRORS
+from pm.replica import Replica
+from pm.counts import ServerCounts, COUNTS_TTL, count_table, status_totals, section_summary
+from pm.db import SupabasePool, AsyncSupabasePool, RETRY_ERRORS
+from concurrent.futures import ThreadPoolExecutor
 
 # ==========================================
 # 密碼檢查
@@ -32,395 +54,793 @@ if not check_password():
 st.set_page_config(page_title="工程案執行進度管理系統",
                    page_icon="⚙", layout="wide", initial_sidebar_state="collapsed")
 
-st.markdown("""
-<style>
-  /* ══ 基礎 ══ */
-  .block-container { padding-top: 0.3rem !important; padding-left: 0.5rem !important; padding-right: 0.5rem !important; }
-  header[data-testid="stHeader"] { background: transparent; }
-
-  /* ══ 自訂統計卡（HTML，完全控制顏色）══ */
-  .kpi-grid {
-    display: grid;
-    grid-template-columns: repeat(3, 1fr);
-    gap: 8px; margin-bottom: 10px;
-  }
-  .kpi-card {
-    background: #1a3a5c; border-radius: 10px;
-    padding: 10px 8px; text-align: center;
-    border: 1px solid #2a5080;
-  }
-  .kpi-label { color: #90caf9; font-size: 12px; font-weight: 700; margin-bottom: 2px; }
-  .kpi-value { color: #ffffff; font-size: 1.6rem; font-weight: 900; line-height: 1.1; }
-
-  /* ══ 分區標題 ══ */
-  .section-header {
-    background: linear-gradient(90deg, #0d2137, #1a3a5c); color: #fff;
-    padding: 10px 14px; border-radius: 8px;
-    font-size: 15px; font-weight: 800; margin: 12px 0 6px 0; letter-spacing: 1px;
-  }
-
-  /* ══ 按鈕：強制白底深字，深色模式也清楚 ══ */
-  .stButton > button {
-    border-radius: 18px !important;
-    font-size: 14px !important;
-    font-weight: 700 !important;
-    min-height: 44px !important;
-    padding: 4px 10px !important;
-    background-color: #ffffff !important;
-    color: #111111 !important;
-    border: 1.5px solid #999999 !important;
-  }
-  /* 選中（primary）：深藍底白字 */
-  .stButton > button[kind="primaryFormSubmit"],
-  .stButton > button[kind="primary"] {
-    background-color: #1a3a5c !important;
-    color: #ffffff !important;
-    border: none !important;
-  }
-
-  /* ══ 圖例列 ══ */
-  .legend-bar {
-    display: flex; gap: 8px; flex-wrap: wrap;
-    background: #1e3a5f; padding: 8px 12px; border-radius: 8px;
-    margin-bottom: 8px; font-size: 12px; font-weight: 600;
-    color: #e3f0ff; align-items: center; border: 1px solid #2a5080;
-  }
-  .color-box {
-    width: 13px; height: 13px; border-radius: 3px;
-    border: 1px solid #888; display: inline-block; vertical-align: middle;
-  }
-
-  /* ══ 工程卡片（手機用）══ */
-  .project-card {
-    background: #fff; border-radius: 10px; padding: 12px 14px;
-    margin-bottom: 8px; border-left: 5px solid #1a3a5c;
-    box-shadow: 0 1px 4px rgba(0,0,0,0.12);
-  }
-  .project-card.status-in_progress  { border-left-color: #e6c800; background: #fffff0; }
-  .project-card.status-pending       { border-left-color: #2196f3; background: #e8f4ff; }
-  .project-card.status-not_started   { border-left-color: #90a4ae; background: #fafafa; }
-  .project-card.status-suspended     { border-left-color: #ff7043; background: #fff3ee; }
-  .project-card.status-completed     { border-left-color: #757575; background: #f5f5f5; }
-  .card-title { font-size: 15px; font-weight: 800; color: #0d2137; margin-bottom: 4px; }
-  .card-sub   { font-size: 12px; color: #444; margin: 2px 0; }
-  .card-badge {
-    display: inline-block; border-radius: 12px; padding: 2px 10px;
-    font-size: 11px; font-weight: 700; margin: 4px 4px 0 0;
-  }
-  .card-red { color: #c62828; font-weight: 900; }
-
-  /* ══ dataframe 字色 ══ */
-  [data-testid="stDataFrame"] td { color: #111 !important; font-size: 13px !important; }
-  [data-testid="stDataFrame"] th { color: #fff !important; font-size: 12px !important; }
-</style>
-""", unsafe_allow_html=True)
+# 版面 CSS（pm/views.py）與表格列底色
+st.markdown(APP_CSS + f"<style>{TABLE_STATUS_CSS}</style>", unsafe_allow_html=True)
 
 # ── 連接 ──────────────────────────────────────────────────
+# 所有 session 共用同一個連線池（pm/db.py）：keep-alive / HTTP/2、依操作分逾時、讀取失敗自動重試。
+# 查詢寫法與 supabase Client 相同；讀取用 supabase.read(q) 執行（可重試），寫入照常 q.execute()。
+DB_POOL_SIZE = int(st.secrets.get("DB_POOL_SIZE", 20))
+DB_TIMEOUTS  = dict(st.secrets.get("DB_TIMEOUTS", {}))   # 例如 {read = 15, bulk = 60}
+
+@st.cache_resource
+def get_supabase() -> SupabasePool:
+    return SupabasePool(st.secrets["SUPABASE_URL"], st.secrets["SUPABASE_KEY"],
+                        timeouts=DB_TIMEOUTS, max_connections=DB_POOL_SIZE)
+
 @st.cache_resource
-def get_supabase() -> Client:
-    return create_client(st.secrets["SUPABASE_URL"], st.secrets["SUPABASE_KEY"])
+def get_async_db() -> AsyncSupabasePool:
+    """非同步版（同一組逾時 / 重試），給需要一次丟出多個查詢的載入器用"""
+    return AsyncSupabasePool(st.secrets["SUPABASE_URL"], st.secrets["SUPABASE_KEY"],
+                             timeouts=DB_TIMEOUTS, max_connections=DB_POOL_SIZE, max_inflight=LOAD_WORKERS)
 
 supabase = get_supabase()
 
 # ── UI 狀態持久化（存到 Supabase user_prefs）──────────
 import json as _json
 
+# 每位使用者一列：key = "ui_state:<使用者>"（網址帶 ?user=<名稱>）；沒帶的沿用舊版全體共用的 "ui_state"，
+# 新使用者第一次讀取時也以它當預設值
+UI_STATE_KEY      = "ui_state"
+UI_SAVE_DEBOUNCE  = 1.5   # 秒；這段時間內的連續變動只寫最後一次
+UI_SAVE_RETRIES   = 3
+
+def ui_user_key() -> str:
+    """目前使用者的 user_prefs key；使用者由網址 ?user= 決定，沒帶就用共用的 ui_state（書籤 / 直接開網址都固定）"""
+    user = st.query_params.get("user", "")
+    return f"{UI_STATE_KEY}:{user}" if user else UI_STATE_KEY
+
+def outbox_owner() -> str:
+    """寫入佇列的 owner（衝突只交給他）：有 ?user= 就跟著使用者，否則每個 session 各自一個"""
+    if st.query_params.get("user"):
+        return ui_user_key()
+    if "_outbox_owner" not in st.session_state:
+        st.session_state["_outbox_owner"] = f"session:{uuid.uuid4().hex[:8]}"
+    return st.session_state["_outbox_owner"]
+
+class UiPrefs:
+    """
+    UI 狀態讀寫（process 共用）：
+      - submit()：只記下最新狀態就返回，背景 thread 等 UI_SAVE_DEBOUNCE 秒沒再變動才 upsert（最後一次為準）
+      - prefetch()：背景讀取，回傳 Future；讀過 / 寫過的狀態留在記憶體，之後直接回傳
+    """
+
+    def __init__(self):
+        self.cond    = threading.Condition()
+        self.pending = {}    # key -> [state, 到期時間, 已重試次數]
+        self.known   = {}    # key -> 最後已知狀態
+        self.pool    = ThreadPoolExecutor(max_workers=2, thread_name_prefix="ui-prefs")
+        threading.Thread(target=self._run, daemon=True, name="ui-prefs-writer").start()
+
+    def prefetch(self, key: str):
+        return self.pool.submit(self.load, key)
+
+    def load(self, key: str) -> dict:
+        with self.cond:
+            if key in self.known: return self.known[key]
+        state = {}
+        try:
+            res = supabase.read(supabase.table("user_prefs").select("key,value").in_("key", [key, UI_STATE_KEY]))
+            by_key = {r["key"]: r["value"] for r in res.data or []}
+            raw = by_key.get(key) or by_key.get(UI_STATE_KEY)
+            if raw: state = _json.loads(raw)
+        except: pass
+        with self.cond:
+            return self.known.setdefault(key, state)
+
+    def submit(self, key: str, state: dict):
+        with self.cond:
+            if self.known.get(key) == state and key not in self.pending: return
+            self.known[key] = state
+            self.pending[key] = [state, time.monotonic() + UI_SAVE_DEBOUNCE, 0]
+            self.cond.notify()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.pending:
+                    self.cond.wait()
+                key, (state, due, tries) = min(self.pending.items(), key=lambda kv: kv[1][1])
+                wait = due - time.monotonic()
+                if wait > 0:
+                    self.cond.wait(wait)
+                    continue
+                del self.pending[key]
+            try:
+                supabase.table("user_prefs", "write").upsert(
+                    {"key": key, "value": _json.dumps(state, ensure_ascii=False)}
+                ).execute()
+            except Exception:
+                with self.cond:
+                    # 失敗且期間沒有更新的狀態 → 稍後重試
+                    if key not in self.pending and tries + 1 < UI_SAVE_RETRIES:
+                        self.pending[key] = [state, time.monotonic() + UI_SAVE_DEBOUNCE * 2 ** (tries + 1), tries + 1]
+
+@st.cache_resource
+def get_ui_prefs() -> UiPrefs:
+    return UiPrefs()
+
 def load_ui_state() -> dict:
-    """從 Supabase 讀取上次 UI 狀態"""
-    try:
-        res = supabase.table("user_prefs").select("value").eq("key","ui_state").execute()
-        if res.data:
-            return _json.loads(res.data[0]["value"])
-    except: pass
-    return {}
+    """上次的 UI 狀態：先看本 session 快取，再等背景預先讀取的結果（最多 2 秒）"""
+    if "_ui_state" in st.session_state:
+        return st.session_state["_ui_state"]
+    fut = st.session_state.pop("_ui_prefetch", None) or get_ui_prefs().prefetch(ui_user_key())
+    try:    state = fut.result(timeout=2)
+    except: state = {}
+    st.session_state["_ui_state"] = state
+    return state
 
 def save_ui_state(state: dict):
-    """把目前 UI 狀態存回 Supabase"""
-    try:
-        supabase.table("user_prefs").upsert(
-            {"key": "ui_state", "value": _json.dumps(state, ensure_ascii=False)}
-        ).execute()
-    except: pass
+    """記下目前 UI 狀態；實際寫入由背景合併處理，不會卡住按鈕"""
+    st.session_state["_ui_state"] = state
+    get_ui_prefs().submit(ui_user_key(), state)
+
+# ── 資料（分頁載入 / 快照 / 增量同步在 pm/data.py）─────────────
+# PostgREST 單次查詢有筆數上限（預設 1000），超過的列會被默默截掉。
+# 改成依 id 切區間分頁：每頁最多 PAGE_SIZE 筆（須 ≤ 伺服器上限），各頁平行抓取。
+PAGE_SIZE    = int(st.secrets.get("PAGE_SIZE", 500))
+LOAD_WORKERS = int(st.secrets.get("LOAD_WORKERS", 4))
+
+@st.cache_resource
+def get_store() -> ProjectStore:
+    store = ProjectStore(get_supabase(), get_async_db(), PAGE_SIZE)
+    if str(st.secrets.get("REPLICA", "on")).lower() != "off":
+        try:
+            store.replica = Replica()
+        except Exception:
+            pass   # 快取目錄不能寫就不用副本
+    return store
+
+@st.cache_resource
+def get_change_feed():
+    """
+    process 共用的變更訂閱：事件直接修補快照；重新連上時補一次增量同步。
+    secrets 的 REALTIME = "off" 可關閉（改回每 SYNC_INTERVAL 秒輪詢）。
+    """
+    store = get_store()
+    if str(st.secrets.get("REALTIME", "supabase")).lower() == "off":
+        return None
+    backend = SupabaseRealtimeBackend(st.secrets["SUPABASE_URL"], st.secrets["SUPABASE_KEY"])
+    store.feed = ChangeFeed(backend, lambda rows, deleted: store.apply_saved(rows, deleted, source="live"),
+                            on_reconnect=lambda: store.mark_stale(check_ids=True)).start()
+    return store.feed
 
-@st.cache_data(ttl=15)
 def load_data() -> pd.DataFrame:
-    res = supabase.table("projects").select("*").order("case_no", desc=True).execute()
-    if not res.data: return pd.DataFrame()
-    df = pd.DataFrame(res.data)
-    for col in df.columns:
-        df[col] = df[col].fillna("").astype(str).replace({"None":"","nan":"","NaN":"","none":""})
-    # 固定顯示順序欄（新增的排最上面 = 序號最小）
-    df.insert(0, "_order", range(1, len(df)+1))
-    return df
+    get_change_feed()
+    store = get_store()
+    if not store.full_at and store.df.empty:
+        # 冷啟動：第一次完整載入要幾秒，先顯示載入中（之後都是快照命中 / 增量同步）
+        with st.spinner("載入工程資料中…"):
+            return store.get()
+    return store.get()
+
+def invalidate_data(check_ids: bool = False):
+    """強制下一次載入做增量同步（重新整理按鈕用；一般儲存會直接修補快照，不需呼叫）"""
+    get_store().mark_stale(check_ids)
+
+def data_version() -> int:
+    """目前快照版本；各 session 比對這個數字就知道資料有沒有變"""
+    return get_store().version
+
+def frame_version(df: pd.DataFrame) -> int:
+    """這份 DataFrame 來自哪個快照版本（篩選後的子集沿用 attrs）"""
+    return df.attrs.get("version", 0)
+
+# ── 衍生結果快取 ──────────────────────────────────────────
+# 本週索引、篩選結果、表格 HTML 等都由快照算出；key 內含資料版本，版本一變舊結果就不會再被取用
+DERIVED_CACHE_SIZE = 256
+
+@st.cache_resource
+def _derived_cache() -> dict:
+    return {"lock": threading.Lock(), "items": OrderedDict()}
+
+def cached_derived(key: tuple, build):
+    """process 共用的 LRU 快取：key 命中直接回傳，否則呼叫 build() 並存起來"""
+    cache = _derived_cache()
+    with cache["lock"]:
+        if key in cache["items"]:
+            cache["items"].move_to_end(key)
+            return cache["items"][key]
+    val = build()
+    with cache["lock"]:
+        cache["items"][key] = val
+        while len(cache["items"]) > DERIVED_CACHE_SIZE:
+            cache["items"].popitem(last=False)
+    return val
 
 def refresh():
-    st.cache_data.clear()
+    invalidate_data(check_ids=True)
     st.rerun()
 
-# ── 狀態設定（中英文對照）──────────────────────────────────
-STATUS_CONFIG = {
-    "in_progress": {"label":"製作中","icon":"⚙", "bg":"#FFFF99","btn":"#e6c800","text":"#000"},
-    "pending":     {"label":"待交站","icon":"📦","bg":"#CCE8FF","btn":"#2196f3","text":"#fff"},
-    "not_started": {"label":"未開始","icon":"⏳","bg":"#FFFFFF","btn":"#90a4ae","text":"#fff"},
-    "suspended":   {"label":"停工",  "icon":"⏸","bg":"#FFE0B2","btn":"#ff7043","text":"#fff"},
-    "completed":   {"label":"已交站","icon":"✅","bg":"#F0F0F0","btn":"#757575","text":"#fff"},
-}
-# 中文標籤 ↔ 英文 key 對照
-STATUS_ZH_TO_KEY = {v["label"]: k for k, v in STATUS_CONFIG.items()}
-STATUS_KEY_TO_ZH = {k: v["label"] for k, v in STATUS_CONFIG.items()}
-STATUS_ZH_OPTIONS = [""] + [v["label"] for v in STATUS_CONFIG.values()]
-
-SECTIONS = ["主要工程", "偉鴻", "材料案"]
-PROCESS_COLS  = ["drawing","pipe_support","welding","nde","sandblast","assembly","painting","pressure_test","handover"]
-PROCESS_NAMES = ["製造圖面","管撐製作","點焊","焊道NDE","噴砂","組立*","噴漆","試壓","交站"]
-DISPLAY_COLS  = ["status","completion","materials","case_no","project_name","client",
-                 "tracking","drawing","pipe_support","welding","nde","sandblast",
-                 "assembly","painting","pressure_test","handover","handover_year","contact"]
-
 # ── 欄位設定（status_type 改為中文下拉）──────────────────
-COL_CONFIG = {
-    "status":        st.column_config.TextColumn("施工順序"),
-    "completion":    st.column_config.TextColumn("完成率"),
-    "materials":     st.column_config.TextColumn("備料"),
-    "case_no":       st.column_config.TextColumn("案號"),
-    "project_name":  st.column_config.TextColumn("工程名稱", width="large"),
-    "client":        st.column_config.TextColumn("業主"),
-    "tracking":      st.column_config.TextColumn("備註", width="medium"),
-    "drawing":       st.column_config.DateColumn("製造圖面",  format="MM/DD"),
-    "pipe_support":  st.column_config.DateColumn("管撐製作",  format="MM/DD"),
-    "welding":       st.column_config.DateColumn("點焊",      format="MM/DD"),
-    "nde":           st.column_config.DateColumn("焊道NDE",   format="MM/DD"),
-    "sandblast":     st.column_config.DateColumn("噴砂",      format="MM/DD"),
-    "assembly":      st.column_config.DateColumn("組立*",     format="MM/DD"),
-    "painting":      st.column_config.DateColumn("噴漆",      format="MM/DD"),
-    "pressure_test": st.column_config.DateColumn("試壓",      format="MM/DD"),
-    "handover":      st.column_config.DateColumn("交站",      format="MM/DD"),
-    "handover_year": st.column_config.SelectboxColumn("交站年份", options=["","114","115","116"]),
-    "contact":       st.column_config.TextColumn("對應窗口"),
-    # ✅ 改為中文下拉選單，直接看得懂
-    "status_zh":     st.column_config.SelectboxColumn(
-                         "🎨 狀態",
-                         options=STATUS_ZH_OPTIONS,
-                         help="選擇狀態後列顏色立即更新"),
-}
-
-# ── 本週判斷 ──────────────────────────────────────────────
-def _week_start():
+@st.cache_resource
+def editor_column_config() -> dict:
+    """data_editor 的欄位設定，process 內只建一次（data_editor 會自行複製，不會改到這份）"""
+    return {
+        "status":        st.column_config.TextColumn("施工順序"),
+        "completion":    st.column_config.TextColumn("完成率"),
+        "materials":     st.column_config.TextColumn("備料"),
+        "case_no":       st.column_config.TextColumn("案號"),
+        "project_name":  st.column_config.TextColumn("工程名稱", width="large"),
+        "client":        st.column_config.TextColumn("業主"),
+        "tracking":      st.column_config.TextColumn("備註", width="medium"),
+        "drawing":       st.column_config.DateColumn("製造圖面",  format="MM/DD"),
+        "pipe_support":  st.column_config.DateColumn("管撐製作",  format="MM/DD"),
+        "welding":       st.column_config.DateColumn("點焊",      format="MM/DD"),
+        "nde":           st.column_config.DateColumn("焊道NDE",   format="MM/DD"),
+        "sandblast":     st.column_config.DateColumn("噴砂",      format="MM/DD"),
+        "assembly":      st.column_config.DateColumn("組立*",     format="MM/DD"),
+        "painting":      st.column_config.DateColumn("噴漆",      format="MM/DD"),
+        "pressure_test": st.column_config.DateColumn("試壓",      format="MM/DD"),
+        "handover":      st.column_config.DateColumn("交站",      format="MM/DD"),
+        "handover_year": st.column_config.SelectboxColumn("交站年份", options=YEAR_OPTIONS),
+        "contact":       st.column_config.TextColumn("對應窗口"),
+        # ✅ 改為中文下拉選單，直接看得懂
+        "status_zh":     st.column_config.SelectboxColumn(
+                             "🎨 狀態",
+                             options=STATUS_ZH_OPTIONS,
+                             help="選擇狀態後列顏色立即更新"),
+    }
+
+# ── 本週判斷（索引在 pm/views.py）──────────────────────────
+def week_index(df: pd.DataFrame) -> dict:
+    """本週索引：每個資料版本、每週只算一次"""
     now = datetime.now()
-    ws  = now - timedelta(days=now.weekday())
-    return ws.replace(hour=0, minute=0, second=0, microsecond=0)
+    return cached_derived(("week", frame_version(df), *week_key(now)),
+                          lambda: build_week_index(df, now))
 
-def is_this_week(dt_str: str) -> bool:
-    """判斷 ISO 日期字串是否在本週內（供 updated_at 使用）"""
-    try:
-        if not dt_str or dt_str in ("", "None", "nan"): return False
-        dt = pd.to_datetime(dt_str, errors="coerce")
-        if pd.isna(dt): return False
-        ws = _week_start()
-        we = ws + timedelta(days=7)
-        d  = dt.replace(tzinfo=None)
-        return ws <= d < we
-    except: return False
-
-def is_this_week_str(raw: str) -> bool:
-    """支援 M/D 及 YYYY-MM-DD 格式，判斷是否本週（含週一到週日）"""
-    try:
-        raw = raw.strip()
-        if not raw: return False
-        ws = _week_start()
-        we = ws + timedelta(days=7)
-        if re.match(r"^\d{1,2}/\d{1,2}$", raw):
-            year = datetime.now().year
-            dt = datetime.strptime(f"{year}/{raw}", "%Y/%m/%d")
-        else:
-            dt = pd.to_datetime(raw, errors="coerce")
-            if pd.isna(dt): return False
-            dt = dt.to_pydatetime()
-        return ws <= dt.replace(tzinfo=None) < we
-    except: return False
+# ── 件數彙總（pm/counts.py）：統計卡、狀態按鈕、分區標籤 ──────
+@st.cache_resource
+def get_server_counts() -> ServerCounts:
+    return ServerCounts(get_supabase(), float(st.secrets.get("COUNTS_TTL", COUNTS_TTL)))
 
-# ── 自動儲存函式 ──────────────────────────────────────────
-def do_save(sec: str, original_df: pd.DataFrame, editor_state) -> int:
+def summary_counts(df: pd.DataFrame = None):
     """
-    處理 data_editor 的 session_state 格式：
-    {"edited_rows": {str(row_idx): {col: val}},
-     "added_rows":  [{col: val}],
-     "deleted_rows":[row_idx]}
+    （分區, 狀態, 年份）件數 ＋ 本週更新件數。給 df → 由快照算（依資料版本 / 本週快取）；
+    不給 → 資料庫彙總（冷啟動時不等整張表）；資料庫沒有 project_counts 或暫時失敗 → None
     """
-    if not isinstance(editor_state, dict):
-        return 0
-    saved = 0
-    now_iso = datetime.now().isoformat()
+    since = week_start()
+    if df is None:
+        return get_server_counts().get(since)
+    return cached_derived(("counts", frame_version(df), since), lambda: count_table(df, since))
+
+# ── 篩選（索引與查詢在 pm/views.py）──────────────────────
+def filter_rows(df: pd.DataFrame, statuses=(), search: str = "",
+                year: str = "全部年份", section: str = "全部分區") -> pd.DataFrame:
+    """狀態（可多選）/ 關鍵字 / 年份 / 分區 篩選；結果依（資料版本, 條件）快取"""
+    if df.empty: return df
+    ver   = frame_version(df)
+    key   = (tuple(sorted(statuses)), search.strip(), year, section)
+    idx   = cached_derived(("filter_index", ver), lambda: build_filter_index(df))
+    pos   = cached_derived(("filter", ver, key), lambda: query_filter_index(idx, *key))
+    return df.iloc[pos]
+
+# ── 分區唯讀表格 ──────────────────────────────────────────
+def section_table_html(df_sec: pd.DataFrame, sec: str, filter_key: tuple, hits: pd.DataFrame, page: int = 0) -> str:
+    """依（分區, 篩選條件, 資料版本, 本週, 頁碼）快取表格 HTML"""
+    def _build():
+        start = page * TABLE_PAGE_ROWS
+        return render_table_html(df_sec.iloc[start:start + TABLE_PAGE_ROWS], hits)
+    return cached_derived(("table", frame_version(df_sec), sec, filter_key, *week_key(), page), _build)
+
+# ── 背景匯出 ──────────────────────────────────────────────
+EXPORT_POLL_SEC = 1.0
+EXPORT_MIME = {"pdf": "application/pdf",
+               "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"}
+EXPORT_LABEL = {"pdf": "PDF", "xlsx": "Excel"}
 
-    # 不送進 Supabase 的前端欄位（id 單獨處理，不放這裡）
-    NON_DB_COLS = {"🗑 刪除", "status_zh", "_order"}
+@st.cache_resource
+def get_export_jobs() -> ExportJobs:
+    """全站共用的匯出佇列；同樣篩選 + 同一資料版本的檔案只產生一次"""
+    return ExportJobs(workers=int(st.secrets.get("EXPORT_WORKERS", 2)))
 
-    def clean_val(v) -> str:
-        """任何值轉乾淨字串，None/nan → 空字串；date物件 → YYYY/MM/DD"""
-        if v is None: return ""
-        # date/datetime 物件 → 短日期字串
-        try:
-            from datetime import date as _date, datetime as _dt
-            if isinstance(v, (_date, _dt)):
-                return v.strftime("%Y/%m/%d")  # 存到 DB 保留完整年份，顯示由 DateColumn format 控制
-        except: pass
-        if not isinstance(v, str):
-            try:
-                if pd.isna(v): return ""
-            except: pass
-        return "" if str(v) in ("None","nan","NaN","none") else str(v)
-
-    def build_row_dict(base_row: pd.Series, changes: dict) -> dict:
-        """合併原始列與本次變動，回傳可直接 upsert 的 dict"""
-        merged = base_row.to_dict()
-        merged.update(changes)
-        row_dict = {}
-        for k, v in merged.items():
-            if k in NON_DB_COLS or k == "id": continue   # id 另外處理
-            row_dict[k] = clean_val(v)
-        row_dict["section"]    = sec
-        row_dict["updated_at"] = now_iso
-        # 中文狀態下拉 → 英文 status_type（changes 裡的 status_zh 優先）
-        zh_label = clean_val(changes.get("status_zh", merged.get("status_zh","")))
-        if zh_label in STATUS_ZH_TO_KEY:
-            row_dict["status_type"] = STATUS_ZH_TO_KEY[zh_label]
-        # 備援推斷（status_type 仍然空）
-        if not row_dict.get("status_type"):
-            s = row_dict.get("status","")
-            if "製作中" in s and "停工" not in s: row_dict["status_type"] = "in_progress"
-            elif "待交站" in s: row_dict["status_type"] = "pending"
-            elif "停工" in s:  row_dict["status_type"] = "suspended"
-            elif "已交站" in s or "交站" in s or row_dict.get("completion") == "100%": row_dict["status_type"] = "completed"
-            else: row_dict["status_type"] = "not_started"
-
-        # ── 自動計算完成率 ────────────────────────────────────
-        # 規則：依「目前已填的最高工序」決定完成率，刪除日期時同步降低
-        # 製造圖面(drawing) 不計入完成率
-
-        def filled(col): return bool(row_dict.get(col,"").strip())
-
-        # 由低到高依序評估，最後符合的工序決定基準完成率
-        # drawing 跳過，不影響百分比
-        auto_pct = 0   # 預設 0%，讓刪光所有工序可退回 0
-
-        if filled("pipe_support"):  auto_pct = 20
-        if filled("welding"):       auto_pct = 30
-        if filled("nde"):           auto_pct = 40
-        if filled("sandblast"):     auto_pct = 50
-
-        # 組立（60-80%）：填了就至少 60%，若手動在 60-80 之間則保留手動值
-        if filled("assembly"):
-            cur_pct_str = row_dict.get("completion","").replace("%","").strip()
-            try:   cur_pct = int(float(cur_pct_str))
-            except: cur_pct = 0
-            if 60 <= cur_pct <= 80:
-                auto_pct = cur_pct   # 保留手動值
-            else:
-                auto_pct = 60        # 至少跳到 60%
-
-        # 噴漆/試壓（85-90%）：填了就至少 85%，手動在 85-90 之間保留
-        if filled("painting") or filled("pressure_test"):
-            cur_pct_str = row_dict.get("completion","").replace("%","").strip()
-            try:   cur_pct = int(float(cur_pct_str))
-            except: cur_pct = 0
-            if 85 <= cur_pct <= 90:
-                auto_pct = cur_pct   # 保留手動值
-            else:
-                auto_pct = 85
+def submit_export(fmt: str, df: pd.DataFrame, hits: pd.DataFrame, sections: list,
+                  statuses, search: str, year: str) -> ExportJob:
+    """排入一件匯出；key 含資料版本與日期（標題日期、本週紅字都跟著日期變）"""
+    now = datetime.now()
+    key = (fmt, tuple(sections), tuple(sorted(statuses)), search, year,
+           frame_version(df), now.strftime("%Y%m%d"))
+    jobs = get_export_jobs()
+    job = jobs.get(key)
+    if job is not None and job.state != "failed":
+        return job
+
+    # 篩選在這裡做（有快取、很快），背景只負責產檔
+    sheets = [(sec, ds) for sec in sections
+              if not (ds := filter_rows(df, statuses, search, year, sec)).empty]
+    if fmt == "xlsx":
+        cols = [c for c in DISPLAY_COLS if c in df.columns]
+        def build(progress):
+            from pm.exports import build_xlsx   # 匯出引擎（openpyxl / fpdf2）只在背景產檔時才載入
+            return build_xlsx([(sec, ds, hits) for sec, ds in sheets], cols, progress)
+        fname = f"工程進度_{now.strftime('%Y%m%d')}.xlsx"
+    else:
+        note = ""
+        if statuses:
+            note += f"  狀態：{'、'.join(STATUS_CONFIG[k]['label'] for k in statuses if k in STATUS_CONFIG)}"
+        if year != "全部年份": note += f"  年份：{year}"
+        stamp, font_pref = now.strftime("%Y.%m.%d"), st.secrets.get("CJK_FONT")
+
+        def build(progress):
+            from pm.exports import render_pdf, PDF_LAYOUT
+            from pm.fonts import cjk_font_for
+            blocks = [pdf_section_block(f"【{sec}】  ({stamp})  共{len(ds)}筆{note}", ds, hits)
+                      for sec, ds in sheets]
+            # 字型子集只需要這次會印到的字
+            used = "".join(h for _, h, _ in PDF_LAYOUT) + "".join(
+                b["title"] + "".join("".join(v) for v in b["cells"].values()) for b in blocks)
+            font_path = cjk_font_for(used, font_pref)
+            if font_path is None:
+                raise RuntimeError("找不到中文字型：請安裝 fonts-noto-cjk，或把字型檔放進專案的 fonts/ 資料夾")
+            return render_pdf(blocks, font_path, progress)
+        fname = f"工程案執行進度_{now.strftime('%Y%m%d')}.pdf"
+    return jobs.submit(key, build, fname, EXPORT_MIME[fmt])
+
+def export_panel(polling: bool):
+    """顯示這個 session 要求過的匯出：進度條 / 下載鈕 / 錯誤；全部完成後整頁重跑一次以停止輪詢"""
+    jobs, keys = get_export_jobs(), st.session_state.get("export_keys", {})
+    still = False
+    for fmt, key in list(keys.items()):
+        job = jobs.get(key)
+        if job is None:           # 已被擠出快取
+            keys.pop(fmt, None); continue
+        label = EXPORT_LABEL[fmt]
+        if job.pending:
+            still = True
+            st.progress(job.fraction, text=f"{label} 產生中… {job.done}/{job.total or '?'} 列")
+        elif job.state == "failed":
+            st.error(f"{label} 匯出失敗：{job.error}")
+        else:
+            st.download_button(f"⬇ 下載 {label}", job.data, file_name=job.filename,
+                               mime=job.mime, key=f"dl_{fmt}")
+    if polling and not still:
+        st.rerun()
+
+# ── 工時分析 ──────────────────────────────────────────────
+# 工序流程可在 secrets 設定 PIPELINE_STAGES（依先後排列的工序欄，配對取相鄰兩站）；
+# 沒設定就從管撐製作開始、只算 CALC_PAIRS 這幾段
+PIPELINE = Pipeline.from_config(st.secrets.get("PIPELINE_STAGES"), dict(zip(PROCESS_COLS, PROCESS_NAMES)),
+                                PROCESS_COLS[1:], CALC_PAIRS)
+THROUGHPUT_WEEKS = 8
+
+def stage_table(df: pd.DataFrame) -> dict:
+    """
+    整張快照的工序日期 / 各段天數 / 目前所在站，每個資料版本只算一次；
+    各篩選條件的統計直接從這裡取列，不再重算
+    """
+    def _build():
+        dates = pd.DataFrame({c: df[dt_col(c)] for c in PROCESS_COLS if dt_col(c) in df.columns},
+                             index=df.index)
+        current = current_stage(PIPELINE, dates)
+        current[df["status_type"].astype(str) == "completed"] = ""   # 已交站的不算在製
+        return {"dates": dates, "seg": segment_days(dates, PIPELINE.segments), "current": current}
+    return cached_derived(("stages", frame_version(df)), _build)
+
+def duration_analysis(df: pd.DataFrame, table: dict) -> tuple:
+    """各工程站點天數 ＋ 平均 / 最快 / 最慢"""
+    status_zh = df["status_type"].astype(str).map(STATUS_KEY_TO_ZH)
+    days = duration_frame(df, table["seg"], status_zh)
+    return days, duration_summary(days)
+
+def pipeline_analysis(df: pd.DataFrame, table: dict) -> dict:
+    """各段 P50/P90/P99、每週各站產出、各站在製件數與瓶頸站"""
+    idx = df.index
+    throughput = weekly_throughput(PIPELINE, table["dates"].loc[idx], datetime.now(), THROUGHPUT_WEEKS)
+    wip = wip_counts(PIPELINE, table["current"].loc[idx])
+    bottleneck, wait = find_bottleneck(wip, throughput)
+    return {"pct": stage_percentiles(table["seg"].loc[idx]), "throughput": throughput,
+            "wip": wip, "wait": wait, "bottleneck": bottleneck}
+
+def section_status_counts(df: pd.DataFrame, where: dict) -> pd.DataFrame:
+    """
+    分區 × 狀態件數：本機副本已寫到同一版本就直接在 SQLite 做 group by，
+    否則（副本關閉 / 還在寫入）用記憶體裡的快照算，結果相同
+    """
+    store = get_store()
+    if store.replica is not None and store.replica.version == frame_version(df):
+        counts = store.replica.group_counts(["section", "status_type"], where)
+    else:
+        sub = df
+        for c, vals in where.items():
+            sub = sub[sub[c].fillna("").astype(str).isin([str(v) for v in vals])]
+        counts = (sub.assign(**{c: sub[c].fillna("").astype(str) for c in ("section", "status_type")})
+                  .groupby(["section", "status_type"]).size().rename("n").reset_index())
+    table = counts.pivot_table(index="section", columns="status_type", values="n", aggfunc="sum", fill_value=0)
+    table = table.rename(columns=STATUS_KEY_TO_ZH).rename_axis(index="分區", columns=None)
+    return table.reindex([s for s in SECTIONS if s in table.index] + [s for s in table.index if s not in SECTIONS])
+
+# ── 即時更新：只在目前篩選範圍內的列有變動時才重跑 ─────────
+LIVE_CHECK_SEC = 2
+
+def own_echoes(df: pd.DataFrame, changed: set) -> set:
+    """
+    changed 裡「整列仍是這個 session 自己寫出的內容」的 id（queue_writes 記在 _own_writes）：
+    自己存檔的樂觀修補、佇列送出後的回寫都會升版本，但畫面上早就是這些值，不必整頁重跑。
+    內容已被別人改掉的就不算，並從記錄移除。
+    """
+    own = st.session_state.get("_own_writes")
+    if not own or not changed: return set()
+    snap = df.drop_duplicates("id").set_index("id") if "id" in df.columns else pd.DataFrame()
+    echoes = set()
+    for rid in changed & own.keys():
+        mine = own[rid]
+        if mine is None:                      # 自己刪掉的列
+            same = rid not in snap.index
+        else:
+            row  = snap.loc[rid] if rid in snap.index else None
+            same = row is not None and all(str(row.get(k, "")) == ("" if v is None else str(v))
+                                           for k, v in mine.items())
+        if same:
+            echoes.add(rid)
+        else:
+            del own[rid]
+    return echoes
 
-        # 狀態為「待交站」→ 至少 95%
-        if row_dict.get("status_type") == "pending":
-            if auto_pct < 95:
-                auto_pct = 95
+def live_watch(seen: int, filter_key: tuple, visible_ids: frozenset):
+    """
+    比對共用快照版本（不連線）：有新版本時，變動的 id 落在畫面上的列、或符合目前篩選的新列 → 整頁重跑；
+    其餘變動（別的分區 / 篩選外、自己剛存的列）不打擾這個 session。
+    """
+    store = get_store()
+    if store.version == seen: return
+    changed = store.changed_since(seen)
+    if changed is not None:
+        changed -= own_echoes(store.df, changed)
+        if not changed: return
+    if changed is None or changed & visible_ids:
+        st.rerun()
+    statuses, search, year, section = filter_key
+    now_rows = filter_rows(store.df, statuses, search, year, section)
+    if "id" in now_rows.columns and changed & set(now_rows["id"]):
+        st.rerun()
+
+# ── 寫入（pm/editing.py）──────────────────────────────────
+@st.cache_resource
+def _save_rpc_state() -> dict:
+    # ok：save_projects RPC；client_id：新增用的 client_id 欄（None = 還沒試過；False = 資料庫沒有）
+    return {"ok": None, "client_id": None}
 
-        # 狀態為「已交站」→ 100%
-        if row_dict.get("status_type") == "completed":
-            auto_pct = 100
+# ── 寫入佇列：編輯先進本機佇列（pm/outbox.py）就返回，背景分批送出 ──
+@st.cache_resource
+def get_outbox() -> Outbox:
+    db, store, rpc_state = get_supabase(), get_store(), _save_rpc_state()
+    outbox = Outbox(lambda kind, payloads: send_ops(db, store, rpc_state, kind, payloads),
+                    transient=TRANSIENT_ERRORS + RETRY_ERRORS, on_drop=store.refetch)
+    store.refetch(outbox.failed_ids())   # 上次關掉前就失敗的修改：本機副本裡可能還是樂觀套用的值
+    return outbox.start()
+
+def typed_dates_enabled() -> bool:
+    """資料庫已有工序的 date 型別欄（見 README「工序日期欄」）→ 寫入時文字欄與 date 欄一起更新"""
+    return DATE_COLS[0] in get_store().df.columns
+
+def queue_writes(updates: list, inserts: list, deletes: list, bases: dict = None) -> int:
+    """
+    參數格式同 write_batch。寫進佇列立即返回；更新 / 刪除先直接套用到共用快照，畫面馬上看得到
+    （新增的列要等送出、拿到 id 才會出現）。衝突之後由 conflict_panel 顯示；
+    最後沒寫入的（失敗 / 被放棄）由佇列通知快照重抓那幾筆（store.refetch），換回資料庫的內容。
+    """
+    outbox, owner = get_outbox(), outbox_owner()
+    if typed_dates_enabled():
+        updates = [(label, with_typed_dates(row)) for label, row in updates]
+        inserts = [(label, with_typed_dates(row)) for label, row in inserts]
+    for label, row in updates:
+        outbox.enqueue("update", row, label, owner, (bases or {}).get(str(row["id"])))
+    for label, row in inserts:
+        outbox.enqueue("insert", {**row, INSERT_KEY: str(uuid.uuid4())}, label, owner)   # 重送不會重複新增
+    for label, rid in deletes:
+        outbox.enqueue("delete", {"id": rid}, label, owner)
+    store = get_store()
+    # 記下自己寫出的整列：快照因此升版本（修補、送出後回寫）時 live_watch 認得出來，不會整頁重跑
+    own = st.session_state.setdefault("_own_writes", {})
+    if updates and not store.df.empty:
+        snap = store.df.set_index("id")
+        local = [{**{k: v for k, v in snap.loc[str(r["id"])].items() if not str(k).startswith("_")},
+                  "id": r["id"], **{k: v for k, v in r.items() if k != "_expected"}}
+                 for _, r in updates if str(r["id"]) in snap.index]
+        for row in local:
+            own[str(row["id"])] = {k: v for k, v in row.items()
+                                   if k not in ("id", "updated_at") and k not in DATE_COLS}
+        store.apply_saved(local, source="patch")
+    for _, rid in deletes:
+        own[str(rid)] = None
+    if deletes:
+        store.apply_saved([], [rid for _, rid in deletes], source="patch")
+    return len(updates) + len(inserts) + len(deletes)
+
+def record_conflicts(conflicts: list, bases: dict = None):
+    """衝突交給合併畫面（session 內保存，解決前一直顯示）"""
+    pending = st.session_state.setdefault("save_conflicts", {})
+    for label, mine, theirs in conflicts:
+        rid  = str(mine["id"])
+        cols = [k for k in mine if k not in ("id", "_expected") and k not in DATE_COLS]   # date 欄跟著文字欄重算
+        title = f"{theirs.get('case_no') or ''} {theirs.get('project_name') or ''}".strip() if theirs else ""
+        pending[rid] = {
+            "label": title or f"id {rid}", "mine": {k: mine[k] for k in cols},
+            "base":  {k: (bases or {}).get(rid, {}).get(k, "") for k in cols},
+            "theirs": None if theirs is None else {k: "" if theirs.get(k) is None else str(theirs.get(k))
+                                                    for k in cols},
+            "theirs_version": None if theirs is None else theirs.get("updated_at"),
+        }
 
-        # 直接覆蓋（刪除日期時也會往下調整）
-        row_dict["completion"] = f"{auto_pct}%" if auto_pct > 0 else ""
+def conflict_panel():
+    """別人先改過同一筆：逐欄列出 原本 / 我的 / 目前資料庫，選擇以我的為準或放棄"""
+    for label, mine, base, theirs in get_outbox().take_conflicts(outbox_owner()):
+        record_conflicts([(label, mine, theirs)], {str(mine["id"]): base})
+    pending = st.session_state.get("save_conflicts") or {}
+    for rid, c in list(pending.items()):
+        with st.container(border=True):
+            if c["theirs"] is None:
+                st.error(f"⚠️ {c['label']}：這筆已被其他人刪除，你的修改沒有存入")
+                if st.button("知道了", key=f"cf_drop_{rid}"):
+                    pending.pop(rid); st.rerun()
+                continue
+            st.warning(f"⚠️ {c['label']}：其他人在你編輯期間改過這筆，你的修改尚未存入")
+            st.dataframe(pd.DataFrame({
+                "欄位": [COL_DISPLAY_NAMES.get(k, k) for k in c["mine"]],
+                "原本": list(c["base"].values()),
+                "我的修改": list(c["mine"].values()),
+                "目前資料庫": list(c["theirs"].values()),
+            }), hide_index=True, use_container_width=True)
+            b1, b2 = st.columns(2)
+            if b1.button("💾 以我的修改為準", key=f"cf_mine_{rid}", type="primary"):
+                row = {"id": int(rid), **c["mine"], "_expected": c["theirs_version"]}
+                pending.pop(rid)
+                queue_writes([(c["label"], row)], [], [], {rid: c["base"]})
+                st.rerun()
+            if b2.button("↩ 保留資料庫的內容", key=f"cf_theirs_{rid}"):
+                pending.pop(rid); st.rerun()
 
-        return row_dict
+# ── 完成率重算（維護用）──────────────────────────────────
+def pending_completion_changes(df: pd.DataFrame) -> pd.DataFrame:
+    """完成率與規則不一致的列（依資料版本快取）"""
+    return cached_derived(("completion_changes", frame_version(df)), lambda: completion_changes(df))
 
-    # 1. 修改的列
-    for row_idx, changes in editor_state.get("edited_rows", {}).items():
-        try:
-            idx = int(row_idx)
-            if idx >= len(original_df): continue
-            base       = original_df.iloc[idx]
-            record_id  = clean_val(base.get("id",""))   # ← 直接從原始列取 id
-            if not record_id or record_id in ("","None"): continue
-            row_dict = build_row_dict(base, changes)
-            supabase.table("projects").update(row_dict).eq("id", record_id).execute()
-            saved += 1
-        except Exception as e:
-            st.toast(f"⚠️ 更新失敗 row {row_idx}：{e}", icon="❌")
-
-    # 2. 新增的列
-    for new_row in editor_state.get("added_rows", []):
-        try:
-            empty    = pd.Series({c: "" for c in original_df.columns})
-            row_dict = build_row_dict(empty, new_row)
-            row_dict.pop("id", None)
-            supabase.table("projects").insert(row_dict).execute()
-            saved += 1
-        except Exception as e:
-            st.toast(f"⚠️ 新增失敗：{e}", icon="❌")
-
-    # 3. 刪除列（勾選🗑後由編輯區按鈕處理，這裡處理 data_editor 內建刪除）
-    for row_idx in editor_state.get("deleted_rows", []):
-        try:
-            idx       = int(row_idx)
-            record_id = clean_val(original_df.iloc[idx].get("id","")) if idx < len(original_df) else ""
-            if record_id and record_id not in ("","None"):
-                supabase.table("projects").delete().eq("id", record_id).execute()
-                saved += 1
-        except Exception as e:
-            st.toast(f"⚠️ 刪除失敗 row {row_idx}：{e}", icon="❌")
+def recompute_completion(df: pd.DataFrame, progress=None) -> tuple:
+    """
+    只寫回完成率有變的列，每批 PAGE_SIZE 筆一次送出；回傳 (成功筆數, [(說明, 錯誤)])
+    只改完成率的更新不會動到 updated_at（README 的 set_updated_at），開著的編輯不會因此變成衝突
+    """
+    changes = pending_completion_changes(df)
+    saved, failures = 0, []
+    for i in range(0, len(changes), PAGE_SIZE):
+        batch = changes.iloc[i:i + PAGE_SIZE]
+        # 帶版本：重算期間被別人改過的列略過（下次重算再處理）
+        n, f, _ = write_batch(supabase, get_store(), _save_rpc_state(), [(f"完成率更新失敗 id {rid}", {"id": int(rid), "completion": new, "_expected": exp})
+                               for rid, new, exp in zip(batch["id"], batch["new"], batch["expected"])], [], [])
+        saved, failures = saved + n, failures + f
+        if progress: progress(min(i + PAGE_SIZE, len(changes)), len(changes))
+    return saved, failures
+
+# ── 自動儲存函式 ──────────────────────────────────────────
+def do_save(sec: str, original_df: pd.DataFrame, editor_state) -> int:
+    """data_editor 的變動（格式見 pm/editing.editor_changes）→ 寫入佇列；回傳排入的筆數"""
+    if not isinstance(editor_state, dict):
+        return 0
+    updates, inserts, deletes, bases, errors = editor_changes(sec, original_df, editor_state)
+    for label, e in errors:
+        st.toast(f"⚠️ {label}：{e}", icon="❌")
+    # 進本機佇列就算存好；送出失敗會重試，衝突會出現在上方的合併區
+    return queue_writes(updates, inserts, deletes, bases)
+
+# ── 分區編輯區（打開「✏️ 編輯」才建立）──────────────────
+def rerun_section():
+    """只重跑目前這個分區的 fragment；不是 fragment 重跑（例如整頁執行中）就整頁重跑"""
+    try:
+        st.rerun(scope="fragment")
+    except StreamlitAPIException:
+        st.rerun()
+
+def editor_frame(df_sec: pd.DataFrame, sec: str, filter_key: tuple) -> pd.DataFrame:
+    """data_editor 用的資料（工序日期轉成 date 物件）；依（資料版本, 分區, 篩選條件）快取"""
+    def _build():
+        show_cols = [c for c in DISPLAY_COLS if c in df_sec.columns]
+        edit_df = df_sec[[c for c in show_cols + ["status_type","id","updated_at"] if c in df_sec.columns]].copy()
+        # 分類欄轉回一般字串，data_editor 才能自由輸入 / 下拉
+        edit_df = edit_df.astype({c: str for c in CATEGORY_COLS if c in edit_df.columns})
+        edit_df["status_zh"] = edit_df["status_type"].map(STATUS_KEY_TO_ZH).fillna("")
+        edit_df.insert(0, "🗑 刪除", False)   # 勾選欄放最前面
+
+        # ── 已解析的工序日期 → Python date 物件（DateColumn 需要）──
+        for _dc in PROCESS_COLS:
+            if _dc in edit_df.columns:
+                _dts = df_sec[dt_col(_dc)]
+                edit_df[_dc] = _dts.dt.date.astype(object).where(_dts.notna(), None)
+        return edit_df
+    return cached_derived(("editor", frame_version(df_sec), sec, filter_key), _build)
+
+def section_editor(sec: str, df_sec: pd.DataFrame, filter_key: tuple):
+    """上半單筆快速編輯 ＋ 下半大量編輯表格；在 section_block 的 fragment 裡執行，儲存後只重跑這個分區"""
+    # ── 上：單筆快速編輯 ──
+    st.markdown("**🔍 單筆快速編輯**")
+    if not df_sec.empty:
+        options = (df_sec["case_no"].astype(str) + " | " + df_sec["project_name"].astype(str)).tolist()
+        chosen  = st.selectbox("選擇工程案", options, key=f"qe_sel_{sec}", label_visibility="collapsed")
+        chosen_idx = options.index(chosen)
+        qrow = df_sec.iloc[chosen_idx]
+
+        with st.form(key=f"qe_form_{sec}"):
+            qc1, qc2, qc3 = st.columns(3)
+            with qc1:
+                q_case_no      = st.text_input("案號",     value=str(qrow.get("case_no","")))
+                q_project_name = st.text_input("工程名稱", value=str(qrow.get("project_name","")))
+                q_client       = st.text_input("業主",     value=str(qrow.get("client","")))
+                q_contact      = st.text_input("對應窗口", value=str(qrow.get("contact","")))
+                q_status       = st.text_input("施工順序", value=str(qrow.get("status","")))
+                q_completion   = st.text_input("完成率",   value=str(qrow.get("completion","")))
+                q_materials    = st.text_input("備料",     value=str(qrow.get("materials","")))
+                q_tracking     = st.text_area("備註",      value=str(qrow.get("tracking","")), height=80)
+            with qc2:
+                q_status_zh = st.selectbox("狀態", STATUS_ZH_OPTIONS,
+                    index=STATUS_ZH_OPTIONS.index(STATUS_KEY_TO_ZH.get(str(qrow.get("status_type","")),"")))
+                q_drawing       = st.text_input("製造圖面", value=str(qrow.get("drawing","")))
+                q_pipe_support  = st.text_input("管撐製作", value=str(qrow.get("pipe_support","")))
+                q_welding       = st.text_input("點焊",     value=str(qrow.get("welding","")))
+                q_nde           = st.text_input("焊道NDE",  value=str(qrow.get("nde","")))
+            with qc3:
+                q_sandblast     = st.text_input("噴砂",     value=str(qrow.get("sandblast","")))
+                q_assembly      = st.text_input("組立",     value=str(qrow.get("assembly","")))
+                q_painting      = st.text_input("噴漆",     value=str(qrow.get("painting","")))
+                q_pressure_test = st.text_input("試壓",     value=str(qrow.get("pressure_test","")))
+                q_handover      = st.text_input("交站",     value=str(qrow.get("handover","")))
+                q_handover_year = st.selectbox("交站年份",  ["","114","115","116"],
+                    index=["","114","115","116"].index(str(qrow.get("handover_year","")) if str(qrow.get("handover_year","")) in ["","114","115","116"] else ""))
+
+            if st.form_submit_button("💾 儲存此筆", type="primary", use_container_width=True):
+                rid = str(qrow.get("id",""))
+                new_st = STATUS_ZH_TO_KEY.get(q_status_zh, "not_started")
+                upd = {
+                    "case_no":q_case_no,"project_name":q_project_name,"client":q_client,
+                    "contact":q_contact,"status":q_status,"completion":q_completion,
+                    "materials":q_materials,"tracking":q_tracking,"status_type":new_st,
+                    "drawing":q_drawing,"pipe_support":q_pipe_support,"welding":q_welding,
+                    "nde":q_nde,"sandblast":q_sandblast,"assembly":q_assembly,
+                    "painting":q_painting,"pressure_test":q_pressure_test,
+                    "handover":q_handover,"handover_year":q_handover_year,
+                }
+                # 只送有改的欄位，並檢查這筆在開啟表單後有沒有被別人改過
+                diff = {k: v for k, v in upd.items() if v != str(qrow.get(k, ""))}
+                if not diff:
+                    st.info("沒有變更")
+                else:
+                    _row = {"id": int(rid), **diff, "_expected": str(qrow.get("updated_at", ""))}
+                    queue_writes([(f"儲存失敗「{q_project_name}」", _row)], [], [],
+                                 {rid: {k: str(qrow.get(k, "")) for k in diff}})
+                    st.success(f"✅ 已儲存「{q_project_name}」！")
+                    rerun_section()
 
-    return saved
+    st.divider()
+    st.markdown("**📋 大量編輯（改完自動儲存）**")
+
+    # 已轉好日期的編輯用資料（唯讀共用：data_editor 不會改到傳入的 DataFrame）
+    edit_df = original_df = editor_frame(df_sec, sec, filter_key)
+    edit_key    = f"edit_{sec}"
+
+    def auto_save_callback(sec=sec, original_df=original_df):
+        state = st.session_state.get(f"edit_{sec}")
+        if state is None: return
+        # ✅ 若本次變動只有勾選「🗑 刪除」欄，跳過自動儲存
+        # 讓刪除按鈕有機會顯示出來
+        edited_rows = state.get("edited_rows", {})
+        only_delete_checked = all(
+            set(changes.keys()) == {"🗑 刪除"}
+            for changes in edited_rows.values()
+        ) if edited_rows else False
+        if only_delete_checked:
+            return   # 不儲存，不重整，讓按鈕正常顯示
+        saved = do_save(sec, original_df, state)
+        if saved > 0:
+            st.toast(f"✅ 自動儲存 {saved} 筆！", icon="💾")
+
+    edited = st.data_editor(
+        edit_df,
+        key=edit_key,
+        on_change=auto_save_callback,
+        column_config={
+            **{k:v for k,v in editor_column_config().items()
+               if k in edit_df.columns or k == "status_zh"},
+            "🗑 刪除": st.column_config.CheckboxColumn(
+                "🗑 刪除", help="勾選後按下方確認刪除", width="small"),
+        },
+        use_container_width=True,
+        num_rows="dynamic",
+        hide_index=True,
+        column_order=["🗑 刪除","status_zh","status","completion","materials",
+                      "case_no","project_name","client","tracking","drawing",
+                      "pipe_support","welding","nde","sandblast","assembly",
+                      "painting","pressure_test","handover","handover_year","contact"],
+    )
+
+    # 勾選刪除按鈕
+    del_rows = edited[edited["🗑 刪除"] == True]
+    if not del_rows.empty:
+        st.warning(f"⚠️ 已勾選 {len(del_rows)} 列，按下方按鈕確認刪除")
+        if st.button(f"🗑 確認刪除 {len(del_rows)} 列",
+                     key=f"del_btn_{sec}", type="primary"):
+            deletes = [(f"刪除失敗 {row.get('case_no','')}", int(rid))
+                       for rid, row in zip(del_rows["id"].astype(str), del_rows.to_dict("records"))
+                       if rid and rid not in ("","None")]
+            deleted = queue_writes([], [], deletes)
+            st.success(f"✅ 已刪除 {deleted} 列")
+            rerun_section()
+    else:
+        st.caption("💡 修改後點擊其他地方自動儲存 ／ 末列空白列可新增 ／ 勾選🗑可刪除整列")
+
+# ── 分區區塊：每個分區各自是一個 fragment ─────────────────
+# 翻頁、打開編輯區、儲存都只重跑這個分區；篩選條件由整頁執行時傳入
+@st.fragment
+def section_block(sec: str, statuses: tuple, search: str, filter_year: str, skip_empty: bool):
+    df_all = load_data()
+    WEEK   = week_index(df_all)
+    filter_key = (statuses, search, filter_year, sec)
+    df_sec = filter_rows(df_all, statuses, search, filter_year, sec)
+    if df_sec.empty and skip_empty: return
+
+    badges = ""
+    if not df_sec.empty:
+        if search.strip():
+            badges = section_badges_html(df_sec["status_type"].astype(str).value_counts(),
+                                         int(WEEK["updated"].loc[df_sec.index].sum()))
+        else:   # 沒有關鍵字：狀態 / 年份都是件數表的分組欄，直接查表
+            badges = section_badges_html(*section_summary(summary_counts(df_all), sec, statuses, filter_year))
+
+    st.markdown(f'<div class="section-header">【{sec}】 共 {len(df_sec)} 筆 {badges}</div>',
+                unsafe_allow_html=True)
+    if df_sec.empty:
+        st.caption("此分區目前沒有資料"); return
+
+    # ── HTML 表格：完全鎖死排序，顏色/紅字完整保留；筆數多時分頁 ──
+    n_pages = (len(df_sec) - 1) // TABLE_PAGE_ROWS + 1
+    page = 0
+    if n_pages > 1:
+        page = st.selectbox(
+            f"【{sec}】頁次", range(n_pages), key=f"tbl_page_{sec}", label_visibility="collapsed",
+            format_func=lambda p, n=len(df_sec), m=n_pages:
+                f"第 {p+1} / {m} 頁（{p*TABLE_PAGE_ROWS+1}–{min((p+1)*TABLE_PAGE_ROWS, n)} / {n} 筆）")
+    st.markdown(section_table_html(df_sec, sec, filter_key, WEEK["hits"], page), unsafe_allow_html=True)
+
+    # ── 編輯區：用開關而不是 st.expander（expander 收合時內容照樣會跑）──
+    if st.toggle(f"✏️ 編輯【{sec}】", key=f"edit_open_{sec}"):
+        with st.container(border=True):
+            section_editor(sec, df_sec, filter_key)
 
 # ── 標題 ──────────────────────────────────────────────────
 today = datetime.now().strftime("%Y.%m.%d")
+_ob = get_outbox().counts()
+_ob_note = "".join([f" ／ ⏳ 待上傳 {_ob['pending']} 筆" if _ob["pending"] else "",
+                    f" ／ <span style='color:#ff8a80'>⚠️ 上傳失敗 {_ob['failed']} 筆</span>" if _ob["failed"] else ""])
 st.markdown(f"""
 <div style="background:linear-gradient(135deg,#0a1929,#0d47a1);
   padding:14px 20px;border-radius:8px;margin-bottom:12px;">
   <div style="color:#fff;font-size:20px;font-weight:900;letter-spacing:2px;">⚙ 工程案執行進度管理系統</div>
   <div style="color:#90caf9;font-size:12px;margin-top:3px;">
-    更新日期：{today} ／ Supabase 雲端資料庫 ／ 多人共用
+    更新日期：{today} ／ Supabase 雲端資料庫 ／ 多人共用{_ob_note}
   </div>
 </div>
 """, unsafe_allow_html=True)
 
-df_all = load_data()
-
-if not df_all.empty:
-    cts = df_all["status_type"].value_counts()
-    kpi_items = [
-        ("📋 全部",      len(df_all)),
-        ("⚙ 製作中",    int(cts.get("in_progress",0))),
-        ("📦 待交站",   int(cts.get("pending",0))),
-        ("⏳ 未開始",   int(cts.get("not_started",0))),
-        ("⏸ 停工",     int(cts.get("suspended",0))),
-        ("✅ 已完成",   int(cts.get("completed",0))),
-    ]
-    cards_html = "<div class='kpi-grid'>"
-    for label, val in kpi_items:
-        cards_html += f"""<div class='kpi-card'>
-          <div class='kpi-label'>{label}</div>
-          <div class='kpi-value'>{val}</div>
-        </div>"""
-    cards_html += "</div>"
-    st.markdown(cards_html, unsafe_allow_html=True)
+# 新 session：UI 狀態與資料同時在背景讀取，不必等 user_prefs 回應才開始載入
+if "ui_loaded" not in st.session_state and "_ui_prefetch" not in st.session_state:
+    st.session_state["_ui_prefetch"] = get_ui_prefs().prefetch(ui_user_key())
+
+# 統計卡與狀態按鈕只需要件數表：快照已在記憶體就照常同步後由快照算；
+# 冷啟動先向資料庫要彙總，標題與按鈕先畫出來，整張表到下面真的要顯示時才下載
+summary = summary_counts(load_data()) if not get_store().df.empty else summary_counts()
+if summary is None:
+    summary = summary_counts(load_data())
+status_counts = status_totals(summary)
+
+if len(summary):
+    st.markdown(kpi_cards_html(status_counts, int(summary["n"].sum())), unsafe_allow_html=True)
 
 st.divider()
-page_tab1, page_tab2 = st.tabs(["📋 進度管理", "📊 工時分析"])
+# 兩頁用選單切換（不用 st.tabs）：st.tabs 每次都會把兩頁都跑一遍，這樣只跑目前這一頁
+PAGES = ["📋 進度管理", "📊 工時分析"]
+current_page = st.radio("頁面", PAGES, horizontal=True, key="page", label_visibility="collapsed")
 
 # ═══════════════════════════════════════════════════════
 # PAGE 1：進度管理
 # ═══════════════════════════════════════════════════════
-with page_tab1:
-
+def progress_page():
     # 第一次載入：從 Supabase 還原上次的篩選狀態
     if "ui_loaded" not in st.session_state:
         _saved = load_ui_state()
@@ -432,6 +852,9 @@ with page_tab1:
     if "active_status" not in st.session_state:
         st.session_state.active_status = set()
 
+    # 儲存衝突：其他人先改過同一筆時，在這裡合併
+    conflict_panel()
+
     st.markdown("**狀態篩選**（可多選）")
     # 手機：3欄 2行；桌機：6欄 1行
     btn_row1 = st.columns(3)
@@ -448,7 +871,7 @@ with page_tab1:
             st.rerun()
     for i,(key,cfg) in enumerate(STATUS_CONFIG.items()):
         active = key in st.session_state.active_status
-        count  = int(df_all["status_type"].value_counts().get(key,0)) if not df_all.empty else 0
+        count  = int(status_counts.get(key, 0))
         with all_btns[i+1]:
             if st.button(f"{cfg['icon']} {cfg['label']} ({count})" + (" ✓" if active else ""),
                          use_container_width=True,
@@ -477,6 +900,9 @@ with page_tab1:
         save_ui_state(_cur_ui)
         st.session_state["_last_ui"] = _cur_ui
 
+    df_all = load_data()
+    WEEK   = week_index(df_all)
+
     st.markdown("""
     <div class="legend-bar">
       <strong>顏色：</strong>
@@ -486,311 +912,30 @@ with page_tab1:
       <span><span class="color-box" style="background:#FFE0B2"></span> 停工</span>
       <span><span class="color-box" style="background:#F0F0F0"></span> 已完成</span>
       <span style="color:#c62828;font-weight:900">🔴 本週日期</span>
-      <span style="margin-left:auto;color:#999;font-size:11px;">★ 展開「✏️ 編輯」→ 改完即自動儲存</span>
+      <span style="margin-left:auto;color:#999;font-size:11px;">★ 打開「✏️ 編輯」→ 改完即自動儲存</span>
     </div>
     """, unsafe_allow_html=True)
 
-    df = df_all.copy() if not df_all.empty else pd.DataFrame()
-    if not df.empty:
-        if st.session_state.active_status:
-            df = df[df["status_type"].isin(st.session_state.active_status)]
-        if search:
-            mask = (df["project_name"].str.contains(search,na=False) |
-                    df["case_no"].str.contains(search,na=False) |
-                    df["client"].str.contains(search,na=False) |
-                    df["contact"].str.contains(search,na=False))
-            df = df[mask]
-        if filter_year != "全部年份":
-            df = df[df["handover_year"]==""] if filter_year=="未填年份" else df[df["handover_year"]==filter_year]
-        if filter_section != "全部分區":
-            df = df[df["section"]==filter_section]
-
-    st.caption(f"顯示 **{len(df)}** / {len(df_all)} 筆")
-
-    # 日期欄若含本週日期 → 紅字加粗（逐欄 applymap）
-    DATE_COLS = {"drawing","pipe_support","welding","nde","sandblast",
-                 "assembly","painting","pressure_test","handover","tracking",
-                 "materials","contact","status","completion"}
-
-    def color_rows(row):
-        """整列底色 = 狀態顏色"""
-        bg = STATUS_CONFIG.get(row.get("status_type",""),{}).get("bg","#FFFFFF")
-        return [f"background-color:{bg}" for _ in row]
-
-    def cell_has_week_date(val: str) -> bool:
-        """格子內容是否含本週日期（支援 2/1、2/26、2026-02-26 等格式）"""
-        import re as _re
-        val = str(val)
-        # 找出所有 M/D 或 YYYY-MM-DD 片段
-        hits = _re.findall(r"(?<![\d])(\d{1,2}/\d{1,2})(?![\d])", val)
-        hits += _re.findall(r"(\d{4}-\d{2}-\d{2})", val)
-        for raw in hits:
-            if is_this_week_str(raw):
-                return True
-        return False
-
-    def highlight_col(col):
-        """逐欄呼叫：是日期欄才檢查，其他欄直接回傳空字串"""
-        if col.name not in DATE_COLS:
-            return [""] * len(col)
-        return [
-            "color:#c62828;font-weight:900" if cell_has_week_date(v) else ""
-            for v in col
-        ]
+    df = filter_rows(df_all, st.session_state.active_status, search, filter_year, filter_section)
+
+    _ls = df_all.attrs.get("load_stats", {})
+    _load_note = f"（載入 {_ls['rows']} 筆 · {_ls['pages']} 頁 · {_ls['seconds']} 秒）" if _ls else ""
+    if _ls and _ls["rows"] < _ls["total"]:
+        _load_note += f" ⚠️ 資料庫共 {_ls['total']} 筆，載入不完整，請重新整理"
+    _sync = get_store().last_sync
+    if _sync.get("kind") == "delta":
+        _load_note += f"（增量同步 {_sync['rows']} 筆變動 · {_sync['removed']} 筆刪除 · {_sync['seconds']} 秒）"
+    elif _sync.get("kind") == "replica":
+        _load_note += f"（本機副本 {_sync['rows']} 筆 · {_sync['seconds']} 秒，背景與資料庫對帳中）"
+    elif _sync.get("kind") == "error":
+        _load_note += " ⚠️ 同步失敗，顯示的是上次的資料"
+    st.caption(f"顯示 **{len(df)}** / {len(df_all)} 筆 {_load_note}")
+    # 目前篩選條件（表格 HTML 等衍生快取的 key）
+    FILTER_KEY = (tuple(sorted(st.session_state.active_status)), search, filter_year, filter_section)
 
     sections_to_show = SECTIONS if filter_section=="全部分區" else [filter_section]
-
     for sec in sections_to_show:
-        df_sec = df[df["section"]==sec].copy() if not df.empty else pd.DataFrame()
-        if df_sec.empty and filter_section=="全部分區": continue
-
-        badges = ""
-        if not df_sec.empty:
-            cts2 = df_sec["status_type"].value_counts()
-            for k,cfg in STATUS_CONFIG.items():
-                n = int(cts2.get(k,0))
-                if n:
-                    badges += (f'<span style="background:{cfg["btn"]};color:{cfg["text"]};'
-                               f'border-radius:10px;padding:1px 9px;font-size:11px;'
-                               f'margin-left:6px;font-weight:700;">{cfg["label"]} {n}</span>')
-            # 本週更新數量
-            if "updated_at" in df_sec.columns:
-                nw = int(df_sec["updated_at"].apply(lambda x: is_this_week(str(x))).sum())
-                if nw:
-                    badges += (f'<span style="background:#e53935;color:#fff;border-radius:10px;'
-                               f'padding:1px 9px;font-size:11px;margin-left:6px;font-weight:700;">'
-                               f'🔴 本週更新 {nw}</span>')
-
-        st.markdown(f'<div class="section-header">【{sec}】 共 {len(df_sec)} 筆 {badges}</div>',
-                    unsafe_allow_html=True)
-        if df_sec.empty:
-            st.caption("此分區目前沒有資料"); continue
-
-        # ── 唯讀顯示（有顏色）──────────────────────────────
-        show_cols = [c for c in DISPLAY_COLS if c in df_sec.columns and c != "_order"]
-        show_df   = df_sec[show_cols].copy()
-
-        # 加入 updated_at / status_type 讓 color_rows 能讀到
-        styled_df = show_df.copy()
-        for extra in ["status_type","updated_at"]:
-            if extra in df_sec.columns and extra not in styled_df.columns:
-                styled_df[extra] = df_sec[extra].values
-
-        # ── HTML 表格：完全鎖死排序，顏色/紅字完整保留 ──
-        import re as _re2
-        COL_DISPLAY_NAMES = {
-            "status":"施工順序","completion":"完成率","materials":"備料",
-            "case_no":"案號","project_name":"工程名稱","client":"業主",
-            "tracking":"備註","drawing":"製造圖面","pipe_support":"管撐製作",
-            "welding":"點焊","nde":"焊道NDE","sandblast":"噴砂",
-            "assembly":"組立*","painting":"噴漆","pressure_test":"試壓",
-            "handover":"交站","handover_year":"年份","contact":"對應窗口",
-        }
-        disp_cols = [c for c in DISPLAY_COLS if c in df_sec.columns]
-
-        # 表頭
-        th_html = "".join(
-            f'<th style="background:#1a3a5c;color:#fff;padding:6px 8px;'
-            f'white-space:nowrap;font-size:12px;border:1px solid #2a5080;">'
-            f'{COL_DISPLAY_NAMES.get(c,c)}</th>'
-            for c in disp_cols
-        )
-        # 表身
-        rows_html = ""
-        for _, row in df_sec.iterrows():
-            st_key = str(row.get("status_type",""))
-            bg = STATUS_CONFIG.get(st_key,{}).get("bg","#ffffff")
-            upd = str(row.get("updated_at",""))
-            cells = ""
-            _HTML_DATE_COLS = {"drawing","pipe_support","welding","nde","sandblast",
-                               "assembly","painting","pressure_test","handover"}
-            for c in disp_cols:
-                val = str(row.get(c,""))
-                # ── 日期欄：YYYY/MM/DD → 短日期 M/D 顯示 ──
-                if c in _HTML_DATE_COLS:
-                    m_long = _re2.search(r"\d{4}/(\d{1,2})/(\d{1,2})", val)
-                    if m_long:
-                        val = f"{int(m_long.group(1))}/{int(m_long.group(2))}"
-                # 偵測本週日期 → 紅字
-                date_hits = _re2.findall(
-                    r"(?<!\d)(\d{1,2}/\d{1,2})(?!\d)|(\d{4}-\d{2}-\d{2})", val)
-                cell_style = f"background:{bg};padding:5px 7px;font-size:12px;border:1px solid #ddd;white-space:nowrap;color:#111;"
-                cell_val = val
-                for grp in date_hits:
-                    raw = grp[0] or grp[1]
-                    if is_this_week_str(raw):
-                        cell_val = val.replace(
-                            raw,
-                            f'<span style="color:#c62828;font-weight:900">{raw}</span>')
-                        break
-                cells += f'<td style="{cell_style}">{cell_val}</td>'
-            rows_html += f"<tr>{cells}</tr>"
-
-        table_html = f"""
-        <div style="overflow-x:auto;max-height:420px;overflow-y:auto;">
-        <table style="border-collapse:collapse;width:100%;font-family:sans-serif;">
-          <thead><tr>{th_html}</tr></thead>
-          <tbody>{rows_html}</tbody>
-        </table></div>"""
-        st.markdown(table_html, unsafe_allow_html=True)
-
-        # ── 合併編輯區：上半單筆快速編輯 ＋ 下半大量編輯表格 ──
-        with st.expander(f"✏️ 編輯【{sec}】"):
-            # ── 上：單筆快速編輯 ──
-            st.markdown("**🔍 單筆快速編輯**")
-            if not df_sec.empty:
-                options = [f"{r['case_no']} | {r['project_name']}" for _, r in df_sec.iterrows()]
-                chosen  = st.selectbox("選擇工程案", options, key=f"qe_sel_{sec}", label_visibility="collapsed")
-                chosen_idx = options.index(chosen)
-                qrow = df_sec.iloc[chosen_idx]
-
-                with st.form(key=f"qe_form_{sec}"):
-                    qc1, qc2, qc3 = st.columns(3)
-                    with qc1:
-                        q_case_no      = st.text_input("案號",     value=str(qrow.get("case_no","")))
-                        q_project_name = st.text_input("工程名稱", value=str(qrow.get("project_name","")))
-                        q_client       = st.text_input("業主",     value=str(qrow.get("client","")))
-                        q_contact      = st.text_input("對應窗口", value=str(qrow.get("contact","")))
-                        q_status       = st.text_input("施工順序", value=str(qrow.get("status","")))
-                        q_completion   = st.text_input("完成率",   value=str(qrow.get("completion","")))
-                        q_materials    = st.text_input("備料",     value=str(qrow.get("materials","")))
-                        q_tracking     = st.text_area("備註",      value=str(qrow.get("tracking","")), height=80)
-                    with qc2:
-                        q_status_zh = st.selectbox("狀態", STATUS_ZH_OPTIONS,
-                            index=STATUS_ZH_OPTIONS.index(STATUS_KEY_TO_ZH.get(str(qrow.get("status_type","")),"")))
-                        q_drawing       = st.text_input("製造圖面", value=str(qrow.get("drawing","")))
-                        q_pipe_support  = st.text_input("管撐製作", value=str(qrow.get("pipe_support","")))
-                        q_welding       = st.text_input("點焊",     value=str(qrow.get("welding","")))
-                        q_nde           = st.text_input("焊道NDE",  value=str(qrow.get("nde","")))
-                    with qc3:
-                        q_sandblast     = st.text_input("噴砂",     value=str(qrow.get("sandblast","")))
-                        q_assembly      = st.text_input("組立",     value=str(qrow.get("assembly","")))
-                        q_painting      = st.text_input("噴漆",     value=str(qrow.get("painting","")))
-                        q_pressure_test = st.text_input("試壓",     value=str(qrow.get("pressure_test","")))
-                        q_handover      = st.text_input("交站",     value=str(qrow.get("handover","")))
-                        q_handover_year = st.selectbox("交站年份",  ["","114","115","116"],
-                            index=["","114","115","116"].index(str(qrow.get("handover_year","")) if str(qrow.get("handover_year","")) in ["","114","115","116"] else ""))
-
-                    if st.form_submit_button("💾 儲存此筆", type="primary", use_container_width=True):
-                        rid = str(qrow.get("id",""))
-                        new_st = STATUS_ZH_TO_KEY.get(q_status_zh, "not_started")
-                        upd = {
-                            "case_no":q_case_no,"project_name":q_project_name,"client":q_client,
-                            "contact":q_contact,"status":q_status,"completion":q_completion,
-                            "materials":q_materials,"tracking":q_tracking,"status_type":new_st,
-                            "drawing":q_drawing,"pipe_support":q_pipe_support,"welding":q_welding,
-                            "nde":q_nde,"sandblast":q_sandblast,"assembly":q_assembly,
-                            "painting":q_painting,"pressure_test":q_pressure_test,
-                            "handover":q_handover,"handover_year":q_handover_year,
-                            "section":sec,"updated_at":datetime.now().isoformat(),
-                        }
-                        try:
-                            supabase.table("projects").update(upd).eq("id",rid).execute()
-                            st.success(f"✅ 已儲存「{q_project_name}」！")
-                            st.cache_data.clear()
-                            st.rerun()
-                        except Exception as e:
-                            st.error(f"儲存失敗：{e}")
-
-            st.divider()
-            st.markdown("**📋 大量編輯（改完自動儲存）**")
-
-            edit_df = df_sec[[c for c in show_cols + ["status_type","id"] if c != "_order"]].copy()
-            for _c in edit_df.columns:
-                edit_df[_c] = edit_df[_c].replace({"None":"","nan":"","NaN":""})
-            edit_df["status_zh"] = edit_df["status_type"].map(STATUS_KEY_TO_ZH).fillna("")
-            edit_df.insert(0, "🗑 刪除", False)   # 勾選欄放最前面
-
-            # ── 文字日期 → Python date 物件（DateColumn 需要）──
-            _DATE_COLS = ["drawing","pipe_support","welding","nde","sandblast",
-                          "assembly","painting","pressure_test","handover"]
-            def _str_to_date(val):
-                import re as _r
-                v = str(val).strip()
-                if not v or v in ("None","nan","NaN","","-"): return None
-                # M/D 格式，跨年判斷
-                m = _r.search(r"(\d{1,2})/(\d{1,2})", v)
-                if m:
-                    now = datetime.now()
-                    mo, day = int(m.group(1)), int(m.group(2))
-                    year = now.year
-                    if mo > now.month or (mo == now.month and day > now.day):
-                        year -= 1
-                    try:
-                        from datetime import date as _date
-                        return _date(year, mo, day)
-                    except: pass
-                # YYYY/MM/DD 或 YYYY-MM-DD
-                try:
-                    dt = pd.to_datetime(v, errors="coerce")
-                    if pd.notna(dt):
-                        return dt.date()
-                except: pass
-                return None
-
-            for _dc in _DATE_COLS:
-                if _dc in edit_df.columns:
-                    edit_df[_dc] = edit_df[_dc].apply(_str_to_date)
-
-            original_df = edit_df.copy()
-            edit_key    = f"edit_{sec}"
-
-            def auto_save_callback(sec=sec, original_df=original_df):
-                state = st.session_state.get(f"edit_{sec}")
-                if state is None: return
-                # ✅ 若本次變動只有勾選「🗑 刪除」欄，跳過自動儲存
-                # 讓刪除按鈕有機會顯示出來
-                edited_rows = state.get("edited_rows", {})
-                only_delete_checked = all(
-                    set(changes.keys()) == {"🗑 刪除"}
-                    for changes in edited_rows.values()
-                ) if edited_rows else False
-                if only_delete_checked:
-                    return   # 不儲存，不重整，讓按鈕正常顯示
-                saved = do_save(sec, original_df, state)
-                if saved > 0:
-                    st.cache_data.clear()
-                    st.toast(f"✅ 自動儲存 {saved} 筆！", icon="💾")
-
-            edited = st.data_editor(
-                edit_df,
-                key=edit_key,
-                on_change=auto_save_callback,
-                column_config={
-                    **{k:v for k,v in COL_CONFIG.items()
-                       if k in edit_df.columns or k == "status_zh"},
-                    "🗑 刪除": st.column_config.CheckboxColumn(
-                        "🗑 刪除", help="勾選後按下方確認刪除", width="small"),
-                },
-                use_container_width=True,
-                num_rows="dynamic",
-                hide_index=True,
-                column_order=["🗑 刪除","status_zh","status","completion","materials",
-                              "case_no","project_name","client","tracking","drawing",
-                              "pipe_support","welding","nde","sandblast","assembly",
-                              "painting","pressure_test","handover","handover_year","contact"],
-            )
-
-            # 勾選刪除按鈕
-            del_rows = edited[edited["🗑 刪除"] == True]
-            if not del_rows.empty:
-                st.warning(f"⚠️ 已勾選 {len(del_rows)} 列，按下方按鈕確認刪除")
-                if st.button(f"🗑 確認刪除 {len(del_rows)} 列",
-                             key=f"del_btn_{sec}", type="primary"):
-                    deleted = 0
-                    for _, row in del_rows.iterrows():
-                        rid = str(row.get("id",""))
-                        if rid and rid not in ("","None"):
-                            try:
-                                supabase.table("projects").delete().eq("id", rid).execute()
-                                deleted += 1
-                            except Exception as e:
-                                st.toast(f"刪除失敗：{e}", icon="❌")
-                    st.success(f"✅ 已刪除 {deleted} 列")
-                    st.cache_data.clear()
-                    st.rerun()
-            else:
-                st.caption("💡 修改後點擊其他地方自動儲存 ／ 末列空白列可新增 ／ 勾選🗑可刪除整列")
+        section_block(sec, FILTER_KEY[0], search, filter_year, filter_section=="全部分區")
 
     # ── 重新整理按鈕 ──────────────────────────────────────
     st.divider()
@@ -798,179 +943,73 @@ with page_tab1:
     with c1:
         if st.button("🔄 重新整理", use_container_width=True, type="primary"):
             refresh()
-    with c2:
-        if st.button("📄 匯出 PDF", use_container_width=True):
-            st.session_state["show_pdf"] = True
-    with c3:
-        if st.button("📊 匯出 Excel", use_container_width=True):
-            st.session_state["show_xlsx"] = True
-
-    # ── 匯出 xlsx ──────────────────────────────────────
-    if st.session_state.get("show_xlsx"):
-        try:
-            import openpyxl
-            from openpyxl.styles import PatternFill, Font, Alignment, Border, Side
-            from io import BytesIO
-
-            wb  = openpyxl.Workbook()
-            wb.remove(wb.active)
-
-            XLSX_COL_NAMES = {
-                "status":"施工順序","completion":"完成率","materials":"備料",
-                "case_no":"案號","project_name":"工程名稱","client":"業主",
-                "tracking":"備註","drawing":"製造圖面","pipe_support":"管撐製作",
-                "welding":"點焊","nde":"焊道NDE","sandblast":"噴砂",
-                "assembly":"組立","painting":"噴漆","pressure_test":"試壓",
-                "handover":"交站","handover_year":"交站年份","contact":"對應窗口",
-            }
-            XLSX_BG = {
-                "in_progress":"FFFF99","pending":"CCE8FF",
-                "not_started":"FFFFFF","suspended":"FFE0B2","completed":"F0F0F0"
-            }
-            thin = Side(style="thin", color="AAAAAA")
-            border = Border(left=thin, right=thin, top=thin, bottom=thin)
-
-            export_cols = [c for c in DISPLAY_COLS if c in df.columns]
-            sections_xlsx = SECTIONS if filter_section=="全部分區" else [filter_section]
-
-            for sec_x in sections_xlsx:
-                ds = df[df["section"]==sec_x] if not df.empty else pd.DataFrame()
-                if ds.empty: continue
-                ws = wb.create_sheet(title=sec_x[:31])
-
-                # 標題列
-                for ci, col in enumerate(export_cols, 1):
-                    cell = ws.cell(row=1, column=ci, value=XLSX_COL_NAMES.get(col,col))
-                    cell.font      = Font(bold=True, color="FFFFFF", name="Arial")
-                    cell.fill      = PatternFill("solid", fgColor="1A3A5C")
-                    cell.alignment = Alignment(horizontal="center", vertical="center")
-                    cell.border    = border
-
-                # 資料列
-                for ri, (_, row) in enumerate(ds.iterrows(), 2):
-                    bg = XLSX_BG.get(str(row.get("status_type","")), "FFFFFF")
-                    fill = PatternFill("solid", fgColor=bg)
-                    for ci, col in enumerate(export_cols, 1):
-                        val = str(row.get(col,"") or "")
-                        cell = ws.cell(row=ri, column=ci, value=val)
-                        cell.fill      = fill
-                        cell.font      = Font(name="Arial", size=10)
-                        cell.alignment = Alignment(vertical="center", wrap_text=False)
-                        cell.border    = border
-
-                # 欄寬
-                col_widths = {"project_name":35,"tracking":30,"case_no":14,"client":12,
-                              "contact":12,"status":14,"completion":8,"materials":8}
-                for ci, col in enumerate(export_cols, 1):
-                    ws.column_dimensions[openpyxl.utils.get_column_letter(ci)].width = col_widths.get(col, 12)
-                ws.row_dimensions[1].height = 18
-                ws.freeze_panes = "A2"
-
-            buf = BytesIO()
-            wb.save(buf)
-            buf.seek(0)
-            fname_x = f"工程進度_{datetime.now().strftime('%Y%m%d')}.xlsx"
-            st.download_button("⬇ 下載 Excel", buf.getvalue(),
-                               file_name=fname_x,
-                               mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
-            st.session_state["show_xlsx"] = False
-        except Exception as e:
-            st.error(f"Excel 匯出失敗：{e}")
-
-
-    if st.session_state.get("show_pdf"):
-        try:
-            from fpdf import FPDF
-            import tempfile, os, urllib.request, re as _re_pdf
-
-            # ── 短日期轉換 ──────────────────────────────────
-            def _pdf_short(val):
-                v = str(val or "").strip()
-                if not v or v in ("None","nan","-"): return ""
-                m = _re_pdf.search(r"\d{4}/(\d{1,2})/(\d{1,2})", v)
-                if m: return f"{int(m.group(1))}/{int(m.group(2))}"
-                if _re_pdf.match(r"^\d{1,2}/\d{1,2}$", v): return v
-                return v
-
-            # ── 字型：多備援來源 ────────────────────────────
-            font_path = "/tmp/NotoSansSC.otf"
-            FONT_URLS = [
-                "https://cdn.jsdelivr.net/gh/googlefonts/noto-cjk@main/Sans/SubsetOTF/SC/NotoSansSC-Regular.otf",
-                "https://github.com/googlefonts/noto-cjk/raw/main/Sans/SubsetOTF/SC/NotoSansSC-Regular.otf",
-                "https://fonts.gstatic.com/ea/notosanstc/v1/NotoSansTC-Regular.otf",
-            ]
-            font_ok = os.path.exists(font_path) and os.path.getsize(font_path) > 100_000
-            if not font_ok:
-                with st.spinner("下載中文字型中（首次需要約10秒）..."):
-                    for url in FONT_URLS:
-                        try:
-                            urllib.request.urlretrieve(url, font_path)
-                            if os.path.getsize(font_path) > 100_000:
-                                font_ok = True; break
-                            os.remove(font_path)
-                        except: pass
-            if not font_ok:
-                st.error("❌ 字型下載失敗，請重試一次")
-                st.session_state["show_pdf"] = False
-                st.stop()
-
-            # ── 產生 PDF ────────────────────────────────────
-            DATE_KEYS_PDF = {"drawing","pipe_support","welding","nde","sandblast",
-                             "assembly","painting","pressure_test","handover"}
-            HEADERS = ["施工順序","完成率","備料","案號","工程名稱","業主","備註",
-                       "製造圖面","管撐","點焊","NDE","噴砂","組立","噴漆","試壓","交站","年份","窗口"]
-            KEYS    = ["status","completion","materials","case_no","project_name","client","tracking",
-                       "drawing","pipe_support","welding","nde","sandblast","assembly","painting",
-                       "pressure_test","handover","handover_year","contact"]
-            WIDTHS  = [20,11,7,22,55,13,30,13,11,18,11,11,11,11,11,15,9,13]
-            PDF_BG  = {"in_progress":(255,255,153),"pending":(204,232,255),
-                       "not_started":(255,255,255),"suspended":(255,224,178),"completed":(240,240,240)}
-
-            pdf = FPDF(orientation="L", format="A3")
-            pdf.set_auto_page_break(auto=True, margin=10)
-            pdf.add_font("ZH", "", font_path)
-
-            sections_for_pdf = SECTIONS if filter_section=="全部分區" else [filter_section]
-            for sec in sections_for_pdf:
-                ds = df[df["section"]==sec] if not df.empty else pd.DataFrame()
-                if ds.empty: continue
-                filter_note = ""
-                if st.session_state.active_status:
-                    labels = [STATUS_CONFIG[k]["label"] for k in st.session_state.active_status if k in STATUS_CONFIG]
-                    filter_note += f"  狀態：{'、'.join(labels)}"
-                if filter_year != "全部年份": filter_note += f"  年份：{filter_year}"
-                pdf.add_page()
-                pdf.set_font("ZH", size=13); pdf.set_text_color(10,35,80)
-                pdf.cell(0,9,f"【{sec}】  ({today})  共{len(ds)}筆{filter_note}",
-                         new_x="LMARGIN", new_y="NEXT"); pdf.ln(1)
-                pdf.set_font("ZH", size=7); pdf.set_fill_color(29,71,157); pdf.set_text_color(255,255,255)
-                for h,w in zip(HEADERS,WIDTHS):
-                    pdf.cell(w,7,h,border=1,fill=True,align="C")
-                pdf.ln(); pdf.set_font("ZH",size=6); pdf.set_text_color(30,30,30)
-                for _,row in ds.iterrows():
-                    rgb = PDF_BG.get(row.get("status_type",""),(255,255,255))
-                    pdf.set_fill_color(*rgb)
-                    for k,w in zip(KEYS,WIDTHS):
-                        raw = str(row.get(k,"") or "")
-                        val = _pdf_short(raw) if k in DATE_KEYS_PDF else raw
-                        if len(val) > 16: val = val[:15]+"…"
-                        pdf.cell(w,6,val,border=1,fill=True)
-                    pdf.ln()
-
-            with tempfile.NamedTemporaryFile(delete=False,suffix=".pdf") as tmp:
-                pdf.output(tmp.name)
-                with open(tmp.name,"rb") as f2: pdf_bytes=f2.read()
-                os.unlink(tmp.name)
-            fname = f"工程案執行進度_{datetime.now().strftime('%Y%m%d')}.pdf"
-            st.download_button("⬇ 下載 PDF", pdf_bytes, file_name=fname, mime="application/pdf")
-            st.session_state["show_pdf"] = False
-        except Exception as e:
-            st.error(f"PDF 失敗：{e}")
+    _sections_export = SECTIONS if filter_section=="全部分區" else [filter_section]
+    for _col, _fmt, _label in [(c2, "pdf", "📄 匯出 PDF"), (c3, "xlsx", "📊 匯出 Excel")]:
+        with _col:
+            if st.button(_label, use_container_width=True):
+                job = submit_export(_fmt, df_all, WEEK["hits"], _sections_export,
+                                    st.session_state.active_status, search, filter_year)
+                st.session_state.setdefault("export_keys", {})[_fmt] = job.key
+    _st, _ex = get_store().stats, get_export_jobs().stats()
+    st.caption(f"快取 v{data_version()}{'（即時）' if get_store().live else ''}：命中 {_st['hit']} ／ "
+               f"增量同步 {_st['delta']} ／ 儲存修補 {_st['patch']} ／ 即時事件 {_st['live']} ／ "
+               f"完整載入 {_st['full']} ／ 匯出檔 {_ex['cached']} 份"
+               f"（產生中 {_ex['pending']}）")
+
+    _orphans = get_outbox().unclaimed_conflicts()
+    with st.expander("🛠 資料維護", expanded=bool(_ob["failed"] or _orphans)):
+        if _ob["failed"]:
+            st.error(f"{_ob['failed']} 筆修改多次送出失敗：")
+            st.dataframe(pd.DataFrame(get_outbox().failed(), columns=["#", "項目", "錯誤"]),
+                         hide_index=True, use_container_width=True)
+            m1, m2 = st.columns(2)
+            if m1.button("🔁 全部重送", key="outbox_retry"):
+                get_outbox().retry_failed(); st.rerun()
+            if m2.button("🗑 放棄這些修改", key="outbox_discard"):
+                get_outbox().discard_failed(); st.rerun()
+        if _orphans:
+            st.warning(f"{len(_orphans)} 筆修改與別人的修改衝突，但原本的使用者沒有回來處理（分頁已關閉，或重開時網址沒帶原本的 ?user=）：")
+            st.dataframe(pd.DataFrame([
+                (seq,
+                 f"{srv.get('case_no') or ''} {srv.get('project_name') or ''}".strip() if srv else "（已被刪除）",
+                 "、".join(f"{COL_DISPLAY_NAMES.get(k, k)} → {v}" for k, v in mine.items()
+                          if k not in ("id", "_expected") and k not in DATE_COLS),
+                 datetime.fromtimestamp(created).strftime("%m/%d %H:%M"))
+                for seq, mine, srv, created in _orphans], columns=["#", "案件", "修改內容", "時間"]),
+                hide_index=True, use_container_width=True)
+            _seqs = [o[0] for o in _orphans]
+            c1, c2 = st.columns(2)
+            if c1.button("✅ 以這些修改為準重送", key="outbox_conflict_resend"):
+                get_outbox().resend_conflicts(_seqs); st.rerun()
+            if c2.button("🗑 放棄這些修改", key="outbox_conflict_discard"):
+                get_outbox().discard_conflicts(_seqs); st.rerun()
+        _chg = pending_completion_changes(df_all)
+        st.caption(f"完成率與自動規則不一致：{len(_chg)} 筆（例如在別處匯入 / 修改過的資料）")
+        if not _chg.empty and st.button(f"🔁 重新計算全部完成率（寫回 {len(_chg)} 筆）", key="recompute_completion"):
+            _bar = st.progress(0.0, text="寫回中…")
+            _saved, _failures = recompute_completion(
+                df_all, lambda done, total: _bar.progress(done / total, text=f"寫回中… {done}/{total} 筆"))
+            for label, e in _failures:
+                st.toast(f"⚠️ {label}：{e}", icon="❌")
+            st.success(f"✅ 已更新 {_saved} 筆完成率")
+            st.rerun()
+
+    # ── 匯出（背景產生，完成前只顯示進度）──────────────────
+    _keys = st.session_state.get("export_keys", {})
+    _polling = any((j := get_export_jobs().get(k)) is not None and j.pending for k in _keys.values())
+    st.fragment(run_every=EXPORT_POLL_SEC if _polling else None)(export_panel)(_polling)
+
+    # ── 即時更新（變更訂閱連線中才啟用；否則照舊由 SYNC_INTERVAL 輪詢 / 重新整理按鈕）──
+    if get_store().live:
+        st.fragment(run_every=LIVE_CHECK_SEC)(live_watch)(
+            frame_version(df_all), FILTER_KEY, frozenset(df["id"]) if "id" in df.columns else frozenset())
 
 # ═══════════════════════════════════════════════════════
-# PAGE 2：工時分析
+# PAGE 2：工時分析（fragment：切換篩選只重跑這一頁）
 # ═══════════════════════════════════════════════════════
-with page_tab2:
+@st.fragment
+def analysis_page():
+    df_all = load_data()
     if df_all.empty:
         st.warning("尚無資料")
     else:
@@ -982,96 +1021,22 @@ with page_tab2:
         with a2: year_filter = st.selectbox("年份", ["全部","116","115","114"], key="ana_year")
         with a3: sta_filter  = st.selectbox("狀態", ["全部"]+[v["label"] for v in STATUS_CONFIG.values()], key="ana_sta")
 
-        df_ana = df_all.copy()
-        if sec_filter  != "全部": df_ana = df_ana[df_ana["section"]==sec_filter]
-        if year_filter != "全部": df_ana = df_ana[df_ana["handover_year"]==year_filter]
-        if sta_filter  != "全部":
-            key = STATUS_ZH_TO_KEY.get(sta_filter,"")
-            if key: df_ana = df_ana[df_ana["status_type"]==key]
+        ana_status = STATUS_ZH_TO_KEY.get(sta_filter,"")
+        df_ana = filter_rows(df_all, (ana_status,) if ana_status else (),
+                             year="全部年份" if year_filter == "全部" else year_filter,
+                             section="全部分區" if sec_filter == "全部" else sec_filter)
 
         if df_ana.empty:
             st.info("此條件下沒有資料")
         else:
-            # ── 工序定義（從管撐製作開始）──
-            # 明確定義要計算的站點配對（不在此清單的相鄰段不計算）
-            CALC_PAIRS = [
-                ("pipe_support", "welding",       "管撐製作→點焊"),
-                ("welding",      "nde",            "點焊→焊道NDT"),
-                ("assembly",     "painting",       "組立→噴漆"),
-                ("painting",     "pressure_test",  "噴漆→試壓"),
-                ("pressure_test","handover",       "試壓→交站"),
-            ]
-            # 所有用到的欄位（供解析日期用）
-            ALL_COLS = list(dict.fromkeys(
-                [c for c,_,_ in CALC_PAIRS] + [c2 for _,c2,_ in CALC_PAIRS]
-            ))
-
-            def parse_date(val: str):
-                """解析 M/D 或 YYYY-MM-DD
-                跨年判斷：月份 > 當前月份 → 補上一年（例如現在2月，12/23 → 2025/12/23）
-                """
-                import re as _r
-                val = str(val).strip()
-                if not val or val in ("None","nan","-",""): return None
-                m = _r.search(r"(\d{1,2})/(\d{1,2})", val)
-                if m:
-                    now = datetime.now()
-                    mo, day = int(m.group(1)), int(m.group(2))
-                    year = now.year
-                    # 月份大於當前月份 → 應該是去年
-                    if mo > now.month:
-                        year -= 1
-                    # 月份等於當前月份但日期大於今天 → 也是去年
-                    elif mo == now.month and day > now.day:
-                        year -= 1
-                    try: return datetime(year, mo, day)
-                    except: pass
-                try: return pd.to_datetime(val, errors="coerce").to_pydatetime()
-                except: return None
-
-            # ── 計算每筆工程的各站點天數 ──
-            records = []
-            for _, row in df_ana.iterrows():
-                # 解析所有需要的欄位日期
-                col_dates = {}
-                for col in ALL_COLS:
-                    raw = str(row.get(col,"")).strip()
-                    col_dates[col] = parse_date(raw) if raw and raw not in ("None","nan","-","") else None
-
-                # 只計算 CALC_PAIRS 中定義的配對，任一端空白就跳過
-                proj = {
-                    "案號":     row.get("case_no",""),
-                    "工程名稱": row.get("project_name",""),
-                    "業主":     row.get("client",""),
-                    "分區":     row.get("section",""),
-                    "狀態":     STATUS_KEY_TO_ZH.get(row.get("status_type",""),""),
-                }
-                has_any = False
-                for c1, c2, label in CALC_PAIRS:
-                    d1 = col_dates.get(c1)
-                    d2 = col_dates.get(c2)
-                    if d1 is None or d2 is None:
-                        continue   # 任一端空白 → 不計算
-                    days = (d2 - d1).days
-                    if days >= 0:
-                        proj[label] = days
-                        has_any = True
-
-                if not has_any: continue  # 沒有任何可計算的對
-
-                # 總天數：只加總有實際計算出來的各段天數
-                segment_days = [v for k, v in proj.items()
-                                if "→" in str(k) and isinstance(v, (int, float))]
-                if segment_days:
-                    proj["總天數"] = sum(segment_days)
-
-                records.append(proj)
-
-            if not records:
+            # ── 各站點天數：工序日期欄整欄相減，依（分區, 年份, 狀態, 資料版本）快取 ──
+            ana_key = (frame_version(df_ana), sec_filter, year_filter, ana_status)
+            stages  = stage_table(df_all)
+            df_days, summary = cached_derived(("durations", *ana_key), lambda: duration_analysis(df_ana, stages))
+
+            if df_days.empty:
                 st.info("目前資料不足以計算天數（需要至少填寫 2 個以上的工序日期）")
             else:
-                df_days = pd.DataFrame(records).fillna("")
-
                 # ── 1. 各工程天數明細表 ──
                 st.markdown("#### 📋 各工程站點天數明細")
                 st.dataframe(df_days, use_container_width=True, hide_index=True,
@@ -1079,41 +1044,66 @@ with page_tab2:
 
                 st.divider()
 
-                # ── 2. 各站點平均天數（只取數字欄）──
+                # ── 2. 各站點平均天數 ──
                 st.markdown("#### 📊 各站點平均天數（所有工程）")
-                day_cols = [c for c in df_days.columns if "→" in c or c == "總天數"]
-                numeric_days = df_days[day_cols].apply(pd.to_numeric, errors="coerce")
-                avg_days = numeric_days.mean().dropna().round(1)
+                avg_days = summary["avg"]
 
                 if not avg_days.empty:
-                    avg_df = avg_days.reset_index()
-                    avg_df.columns = ["站點區間", "平均天數"]
-                    st.bar_chart(avg_df.set_index("站點區間")["平均天數"],
+                    st.bar_chart(avg_days.rename_axis("站點區間").rename("平均天數"),
                                  color="#1a3a5c", use_container_width=True)
 
                     # 數字卡片
-                    cols_m = st.columns(min(len(avg_df), 4))
-                    for i, (_, r) in enumerate(avg_df.iterrows()):
-                        cols_m[i % len(cols_m)].metric(r["站點區間"], f"{r['平均天數']} 天")
+                    cols_m = st.columns(min(len(avg_days), 4))
+                    for i, (label, v) in enumerate(avg_days.items()):
+                        cols_m[i % len(cols_m)].metric(label, f"{v} 天")
                 else:
                     st.info("無法計算平均天數")
 
                 st.divider()
 
                 # ── 3. 最快 / 最慢工程（依總天數）──
-                numeric_total = pd.to_numeric(df_days["總天數"], errors="coerce")
-                df_days["_total"] = numeric_total
-                df_valid = df_days[df_days["_total"].notna()].sort_values("_total")
-
-                if len(df_valid) >= 2:
+                if summary["n_ranked"] >= 2:
                     c1, c2 = st.columns(2)
                     with c1:
                         st.markdown("#### 🚀 完成最快（總天數最少）")
-                        top3 = df_valid.head(3)[["案號","工程名稱","總天數","狀態"]]
-                        st.dataframe(top3, use_container_width=True, hide_index=True)
+                        st.dataframe(summary["fastest"], use_container_width=True, hide_index=True)
                     with c2:
                         st.markdown("#### 🐢 耗時最長（總天數最多）")
-                        bot3 = df_valid.tail(3)[["案號","工程名稱","總天數","狀態"]].sort_values("總天數", ascending=False)
-                        st.dataframe(bot3, use_container_width=True, hide_index=True)
+                        st.dataframe(summary["slowest"], use_container_width=True, hide_index=True)
+
+            # ── 4. 流程瓶頸：長尾天數、每週產出、在製件數 ──
+            st.divider()
+            pipe = cached_derived(("pipeline", *ana_key, *week_key()), lambda: pipeline_analysis(df_ana, stages))
+            st.markdown("#### 🧭 流程瓶頸")
+            if pipe["bottleneck"]:
+                _wait = pipe["wait"].get(pipe["bottleneck"])
+                st.warning(f"目前瓶頸：**{pipe['bottleneck']}**（在製 {pipe['wip'][pipe['bottleneck']]} 件，"
+                           + (f"依近 {THROUGHPUT_WEEKS} 週產出約需 {_wait} 週消化）" if pd.notna(_wait)
+                              else f"近 {THROUGHPUT_WEEKS} 週沒有產出）"))
+            p1, p2 = st.columns(2)
+            with p1:
+                st.markdown("**各段天數分布（P50 / P90 / P99）**")
+                if pipe["pct"].empty: st.caption("資料不足")
+                else: st.dataframe(pipe["pct"], use_container_width=True)
+            with p2:
+                st.markdown("**各站在製件數**")
+                st.bar_chart(pipe["wip"].rename_axis("站點").rename("在製"),
+                             color="#1a3a5c", use_container_width=True)
+            st.markdown(f"**每週各站完成件數（近 {THROUGHPUT_WEEKS} 週）**")
+            st.line_chart(pipe["throughput"], use_container_width=True)
+
+            # ── 5. 分區 × 狀態件數 ──
+            st.divider()
+            st.markdown("#### 🗂 各分區狀態件數")
+            _where = {k: v for k, v in (("handover_year", [year_filter] if year_filter != "全部" else []),
+                                        ("section",       [sec_filter] if sec_filter != "全部" else []),
+                                        ("status_type",   [ana_status] if ana_status else [])) if v}
+            _counts = cached_derived(("section_counts", frame_version(df_all), *ana_key[1:]),
+                                     lambda: section_status_counts(df_all, _where))
+            st.dataframe(_counts, use_container_width=True)
 
 # ═══════════════════════════════════════════════════════
+if current_page == PAGES[0]:
+    progress_page()
+else:
+    analysis_page()
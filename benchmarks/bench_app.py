@@ -0,0 +1,266 @@
+"""app 熱路徑基準：合成資料（benchmarks/synthetic.py）＋ 記憶體內的 Supabase 替身（benchmarks/fake_supabase.py），
+量各步驟的時間、Python 配置的記憶體峰值與送出的請求數，結果存成 JSON，可與之前的結果比對找退步。
+
+    python -m benchmarks.bench_app [--sizes 1000 10000 100000] [--only load,filter]
+                                   [--baseline benchmarks/results/基準.json] [--tolerance 1.3]
+
+  --latency 秒   模擬每次請求的往返時間（預設 0，只量本機運算）
+  --pdf-max 列   超過這個筆數不跑 PDF（fpdf2 逐格繪製，10 萬列要好幾分鐘）
+有給 --baseline 時，任何一項比基準慢超過 tolerance 倍就以結束碼 1 結束（可放在 CI）。
+"""
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import tracemalloc
+from pathlib import Path
+from datetime import datetime, timezone
+
+import pandas as pd
+
+from pm.config import SECTIONS, STATUS_KEY_TO_ZH, PROCESS_COLS, PROCESS_NAMES, DISPLAY_COLS, DATE_COLS, dt_col
+from pm.data import ProjectStore, PAGE_SIZE
+from pm.views import (TABLE_PAGE_ROWS, build_week_index, build_filter_index, query_filter_index,
+                      render_table_html, week_start, pdf_section_block)
+from pm.editing import editor_changes, with_typed_dates, send_ops
+from pm.outbox import Outbox
+from pm.counts import count_table
+from pm.analytics import (Pipeline, CALC_PAIRS, segment_days, current_stage, duration_frame, duration_summary,
+                          stage_percentiles, weekly_throughput, wip_counts, find_bottleneck)
+from benchmarks.synthetic import synth_projects
+from benchmarks.fake_supabase import FakeSupabase
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+SIZES = (1_000, 10_000, 100_000)
+PDF_MAX_ROWS = 10_000
+SAVE_ROWS = 20           # do_save：一次自動儲存改幾列
+SYNC_CHANGED = 50        # 增量同步：兩次同步之間別人改了幾列
+PIPELINE = Pipeline.from_config(None, dict(zip(PROCESS_COLS, PROCESS_NAMES)), PROCESS_COLS[1:], CALC_PAIRS)
+# 篩選鏈：狀態按鈕 / 關鍵字 / 年份 / 分區 的幾種常見組合
+FILTERS = [((), "", "全部年份", "全部分區"), (("in_progress",), "", "全部年份", "全部分區"),
+           (("in_progress", "pending"), "", "115", "全部分區"), ((), "台電", "全部年份", SECTIONS[0]),
+           ((), "000123", "全部年份", "全部分區"), (("completed",), "", "未填年份", SECTIONS[1])]
+
+
+class Ctx:
+    """一個資料量的共用狀態：原始列、已載入的快照，以及由快照算出的本週索引（各 benchmark 的前置）"""
+
+    def __init__(self, n: int, latency: float = 0.0, pdf_max: int = PDF_MAX_ROWS):
+        self.n, self.latency, self.pdf_max = n, latency, pdf_max
+        self.rows = synth_projects(n)
+        self.store = self.loaded_store()
+        self.df = self.store.df
+        self.week = build_week_index(self.df)
+
+    def fake(self, rpcs: bool = True) -> FakeSupabase:
+        return FakeSupabase(self.rows, rpcs=rpcs, latency=self.latency)
+
+    def loaded_store(self, db: FakeSupabase = None) -> ProjectStore:
+        db = db or self.fake()
+        store = ProjectStore(db, db, PAGE_SIZE)
+        store.get()
+        return store
+
+
+# ── 各熱路徑：setup(ctx) → (要量的函式, 計算請求數的替身或 None) ─────────
+def bench_load(ctx):
+    """冷啟動載入整張表（分頁並行抓取 + 每頁正規化 + 工序日期解析）"""
+    db = ctx.fake()
+    store = ProjectStore(db, db, PAGE_SIZE)
+    return store.get, db
+
+def bench_sync(ctx):
+    """增量同步：別人改了 SYNC_CHANGED 列後的下一次 load_data"""
+    db = ctx.fake()
+    store = ctx.loaded_store(db)
+    stamp = datetime.now(timezone.utc).isoformat()
+    for r in list(db.tables["projects"].values())[:SYNC_CHANGED]:
+        r.update(status="製作中（已更新）", updated_at=stamp)
+    store.mark_stale()
+    return store.get, db
+
+def bench_filter_index(ctx):
+    """每個資料版本建一次的篩選索引"""
+    return (lambda: build_filter_index(ctx.df)), None
+
+def bench_filter_query(ctx):
+    """篩選鏈：FILTERS 每組各查一次並取出列"""
+    idx = build_filter_index(ctx.df)
+    return (lambda: [ctx.df.iloc[query_filter_index(idx, *f)] for f in FILTERS]), None
+
+def bench_week_index(ctx):
+    return (lambda: build_week_index(ctx.df)), None
+
+def bench_counts(ctx):
+    """統計卡 / 狀態按鈕 / 分區標籤用的件數表"""
+    return (lambda: count_table(ctx.df, week_start())), None
+
+def bench_table_page(ctx):
+    """三個分區各畫第一頁 HTML 表格（畫面上實際會做的事）"""
+    secs = [ctx.df[ctx.df["section"] == s] for s in SECTIONS]
+    return (lambda: [render_table_html(d.iloc[:TABLE_PAGE_ROWS], ctx.week["hits"]) for d in secs]), None
+
+def bench_table_full(ctx):
+    """整張表一次畫成 HTML（看 renderer 本身隨筆數的成長）"""
+    return (lambda: render_table_html(ctx.df, ctx.week["hits"])), None
+
+def bench_save(ctx):
+    """
+    do_save：data_editor 改了 SAVE_ROWS 列 → 變動欄位 + 版本 → 寫進本機佇列（pm/outbox.py）→
+    背景送出（send_ops：一次 RPC 寫入 + 修補快照）；這裡不起背景 thread，直接把佇列送完
+    """
+    db = ctx.fake()
+    store = ctx.loaded_store(db)
+    rpc_state = {"ok": None, "client_id": None}
+    outbox = Outbox(lambda kind, payloads: send_ops(db, store, rpc_state, kind, payloads),
+                    Path(tempfile.mkdtemp()) / "outbox.sqlite")
+    typed = DATE_COLS[0] in store.df.columns
+    sec = SECTIONS[0]
+    df_sec = store.df[store.df["section"] == sec]
+    cols = [c for c in DISPLAY_COLS if c in df_sec.columns] + ["status_type", "id", "updated_at"]
+    edit_df = df_sec[cols].astype(str).reset_index(drop=True)
+    edit_df["status_zh"] = edit_df["status_type"].map(STATUS_KEY_TO_ZH).fillna("")
+    state = {"edited_rows": {str(i): {"status": f"第{i}次修改", "welding": "2026/01/15"}
+                             for i in range(min(SAVE_ROWS, len(edit_df)))},
+             "added_rows": [], "deleted_rows": []}
+
+    def run():
+        updates, _, _, bases, _ = editor_changes(sec, edit_df, state)
+        for label, row in updates:
+            if typed:   # 同 app.queue_writes：資料表有 date 欄才一起寫
+                row = with_typed_dates(row)
+            outbox.enqueue("update", row, label, "bench", bases.get(str(row["id"])))
+        while True:
+            batch = outbox._next_batch()
+            if not batch: break
+            outbox._flush(batch)
+        return outbox.counts()
+    return run, db
+
+def _sheets(ctx):
+    return [(sec, ctx.df[ctx.df["section"] == sec]) for sec in SECTIONS]
+
+def bench_xlsx(ctx):
+    from pm.exports import build_xlsx
+    cols = [c for c in DISPLAY_COLS if c in ctx.df.columns]
+    sheets = [(sec, ds, ctx.week["hits"]) for sec, ds in _sheets(ctx)]
+    return (lambda: build_xlsx(sheets, cols)), None
+
+def bench_pdf(ctx):
+    from pm.exports import render_pdf
+    from pm.fonts import cjk_font_for
+    if ctx.n > ctx.pdf_max:
+        return None, f"略過（> {ctx.pdf_max} 列，--pdf-max 可調整）"
+    # 字型子集在前置做好（有磁碟快取，不適合算進每次的時間）
+    blocks = [pdf_section_block(f"【{sec}】", ds, ctx.week["hits"]) for sec, ds in _sheets(ctx)]
+    used = "".join(b["title"] + "".join("".join(v) for v in b["cells"].values()) for b in blocks)
+    font = cjk_font_for(used + "".join(SECTIONS) + "【】共筆")
+    if font is None:
+        return None, "略過（找不到中文字型）"
+
+    def run():
+        return render_pdf([pdf_section_block(f"【{sec}】", ds, ctx.week["hits"]) for sec, ds in _sheets(ctx)], font)
+    return run, None
+
+def bench_analysis(ctx):
+    """工時分析：整張表的工序天數 / 所在站，加上一組篩選後的明細、平均、百分位、產出、在製與瓶頸"""
+    def run():
+        df = ctx.df
+        dates = pd.DataFrame({c: df[dt_col(c)] for c in PROCESS_COLS}, index=df.index)
+        seg = segment_days(dates, PIPELINE.segments)
+        current = current_stage(PIPELINE, dates)
+        sub = df[df["section"] == SECTIONS[0]]
+        days = duration_frame(sub, seg, sub["status_type"].astype(str).map(STATUS_KEY_TO_ZH))
+        throughput = weekly_throughput(PIPELINE, dates.loc[sub.index], datetime.now(), 8)
+        wip = wip_counts(PIPELINE, current.loc[sub.index])
+        return (duration_summary(days), stage_percentiles(seg.loc[sub.index]), find_bottleneck(wip, throughput))
+    return run, None
+
+BENCHES = {
+    "load": bench_load, "sync": bench_sync, "filter_index": bench_filter_index, "filter": bench_filter_query,
+    "week_index": bench_week_index, "counts": bench_counts, "table_page": bench_table_page,
+    "table_full": bench_table_full, "save": bench_save, "xlsx": bench_xlsx, "pdf": bench_pdf,
+    "analysis": bench_analysis,
+}
+
+
+def measure(setup, ctx) -> dict:
+    """先量時間與請求數，再重新準備、另跑一次量記憶體峰值（tracemalloc 會拖慢速度，不能同一次量）"""
+    fn, db = setup(ctx)
+    if fn is None:
+        return {"skipped": db}
+    before = sum(db.requests.values()) if db else 0
+    t = time.perf_counter()
+    fn()
+    sec = time.perf_counter() - t
+    requests = sum(db.requests.values()) - before if db else 0
+    fn, _ = setup(ctx)
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"seconds": round(sec, 4), "peak_mib": round(peak / 2**20, 2), "requests": requests}
+
+
+def compare(results: list, baseline: list, tolerance: float) -> list:
+    """與基準同（名稱, 筆數）的項目比時間；回傳超過 tolerance 倍的 [(名稱, 筆數, 基準秒, 本次秒)]"""
+    base = {(r["bench"], r["rows"]): r for r in baseline if "seconds" in r}
+    slow = []
+    for r in results:
+        b = base.get((r["bench"], r["rows"]))
+        # 太短的項目（< 5 ms）雜訊比訊號大，不比
+        if b and "seconds" in r and max(b["seconds"], r["seconds"]) >= 0.005 \
+                and r["seconds"] > b["seconds"] * tolerance:
+            slow.append((r["bench"], r["rows"], b["seconds"], r["seconds"]))
+    return slow
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="app 熱路徑基準")
+    ap.add_argument("--sizes", type=int, nargs="+", default=list(SIZES))
+    ap.add_argument("--only", default="", help=f"逗號分隔，可選：{','.join(BENCHES)}")
+    ap.add_argument("--latency", type=float, default=0.0, help="模擬每次請求的往返秒數")
+    ap.add_argument("--pdf-max", type=int, default=PDF_MAX_ROWS)
+    ap.add_argument("--out", help="結果 JSON（預設 benchmarks/results/bench_app-<時間>.json）")
+    ap.add_argument("--baseline", help="與這份之前的結果比對")
+    ap.add_argument("--tolerance", type=float, default=1.3, help="比基準慢超過幾倍算退步")
+    args = ap.parse_args(argv)
+    names = [n for n in args.only.split(",") if n] or list(BENCHES)
+    unknown = set(names) - set(BENCHES)
+    if unknown:
+        ap.error(f"沒有這些項目：{', '.join(sorted(unknown))}")
+
+    results = []
+    for n in args.sizes:
+        t = time.perf_counter()
+        ctx = Ctx(n, args.latency, args.pdf_max)
+        print(f"{n} 筆（準備 {time.perf_counter() - t:.1f}s）")
+        for name in names:
+            r = {"bench": name, "rows": n, **measure(BENCHES[name], ctx)}
+            results.append(r)
+            if "skipped" in r:
+                print(f"  {name:12s} {r['skipped']}")
+            else:
+                print(f"  {name:12s} {r['seconds']:8.3f}s   peak {r['peak_mib']:8.1f} MiB   requests {r['requests']:5d}")
+
+    out = Path(args.out) if args.out else RESULTS_DIR / f"bench_app-{datetime.now():%Y%m%d-%H%M%S}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    meta = {"at": datetime.now().isoformat(timespec="seconds"), "python": platform.python_version(),
+            "pandas": pd.__version__, "machine": platform.machine(), "latency": args.latency}
+    out.write_text(json.dumps({"meta": meta, "results": results}, ensure_ascii=False, indent=1), encoding="utf-8")
+    print(f"結果已存到 {out}")
+
+    if args.baseline:
+        slow = compare(results, json.loads(Path(args.baseline).read_text(encoding="utf-8"))["results"],
+                       args.tolerance)
+        for name, n, b, s in slow:
+            print(f"⚠️ {name} @ {n} 筆：{b:.3f}s → {s:.3f}s（{s / b:.2f} 倍）")
+        if slow:
+            sys.exit(1)
+        print(f"與 {args.baseline} 比對：沒有超過 {args.tolerance} 倍的退步")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Excel 匯出基準：舊做法（整本 Workbook + 逐格建樣式）vs pm.exports.build_xlsx（唯寫串流 + 共用具名樣式）
+
+    python -m benchmarks.bench_xlsx [列數，預設 10000]
+"""
+import sys
+import time
+import random
+import tracemalloc
+from io import BytesIO
+
+import pandas as pd
+
+from pm.exports import build_xlsx, XLSX_BG, XLSX_COL_NAMES
+
+COLS = list(XLSX_COL_NAMES)
+DATE_COLS = ["drawing","pipe_support","welding","nde","sandblast","assembly","painting","pressure_test","handover"]
+
+
+def synth(n: int, seed: int = 1):
+    """隨機產生 n 筆工程案，以及約 5% 日期格標成本週"""
+    rnd = random.Random(seed)
+    rows = []
+    for i in range(n):
+        r = {c: "" for c in COLS}
+        r.update(case_no=f"C{100000+i}", project_name=f"工程名稱範例 {i}", client=rnd.choice(["台電","中油","中鋼"]),
+                 status=rnd.choice(["製作中","待交站",""]), completion=rnd.choice(["","20%","60%"]),
+                 tracking=rnd.choice(["","10/3 送料"]), handover_year=rnd.choice(["114","115"]),
+                 status_type=rnd.choice(list(XLSX_BG)))
+        for c in DATE_COLS:
+            if rnd.random() < 0.6: r[c] = f"{rnd.randint(1,12)}/{rnd.randint(1,28)}"
+        rows.append(r)
+    df = pd.DataFrame(rows)
+    hits = pd.DataFrame({c: [v if rnd.random() < 0.05 else "" for v in df[c]] for c in DATE_COLS}, index=df.index)
+    return df, hits
+
+
+def legacy_xlsx(ds, hits, cols) -> bytes:
+    """改寫前 app.py 的做法，留作對照"""
+    import openpyxl
+    from openpyxl.styles import PatternFill, Font, Alignment, Border, Side
+    wb = openpyxl.Workbook(); wb.remove(wb.active)
+    thin = Side(style="thin", color="AAAAAA")
+    border = Border(left=thin, right=thin, top=thin, bottom=thin)
+    ws = wb.create_sheet(title="bench")
+    for ci, col in enumerate(cols, 1):
+        cell = ws.cell(row=1, column=ci, value=XLSX_COL_NAMES.get(col, col))
+        cell.font = Font(bold=True, color="FFFFFF", name="Arial")
+        cell.fill = PatternFill("solid", fgColor="1A3A5C")
+        cell.alignment = Alignment(horizontal="center", vertical="center")
+        cell.border = border
+    for ri, (idx, row) in enumerate(ds.iterrows(), 2):
+        fill = PatternFill("solid", fgColor=XLSX_BG.get(str(row.get("status_type", "")), "FFFFFF"))
+        for ci, col in enumerate(cols, 1):
+            cell = ws.cell(row=ri, column=ci, value=str(row.get(col, "") or ""))
+            cell.fill = fill
+            if col in hits.columns and hits.at[idx, col]:
+                cell.font = Font(name="Arial", size=10, bold=True, color="C62828")
+            else:
+                cell.font = Font(name="Arial", size=10)
+            cell.alignment = Alignment(vertical="center", wrap_text=False)
+            cell.border = border
+    buf = BytesIO(); wb.save(buf)
+    return buf.getvalue()
+
+
+def measure(fn):
+    """先量時間，再另跑一次量 Python 配置的記憶體峰值（tracemalloc 會拖慢速度，不能同一次量）"""
+    t = time.perf_counter()
+    out = fn()
+    sec = time.perf_counter() - t
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return sec, peak, len(out)
+
+
+def main(n: int = 10_000):
+    df, hits = synth(n)
+    print(f"{n} 列 × {len(COLS)} 欄")
+    for name, fn in [("legacy  (iterrows)", lambda: legacy_xlsx(df, hits, COLS)),
+                     ("stream  (write-only)", lambda: build_xlsx([("bench", df, hits)], COLS))]:
+        sec, peak, size = measure(fn)
+        print(f"  {name:22s} {sec:6.2f}s   peak {peak/2**20:7.1f} MiB   file {size/2**10:7.0f} KiB")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10_000)
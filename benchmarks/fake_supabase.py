@@ -0,0 +1,228 @@
+"""基準測試用的 Supabase 替身：在記憶體裡跑，介面同 pm/db.py 的 SupabasePool / AsyncSupabasePool（同一個物件兩邊都能用）
+
+只實作 app 用到的查詢：select（欄位 / count / head）、eq / gt / gte / lt / in_、order、limit，
+insert / upsert / update / delete，以及 save_projects、project_counts 兩個 RPC（rpcs=False 時回 PGRST202，走逐筆備援）。
+每個 execute() 算一次請求，依 (方法, 表 / RPC) 記在 requests；latency 可模擬每次往返的秒數。
+"""
+import time
+import bisect
+import itertools
+from collections import Counter
+from concurrent.futures import Future
+from datetime import datetime, timezone
+
+from pm.counts import COUNTS_RPC
+from pm.editing import SAVE_RPC
+
+
+class FakeAPIError(Exception):
+    pass
+
+
+class FakeResponse:
+    def __init__(self, data, count=None):
+        self.data, self.count = data, count
+
+
+class FakeQuery:
+    def __init__(self, backend, table: str):
+        self.backend, self.table = backend, table
+        self.method, self.cols, self.body = "GET", None, None
+        self.filters, self.orders, self.limit_n = [], [], None
+        self.count, self.head = None, False
+        self.on_conflict, self.ignore_duplicates = None, False
+
+    # ── 組查詢 ──────────────────────────────────────────────
+    def select(self, cols: str = "*", count: str = None, head: bool = False):
+        self.cols = None if cols.strip() == "*" else [c.strip() for c in cols.split(",")]
+        self.count, self.head = count, head
+        return self
+
+    def insert(self, rows):
+        self.method, self.body = "POST", rows if isinstance(rows, list) else [rows]
+        return self
+
+    def upsert(self, rows, on_conflict: str = "", ignore_duplicates: bool = False):
+        self.insert(rows)
+        self.on_conflict, self.ignore_duplicates = on_conflict or "id", ignore_duplicates
+        return self
+
+    def update(self, values: dict):
+        self.method, self.body = "PATCH", values
+        return self
+
+    def delete(self):
+        self.method = "DELETE"
+        return self
+
+    def _f(self, col, op, val):
+        self.filters.append((col, op, val))
+        return self
+
+    def eq(self, col, val):  return self._f(col, "eq", val)
+    def gt(self, col, val):  return self._f(col, "gt", val)
+    def gte(self, col, val): return self._f(col, "gte", val)
+    def lt(self, col, val):  return self._f(col, "lt", val)
+    def in_(self, col, vals): return self._f(col, "in", vals)
+
+    def order(self, col: str, desc: bool = False):
+        self.orders.append((col, desc))
+        return self
+
+    def limit(self, n: int):
+        self.limit_n = n
+        return self
+
+    def execute(self):
+        return self.backend.execute(self)
+
+
+class FakeRPC:
+    def __init__(self, backend, fn: str, params: dict):
+        self.backend, self.fn, self.params = backend, fn, params
+
+    def execute(self):
+        return self.backend.call(self.fn, self.params)
+
+
+def _cmp(v, target):
+    """PostgREST 比較：id 以數字、其他以字串比"""
+    if isinstance(target, (int, float)) and not isinstance(target, bool):
+        try: return float(v), float(target)
+        except (TypeError, ValueError): return None, None
+    return (None if v is None else str(v)), str(target)
+
+
+def _id_range(filters: list) -> tuple:
+    """id 上的 gt / gte / lt / eq 條件 → 半開區間 [lo, hi)（分頁查詢用，免得每頁掃整張表）"""
+    lo, hi = float("-inf"), float("inf")
+    for col, op, val in filters:
+        if col != "id" or op == "in": continue
+        v = float(val)
+        if op == "gt":  lo = max(lo, v + 1)
+        if op == "gte": lo = max(lo, v)
+        if op == "lt":  hi = min(hi, v)
+        if op == "eq":  lo, hi = max(lo, v), min(hi, v + 1)
+    return lo, hi
+
+
+def _match(row: dict, filters: list) -> bool:
+    for col, op, val in filters:
+        v = row.get(col)
+        if op == "in":
+            if str(v) not in {str(x) for x in val}: return False
+            continue
+        a, b = _cmp(v, val)
+        if a is None: return False
+        if op == "eq" and a != b: return False
+        if op == "gt" and not a > b: return False
+        if op == "gte" and not a >= b: return False
+        if op == "lt" and not a < b: return False
+    return True
+
+
+class FakeSupabase:
+    def __init__(self, rows: list = (), rpcs: bool = True, latency: float = 0.0):
+        self.tables = {"projects": {int(r["id"]): dict(r) for r in rows}, "user_prefs": {}}
+        self.rpcs, self.latency = rpcs, latency
+        self.requests = Counter()
+        self._ids = {}          # 表 → 排序過的 id（寫入新增 / 刪除列時清掉）
+
+    # ── 與 SupabasePool / AsyncSupabasePool 相同的入口 ───────
+    def table(self, name: str, op: str = "read") -> FakeQuery:
+        return FakeQuery(self, name)
+
+    def rpc(self, fn: str, params: dict, op: str = "write") -> FakeRPC:
+        return FakeRPC(self, fn, params)
+
+    def read(self, query):
+        return query.execute()
+
+    def submit(self, query) -> Future:
+        fut = Future()
+        fut.set_result(query.execute())
+        return fut
+
+    def gather(self, queries: list) -> list:
+        return [q.execute() for q in queries]
+
+    # ── 執行 ──────────────────────────────────────────────
+    def _tick(self, key):
+        self.requests[key] += 1
+        if self.latency: time.sleep(self.latency)
+
+    @staticmethod
+    def _now() -> str:
+        return datetime.now(timezone.utc).isoformat()
+
+    def _candidates(self, name: str, table: dict, filters: list) -> list:
+        """依 id 順序、先用 id 區間縮小範圍的候選列"""
+        ids = self._ids.get(name)
+        if ids is None:
+            ids = self._ids[name] = sorted(table)
+        lo, hi = _id_range(filters)
+        return [table[i] for i in ids[bisect.bisect_left(ids, lo):bisect.bisect_left(ids, hi)]]
+
+    def execute(self, q: FakeQuery) -> FakeResponse:
+        self._tick((q.method, q.table))
+        table = self.tables.setdefault(q.table, {})
+        if q.method == "POST":
+            self._ids.pop(q.table, None)
+            out = []
+            taken = {r.get(q.on_conflict): i for i, r in table.items()} if q.on_conflict else {}
+            for r in q.body:
+                hit = taken.get(r.get(q.on_conflict)) if q.on_conflict else None
+                if hit is not None:
+                    if q.ignore_duplicates: continue
+                    r = {**table[hit], **r, "id": hit}
+                r = {**r, "id": r.get("id") or max(table, default=0) + 1, "updated_at": self._now()}
+                table[int(r["id"])] = r
+                out.append(dict(r))
+            return FakeResponse(out)
+        hits = (r for r in self._candidates(q.table, table, q.filters) if _match(r, q.filters))
+        if q.method == "GET" and q.orders == [("id", False)] and q.limit_n is not None and not q.count:
+            hits = list(itertools.islice(hits, q.limit_n))   # 候選已按 id 排好，取夠就停
+        else:
+            hits = list(hits)
+        if q.method == "PATCH":
+            now = self._now()
+            for r in hits:
+                r.update(q.body, updated_at=now)
+            return FakeResponse([dict(r) for r in hits])
+        if q.method == "DELETE":
+            self._ids.pop(q.table, None)
+            for r in hits:
+                table.pop(int(r["id"]), None)
+            return FakeResponse([])
+        for col, desc in reversed(q.orders):
+            hits.sort(key=lambda r: (r.get(col) is None, r.get(col) if col != "id" else int(r["id"])), reverse=desc)
+        total = len(hits) if q.count else None
+        if q.head:
+            return FakeResponse([], total)
+        if q.limit_n is not None:
+            hits = hits[:q.limit_n]
+        # 回傳的是複本（如同每次從 JSON 解析出新物件；值都是純量，淺複本就夠）
+        data = [{c: r.get(c) for c in q.cols} for r in hits] if q.cols else [dict(r) for r in hits]
+        return FakeResponse(data, total)
+
+    def call(self, fn: str, params: dict) -> FakeResponse:
+        self._tick(("RPC", fn))
+        if not self.rpcs or fn not in (SAVE_RPC, COUNTS_RPC):
+            raise FakeAPIError(f"PGRST202: Could not find the function public.{fn}")
+        table = self.tables["projects"]
+        if fn == COUNTS_RPC:
+            out = {}
+            for r in table.values():
+                k = tuple(r.get(c) or "" for c in ("section", "status_type", "handover_year"))
+                n, w = out.get(k, (0, 0))
+                out[k] = (n + 1, w + (str(r.get("updated_at") or "") >= params["p_since"]))
+            return FakeResponse([{"section": k[0], "status_type": k[1], "handover_year": k[2], "n": n, "n_week": w}
+                                 for k, (n, w) in out.items()])
+        saved, now = [], self._now()
+        for r in params["p_rows"]:
+            row = table.get(int(r["id"]))
+            if row is None or (r.get("_expected") and row.get("updated_at") != r["_expected"]):
+                continue
+            row.update({k: v for k, v in r.items() if k not in ("id", "_expected")}, updated_at=now)
+            saved.append(dict(row))
+        return FakeResponse(saved)
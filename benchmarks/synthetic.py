@@ -0,0 +1,59 @@
+"""基準測試用的合成 projects 資料：三個分區、五種狀態、工序日期混用 M/D、YYYY/MM/DD、YYYY-MM-DD，
+少量空白案號 / 無法解析的日期 / 本週日期與本週更新，欄位與 README 的 projects 表相同（值為 Supabase 回傳的樣子）"""
+import random
+from datetime import datetime, timedelta, timezone
+
+from pm.config import SECTIONS, STATUS_CONFIG, PROCESS_COLS
+
+CLIENTS  = ["台電", "中油", "中鋼", "台塑", "台積電", "中華電信", "榮工", "長榮"]
+CONTACTS = ["王", "李", "陳", "林", "張", ""]
+JUNK_DATES = ["待確認", "?", "下週", "3月底"]
+# 各狀態已填到第幾站（含）：(最少, 最多)
+FILLED = {"not_started": (0, 1), "in_progress": (2, 7), "pending": (8, 8), "completed": (9, 9), "suspended": (1, 6)}
+
+
+def _fmt(d: datetime, rnd: random.Random) -> str:
+    pick = rnd.random()
+    if pick < 0.5: return f"{d.month}/{d.day}"
+    if pick < 0.8: return d.strftime("%Y/%m/%d")
+    return d.strftime("%Y-%m-%d")
+
+
+def synth_projects(n: int, seed: int = 1, now: datetime = None) -> list:
+    """產生 n 筆 projects 原始列（dict，id 從 1 起連續）"""
+    rnd = random.Random(seed)
+    now = now or datetime.now()
+    statuses = list(STATUS_CONFIG)
+    rows = []
+    for i in range(1, n + 1):
+        st = rnd.choice(statuses)
+        year = rnd.choice(["114", "115", "116", ""])
+        lo, hi = FILLED[st]
+        k = rnd.randint(lo, hi)
+        # 最後一站落在最近幾週（約 5% 在本週），往前各站相隔 1–20 天
+        d = now - timedelta(days=rnd.choice([rnd.randint(0, 6)] + [rnd.randint(0, 300)] * 19))
+        dates = []
+        for _ in range(k):
+            dates.append(d)
+            d -= timedelta(days=rnd.randint(1, 20))
+        dates.reverse()
+        row = {
+            "id": i, "section": rnd.choice(SECTIONS), "status_type": st, "handover_year": year,
+            "case_no": "" if rnd.random() < 0.01 else f"{year or '115'}-{i:06d}",
+            "project_name": f"{rnd.choice(CLIENTS)} 配管工程 第{i}案", "client": rnd.choice(CLIENTS),
+            "status": rnd.choice(["", "製作中", "待料", "待交站", f"{now.month}/{now.day} 試壓"]),
+            "completion": "", "materials": rnd.choice(["", "已到", "部分到料"]),
+            "tracking": rnd.choice(["", "", f"{rnd.randint(1, 12)}/{rnd.randint(1, 28)} 送料", "等業主確認"]),
+            "plan_doc": "", "est_delivery": "", "notes": "", "closed": "",
+            "contact": rnd.choice(CONTACTS),
+        }
+        for j, c in enumerate(PROCESS_COLS):
+            if j < k:
+                row[c] = rnd.choice(JUNK_DATES) if rnd.random() < 0.01 else _fmt(dates[j], rnd)
+            else:
+                row[c] = None if rnd.random() < 0.5 else ""
+        updated = now - timedelta(days=rnd.randint(0, 200), seconds=rnd.randint(0, 86399))
+        row["updated_at"] = updated.astimezone(timezone.utc).isoformat()
+        row["created_at"] = (updated - timedelta(days=rnd.randint(0, 400))).astimezone(timezone.utc).isoformat()
+        rows.append(row)
+    return rows
@@ -0,0 +1 @@
+"""工程進度管理系統 — 可在 Streamlit 以外單獨匯入的模組（匯出、測試基準等）"""
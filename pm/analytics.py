@@ -0,0 +1,151 @@
+"""工時分析：工序流程模型 + 工序日期（已解析成 datetime64）整欄相減的天數 / 百分位 / 產出 / 在製統計"""
+import warnings
+
+import numpy as np
+import pandas as pd
+
+# 預設要計算的站點配對（不在此清單的相鄰段不計算）
+CALC_PAIRS = [
+    ("pipe_support", "welding",       "管撐製作→點焊"),
+    ("welding",      "nde",           "點焊→焊道NDT"),
+    ("assembly",     "painting",      "組立→噴漆"),
+    ("painting",     "pressure_test", "噴漆→試壓"),
+    ("pressure_test","handover",      "試壓→交站"),
+]
+TOTAL_LABEL = "總天數"
+INFO_COLS = {"case_no":"案號", "project_name":"工程名稱", "client":"業主", "section":"分區"}
+PERCENTILES = (50, 90, 99)
+
+
+class Pipeline:
+    """
+    工序流程：stages 為依先後排列的工序欄，names 為各欄中文名；
+    segments 為要計算天數的 [(前站, 後站, 標籤)]，不給就用相鄰兩站。
+    """
+
+    def __init__(self, stages: list, names: dict, segments: list = None):
+        self.stages = list(stages)
+        self.names = {c: names.get(c, c) for c in self.stages}
+        self.segments = [tuple(s) for s in segments] if segments else [
+            (a, b, f"{self.names[a]}→{self.names[b]}") for a, b in zip(self.stages, self.stages[1:])]
+
+    @classmethod
+    def from_config(cls, stages, names: dict, default_stages: list, default_segments: list = None):
+        """stages 有設定（例如 secrets 的 PIPELINE_STAGES）就用它、配對取相鄰兩站；否則用預設流程"""
+        if stages:
+            return cls([c for c in stages if c in names], names)
+        return cls(default_stages, names, default_segments)
+
+    def label(self, col: str) -> str:
+        return self.names.get(col, col)
+
+
+# ── 整張表算一次（依資料版本快取），篩選後的子集直接取列 ─────────
+def segment_days(dates: pd.DataFrame, segments: list = CALC_PAIRS) -> pd.DataFrame:
+    """
+    dates：欄名為工序欄的 datetime64 DataFrame（NaT = 未填）
+    每段 = 後站日期 − 前站日期（天）；任一端空白或為負數 → NaN
+    """
+    n, out = len(dates), {}
+    for c1, c2, label in segments:
+        if c1 in dates.columns and c2 in dates.columns:
+            d = dates[c2].to_numpy("datetime64[ns]") - dates[c1].to_numpy("datetime64[ns]")
+            days = d.astype("timedelta64[D]").astype(float)
+            days[np.isnat(d) | (days < 0)] = np.nan
+        else:
+            days = np.full(n, np.nan)
+        out[label] = days
+    return pd.DataFrame(out, index=dates.index)
+
+
+def current_stage(pipeline: Pipeline, dates: pd.DataFrame) -> pd.Series:
+    """
+    每個工程目前在做的站 = 已填日期中最後一站的下一站；
+    還沒填任何日期、或最後一站已填（已走完流程）→ ""
+    """
+    cols = [c for c in pipeline.stages if c in dates.columns]
+    if not cols or dates.empty:
+        return pd.Series("", index=dates.index)
+    filled = dates[cols].notna().to_numpy()
+    last = np.where(filled.any(axis=1), len(cols) - 1 - np.argmax(filled[:, ::-1], axis=1), -1)
+    nxt = np.array(cols[1:] + [""], dtype=object)
+    return pd.Series(np.where(last >= 0, nxt[np.maximum(last, 0)], ""), index=dates.index)
+
+
+# ── 依篩選條件彙總 ────────────────────────────────────────
+def duration_frame(df: pd.DataFrame, seg: pd.DataFrame, status_zh: pd.Series) -> pd.DataFrame:
+    """
+    各工程站點天數明細：seg 為 segment_days 的結果（可含比 df 多的列）；
+    總天數 = 有算出來的各段加總；一段都算不出來的工程不列入。
+    """
+    seg = seg.reindex(df.index)
+    has_any = seg.notna().any(axis=1).to_numpy()
+    out = pd.DataFrame({zh: df[c].astype(str) if c in df.columns else "" for c, zh in INFO_COLS.items()},
+                       index=df.index)
+    out["狀態"] = status_zh.reindex(df.index).fillna("").astype(str)
+    out = pd.concat([out, seg], axis=1)[has_any]
+    # 一段都沒算出的欄（此條件下沒有資料）不顯示
+    out = out.drop(columns=[l for l in seg.columns if out[l].isna().all()])
+    out[TOTAL_LABEL] = out[[l for l in seg.columns if l in out.columns]].sum(axis=1, min_count=1)
+    return out.reset_index(drop=True)
+
+
+def duration_summary(days: pd.DataFrame, rank_n: int = 3) -> dict:
+    """平均天數（各段 + 總天數）與最快 / 最慢工程，全部由 duration_frame 的結果算出"""
+    day_cols = [c for c in days.columns if "→" in c or c == TOTAL_LABEL]
+    ranked = days[days[TOTAL_LABEL].notna()].sort_values(TOTAL_LABEL, kind="stable")
+    cols = ["案號", "工程名稱", TOTAL_LABEL, "狀態"]
+    return {
+        "avg":     days[day_cols].mean().dropna().round(1),
+        "fastest": ranked.head(rank_n)[cols],
+        "slowest": ranked.tail(rank_n)[cols].sort_values(TOTAL_LABEL, ascending=False, kind="stable"),
+        "n_ranked": len(ranked),
+    }
+
+
+def stage_percentiles(seg: pd.DataFrame, q=PERCENTILES) -> pd.DataFrame:
+    """各段天數的件數 / 平均 / P50 / P90 / P99（長尾看 P90、P99）"""
+    vals = seg.to_numpy(float)
+    n = (~np.isnan(vals)).sum(axis=0)
+    if not n.any():
+        return pd.DataFrame(columns=["件數", "平均", *(f"P{p}" for p in q)])
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)   # 整欄 NaN 的段
+        pct  = np.nanpercentile(vals, q, axis=0)
+        mean = np.nanmean(vals, axis=0)
+    out = pd.DataFrame({"件數": n, "平均": mean, **{f"P{p}": pct[i] for i, p in enumerate(q)}},
+                       index=seg.columns).round(1)
+    return out[out["件數"] > 0]
+
+
+def weekly_throughput(pipeline: Pipeline, dates: pd.DataFrame, now, weeks: int = 8) -> pd.DataFrame:
+    """最近 weeks 週（週一起算、含本週）每站完成件數：該站日期落在那一週就算一件"""
+    this_week = (pd.Timestamp(now).normalize() - pd.Timedelta(days=pd.Timestamp(now).weekday()))
+    index = pd.DatetimeIndex([this_week - pd.Timedelta(weeks=w) for w in range(weeks - 1, -1, -1)])
+    out = {}
+    for c in pipeline.stages:
+        if c not in dates.columns: continue
+        d = dates[c].dropna()
+        wk = d - pd.to_timedelta(d.dt.weekday, unit="D")
+        out[pipeline.label(c)] = wk.dt.normalize().value_counts().reindex(index, fill_value=0)
+    return pd.DataFrame(out, index=index).rename_axis("週")
+
+
+def wip_counts(pipeline: Pipeline, current: pd.Series) -> pd.Series:
+    """各站在製件數（目前正在做這一站的工程數），依流程順序"""
+    cts = current[current != ""].value_counts()
+    return pd.Series({pipeline.label(c): int(cts.get(c, 0)) for c in pipeline.stages[1:]}, dtype=int)
+
+
+def find_bottleneck(wip: pd.Series, throughput: pd.DataFrame):
+    """
+    Little's law：預估等候週數 = 在製件數 ÷ 近期每週產出；最久的那一站就是瓶頸。
+    有在製但近期零產出的站視為無限久（同樣無限時取在製最多者）。回傳 (站名或 None, 各站等候週數)
+    """
+    rate = throughput.mean().reindex(wip.index).fillna(0)
+    wait = pd.Series(np.where(rate > 0, wip / rate.where(rate > 0, 1), np.where(wip > 0, np.inf, 0.0)),
+                     index=wip.index)
+    if not (wip > 0).any():
+        return None, wait
+    top = wait[wait == wait.max()]
+    return wip[top.index].idxmax(), wait.replace(np.inf, np.nan).round(1)
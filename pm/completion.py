@@ -0,0 +1,55 @@
+"""完成率規則：依「目前已填的最高工序」與狀態整欄計算 completion（製造圖面不計入）"""
+import numpy as np
+import pandas as pd
+
+# 由低到高依序套用，後面符合的規則蓋掉前面的結果：
+# (任一欄有填就符合, 基準完成率, 手動值落在此區間就保留手動值)
+STAGE_RULES = [
+    (("pipe_support",),              20, None),
+    (("welding",),                   30, None),
+    (("nde",),                       40, None),
+    (("sandblast",),                 50, None),
+    (("assembly",),                  60, (60, 80)),   # 組立 60–80%
+    (("painting", "pressure_test"),  85, (85, 90)),   # 噴漆 / 試壓 85–90%
+]
+STATUS_FLOOR = {"pending": 95}      # 待交站 → 至少 95%
+STATUS_FIXED = {"completed": 100}   # 已交站 → 100%
+
+
+def _text(df: pd.DataFrame, col: str) -> pd.Series:
+    if col not in df.columns:
+        return pd.Series("", index=df.index)
+    return df[col].astype(str).replace({"None": "", "nan": "", "NaN": "", "none": ""})
+
+
+def compute_completion(df: pd.DataFrame) -> pd.Series:
+    """
+    整張表一次算出自動完成率（字串，如 "60%"；0% → ""）
+    刪除日期時也會往下調整，所以結果直接覆蓋原本的 completion。
+    """
+    cur = pd.to_numeric(_text(df, "completion").str.replace("%", "").str.strip(), errors="coerce")
+    cur = np.trunc(cur.to_numpy(float))
+    cur = np.where(np.isfinite(cur), cur, 0)
+    pct = np.zeros(len(df))
+    for cols, base, keep in STAGE_RULES:
+        hit = np.logical_or.reduce([_text(df, c).str.strip().to_numpy() != "" for c in cols])
+        val = np.where((cur >= keep[0]) & (cur <= keep[1]), cur, base) if keep else base
+        pct = np.where(hit, val, pct)
+    status = _text(df, "status_type").to_numpy()
+    for key, floor in STATUS_FLOOR.items():
+        pct = np.where(status == key, np.maximum(pct, floor), pct)
+    for key, fixed in STATUS_FIXED.items():
+        pct = np.where(status == key, fixed, pct)
+    pct = pct.astype(int)
+    return pd.Series(np.where(pct > 0, pd.Series(pct).astype(str).to_numpy() + "%", ""), index=df.index)
+
+
+def completion_changes(df: pd.DataFrame) -> pd.DataFrame:
+    """completion 與規則結果不一致的列：id、原值、新值、目前版本（updated_at，寫回時檢查衝突用）"""
+    if df.empty or "id" not in df.columns:
+        return pd.DataFrame(columns=["id", "old", "new", "expected"])
+    new = compute_completion(df)
+    old = _text(df, "completion")
+    diff = (old.str.strip() != new).to_numpy()
+    return pd.DataFrame({"id": df["id"].to_numpy()[diff], "old": old[diff].to_numpy(),
+                         "new": new[diff].to_numpy(), "expected": _text(df, "updated_at")[diff].to_numpy()})
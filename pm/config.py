@@ -0,0 +1,54 @@
+"""共用設定：狀態（中英文對照 / 顏色）、分區、工序欄、顯示欄位、本機快取目錄"""
+import os
+from pathlib import Path
+
+# 本機快取目錄：字型子集、寫入佇列、本機副本、日期遷移進度都放這裡（PM_CACHE_DIR 可改位置）
+CACHE_DIR = Path(os.environ.get("PM_CACHE_DIR", Path.home() / ".cache" / "pm-system"))
+
+# ── 狀態設定（中英文對照）──────────────────────────────────
+STATUS_CONFIG = {
+    "in_progress": {"label":"製作中","icon":"⚙", "bg":"#FFFF99","btn":"#e6c800","text":"#000"},
+    "pending":     {"label":"待交站","icon":"📦","bg":"#CCE8FF","btn":"#2196f3","text":"#fff"},
+    "not_started": {"label":"未開始","icon":"⏳","bg":"#FFFFFF","btn":"#90a4ae","text":"#fff"},
+    "suspended":   {"label":"停工",  "icon":"⏸","bg":"#FFE0B2","btn":"#ff7043","text":"#fff"},
+    "completed":   {"label":"已交站","icon":"✅","bg":"#F0F0F0","btn":"#757575","text":"#fff"},
+}
+# 中文標籤 ↔ 英文 key 對照
+STATUS_ZH_TO_KEY = {v["label"]: k for k, v in STATUS_CONFIG.items()}
+STATUS_KEY_TO_ZH = {k: v["label"] for k, v in STATUS_CONFIG.items()}
+STATUS_ZH_OPTIONS = [""] + [v["label"] for v in STATUS_CONFIG.values()]
+
+SECTIONS = ["主要工程", "偉鴻", "材料案"]
+YEAR_OPTIONS  = ["","114","115","116"]
+PROCESS_COLS  = ["drawing","pipe_support","welding","nde","sandblast","assembly","painting","pressure_test","handover"]
+PROCESS_NAMES = ["製造圖面","管撐製作","點焊","焊道NDE","噴砂","組立*","噴漆","試壓","交站"]
+DISPLAY_COLS  = ["status","completion","materials","case_no","project_name","client",
+                 "tracking","drawing","pipe_support","welding","nde","sandblast",
+                 "assembly","painting","pressure_test","handover","handover_year","contact"]
+COL_DISPLAY_NAMES = {
+    "status":"施工順序","completion":"完成率","materials":"備料",
+    "case_no":"案號","project_name":"工程名稱","client":"業主",
+    "tracking":"備註","drawing":"製造圖面","pipe_support":"管撐製作",
+    "welding":"點焊","nde":"焊道NDE","sandblast":"噴砂",
+    "assembly":"組立*","painting":"噴漆","pressure_test":"試壓",
+    "handover":"交站","handover_year":"年份","contact":"對應窗口",
+}
+# 會標紅字的欄位（可能寫日期的文字欄）
+WEEK_COLS = ["status","completion","materials","tracking","drawing","pipe_support","welding",
+             "nde","sandblast","assembly","painting","pressure_test","handover","contact"]
+
+# 文字欄：None/nan → 空字串；分類欄：category dtype
+CATEGORY_COLS = ["section", "status_type", "handover_year"]
+
+
+def dt_col(col: str) -> str:
+    """工序日期欄對應的已解析欄名"""
+    return f"_dt_{col}"
+
+
+def date_col(col: str) -> str:
+    """工序日期欄在資料庫裡對應的 date 型別欄（由 pm/migrate_dates.py 補齊）"""
+    return f"{col}_date"
+
+# 資料庫有這些欄時，讀取以它為準（不必再猜 M/D 的年份），寫入時文字欄與 date 欄一起更新
+DATE_COLS = [date_col(c) for c in PROCESS_COLS]
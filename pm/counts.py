@@ -0,0 +1,79 @@
+"""
+件數彙總：每個（分區, 狀態, 交站年份）的件數與本週更新件數，一張小表就能畫統計卡、狀態按鈕與分區標籤。
+快照已載入時由快照算；冷啟動時改向資料庫的 project_counts RPC（見 README）要，
+不必等整張 projects 下載完就能先顯示標題與按鈕。RPC 結果保留 COUNTS_TTL 秒。
+"""
+import time
+import threading
+from datetime import datetime
+
+import pandas as pd
+
+COUNTS_RPC = "project_counts"
+COUNTS_TTL = 30   # 秒
+COUNT_KEYS = ["section", "status_type", "handover_year"]
+COUNT_COLS = [*COUNT_KEYS, "n", "n_week"]
+
+
+def count_table(df: pd.DataFrame, since: datetime) -> pd.DataFrame:
+    """由快照算：COUNT_KEYS 分組的件數 n，以及 updated_at ≥ since 的件數 n_week"""
+    if df.empty:
+        return pd.DataFrame(columns=COUNT_COLS)
+    keys = pd.DataFrame({c: df[c].astype(str) if c in df.columns else "" for c in COUNT_KEYS}, index=df.index)
+    week = pd.Series(False, index=df.index)
+    if "updated_at" in df.columns:
+        ts = pd.to_datetime(df["updated_at"], errors="coerce", utc=True, format="ISO8601").dt.tz_localize(None)
+        week = ts >= pd.Timestamp(since)
+    return (keys.assign(n=1, n_week=week.astype(int))
+                .groupby(COUNT_KEYS, sort=False, as_index=False)[["n", "n_week"]].sum())
+
+
+def status_totals(table: pd.DataFrame) -> dict:
+    """{status_type: 件數}（統計卡 / 狀態按鈕用）"""
+    return {k: int(v) for k, v in table.groupby("status_type")["n"].sum().items()}
+
+
+def section_summary(table: pd.DataFrame, section: str, statuses=(), year: str = "全部年份") -> tuple:
+    """
+    分區標籤：（{status_type: 件數}, 本週更新件數）；篩選條件與 filter_rows 相同
+    （year：全部年份 / 未填年份 / 年份字串）
+    """
+    t = table[table["section"] == section]
+    if statuses:
+        t = t[t["status_type"].isin(list(statuses))]
+    if year != "全部年份":
+        t = t[t["handover_year"] == ("" if year == "未填年份" else year)]
+    return status_totals(t), int(t["n_week"].sum())
+
+
+class ServerCounts:
+    """資料庫端彙總（一次 RPC）＋ 短 TTL 快取；資料庫沒有這個 function 時 get() 回傳 None"""
+
+    def __init__(self, db, ttl: float = COUNTS_TTL):
+        self.db = db
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.ok = None          # None = 還沒試過；False = 資料庫沒有這個 function
+        self.cached = {}        # since → (取得時間, 表)
+
+    def get(self, since: datetime):
+        if self.ok is False: return None
+        key = since.isoformat()
+        with self.lock:
+            hit = self.cached.get(key)
+            if hit and time.monotonic() - hit[0] < self.ttl:
+                return hit[1]
+        try:
+            rows = self.db.read(self.db.rpc(COUNTS_RPC, {"p_since": key}, op="count")).data or []
+        except Exception as e:
+            # 沒有這個 function → 之後不再試；其他錯誤（逾時等）這次先回 None，由呼叫端改用快照
+            if not self.ok and (COUNTS_RPC in str(e) or "PGRST202" in str(e)):
+                self.ok = False
+            return None
+        self.ok = True
+        table = pd.DataFrame(rows, columns=COUNT_COLS)
+        table[COUNT_KEYS] = table[COUNT_KEYS].fillna("").astype(str)
+        table[["n", "n_week"]] = table[["n", "n_week"]].fillna(0).astype(int)
+        with self.lock:
+            self.cached = {key: (time.monotonic(), table)}   # 只留本週這一份
+        return table
@@ -0,0 +1,387 @@
+"""
+資料層：projects 分頁載入、欄位正規化（工序日期一次解析）、process 共用的快照與增量同步
+"""
+import time
+import threading
+from datetime import datetime, timedelta
+from collections import deque
+from concurrent.futures import as_completed
+
+import pandas as pd
+
+from pm.config import PROCESS_COLS, CATEGORY_COLS, dt_col, date_col
+
+PAGE_SIZE = 500   # 每頁筆數（須 ≤ PostgREST 的 Max Rows）
+
+# ── 欄位正規化（每頁只做一次）──────────────────────────────
+# 文字欄：None/nan → 空字串；分類欄：category dtype；
+# 9 個工序日期欄另存解析好的 datetime64 到 _dt_<欄名>，之後的篩選 / 統計 / 圖表都直接用它；
+# 資料庫已有 date 型別欄（<欄名>_date）的列直接採用，只有還沒補齊的格子才解析文字
+_NULL_STRS    = {"None":"","nan":"","NaN":"","none":""}
+
+def parse_process_dates(s: pd.Series, now=None) -> pd.Series:
+    """
+    整欄解析工序日期 → datetime64（無法解析 = NaT）
+    - YYYY/MM/DD、YYYY-MM-DD：直接用
+    - M/D：跨年判斷，日期晚於 now → 算前一年（例如現在2月，12/23 → 去年12/23）；
+      now 可以是單一時間（預設現在），也可以是與 s 同 index 的 datetime Series（逐列各自的基準日）
+    - 其他含 4 位數年份的寫法才交給 pd.to_datetime
+    """
+    if isinstance(now, pd.Series):
+        ny, nm, nd = now.dt.year, now.dt.month, now.dt.day
+    else:
+        now = now or datetime.now()
+        ny, nm, nd = now.year, now.month, now.day
+    s    = s.astype(str)
+    full = s.str.extract(r"(\d{4})[/-](\d{1,2})[/-](\d{1,2})").astype(float)
+    md   = s.str.extract(r"(?<!\d)(\d{1,2})/(\d{1,2})").astype(float)
+    mo, dy = md[0], md[1]
+    md_year = ny - ((mo > nm) | ((mo == nm) & (dy > nd))).astype(int)
+    out = pd.to_datetime(pd.DataFrame({"year": full[0], "month": full[1], "day": full[2]}), errors="coerce")
+    out = out.fillna(pd.to_datetime(pd.DataFrame({"year": md_year.where(mo.notna()), "month": mo, "day": dy}),
+                                    errors="coerce"))
+    rest = out.isna() & s.str.contains(r"\d{4}", regex=True)
+    if rest.any():
+        out[rest] = pd.to_datetime(s[rest], errors="coerce", format="mixed")
+    return out.astype("datetime64[ns]")
+
+def _normalize_page(rows: list) -> pd.DataFrame:
+    """單頁原始資料 → 整張表一次轉字串 + 工序日期解析"""
+    df = pd.DataFrame(rows)
+    if df.empty: return df
+    df = df.astype(object).where(df.notna(), "").astype(str).replace(_NULL_STRS)
+    now = datetime.now()
+    for c in PROCESS_COLS:
+        if c not in df.columns: continue
+        if date_col(c) in df.columns:
+            dt   = pd.to_datetime(df[date_col(c)], errors="coerce", format="%Y-%m-%d").astype("datetime64[ns]")
+            dt   = dt.where(df[c] != "")          # 文字欄清空 = 沒有日期
+            need = dt.isna() & (df[c] != "")
+            if need.any():
+                dt[need] = parse_process_dates(df.loc[need, c], now)
+            df[dt_col(c)] = dt
+        else:
+            df[dt_col(c)] = parse_process_dates(df[c], now)
+    return df
+
+def _fetch_keyset(db, after: int, page_size: int) -> list:
+    """抓 id > after 的下一頁（依 id 排序）"""
+    return db.read(db.table("projects", "bulk").select("*").gt("id", after)
+                   .order("id").limit(page_size)).data or []
+
+def _sort_projects(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    合併後的收尾：分類欄轉 category；與原本 order("case_no", desc=True) 相同排序
+    （空白案號排最前，其餘由大到小）；重編 _order
+    """
+    if df.empty or "case_no" not in df.columns: return df
+    df = df.astype({c: "category" for c in CATEGORY_COLS if c in df.columns})
+    df = (df.drop(columns="_order", errors="ignore")
+            .assign(_blank=df["case_no"]=="")
+            .sort_values(["_blank","case_no"], ascending=[False, False], kind="stable")
+            .drop(columns="_blank").reset_index(drop=True))
+    # 固定顯示順序欄（新增的排最上面 = 序號最小）
+    df.insert(0, "_order", range(1, len(df)+1))
+    return df
+
+def fetch_projects(db, adb, page_size: int = PAGE_SIZE) -> pd.DataFrame:
+    """
+    分頁抓取整張 projects 表，每頁到達就先正規化，最後合併成一個 DataFrame。
+    - id 連續時：切成 [lo, lo+page_size) 區間，由非同步連線池（adb）同時抓取
+    - id 很稀疏時（大量刪除過）：改用 id > last 的 keyset 逐頁抓，避免一堆空區間
+    載入統計（筆數 / 頁數 / 秒數）放在 df.attrs["load_stats"]。
+    """
+    t0 = time.perf_counter()
+    pages = []
+    res_lo, res_hi = adb.gather([
+        adb.table("projects", "count").select("id", count="exact").order("id").limit(1),
+        adb.table("projects", "count").select("id").order("id", desc=True).limit(1),
+    ])
+    total = res_lo.count or 0
+    if res_lo.data and res_hi.data:
+        lo, hi = int(res_lo.data[0]["id"]), int(res_hi.data[0]["id"])
+        if hi - lo + 1 <= max(total, 1) * 4:
+            # 各區間查詢一次全部送出（在途數由連線池限制），每頁到達就先正規化
+            futures = [adb.submit(adb.table("projects", "bulk").select("*")
+                                 .gte("id", a).lt("id", min(a + page_size, hi + 1)))
+                       for a in range(lo, hi + 1, page_size)]
+            for fut in as_completed(futures):
+                rows = fut.result().data
+                if rows: pages.append(_normalize_page(rows))
+        else:
+            after = lo - 1
+            while True:
+                rows = _fetch_keyset(db, after, page_size)
+                if not rows: break
+                pages.append(_normalize_page(rows))
+                after = int(rows[-1]["id"])
+                if len(rows) < page_size: break
+
+    df = _sort_projects(pd.concat(pages, ignore_index=True) if pages else pd.DataFrame())
+    df.attrs["load_stats"] = {
+        "rows": len(df), "total": total, "pages": len(pages),
+        "seconds": round(time.perf_counter() - t0, 2),
+    }
+    return df
+
+# ── 增量同步快照 ──────────────────────────────────────────
+# 整個 server process 共用一份 projects 快照：
+#   - 第一次 / 每 FULL_RESYNC_SEC 秒：完整分頁載入
+#   - 其餘每 SYNC_INTERVAL 秒最多一次：只抓 updated_at > 高水位 的列，依 id 合併
+#   - 同時查總筆數（head count）；與本地筆數不符才比對 id 清單，抓出被刪除 / 漏掉的列
+#   - 變更訂閱（pm/realtime.py）連線中：別人的修改由事件直接套用，不再定時輪詢
+SYNC_INTERVAL   = 15
+CHANGE_LOG_SIZE = 256    # 記住最近幾次版本變動了哪些 id，各 session 據此判斷要不要重跑
+FULL_RESYNC_SEC = 1800
+SYNC_OVERLAP    = timedelta(seconds=30)   # 高水位往回重疊一點，避免晚 commit 的交易漏抓
+
+def _max_updated_at(df: pd.DataFrame):
+    if df.empty or "updated_at" not in df.columns: return None
+    ts = pd.to_datetime(df["updated_at"], errors="coerce", utc=True, format="ISO8601").max()
+    return None if pd.isna(ts) else ts
+
+def _fetch_all_ids(db, page_size: int = PAGE_SIZE) -> set:
+    """只抓 id 欄（keyset 分頁），用來偵測刪除"""
+    ids, after = set(), None
+    while True:
+        q = db.table("projects", "bulk").select("id").order("id").limit(page_size)
+        if after is not None: q = q.gt("id", after)
+        rows = db.read(q).data or []
+        ids.update(int(r["id"]) for r in rows)
+        if len(rows) < page_size: return ids
+        after = int(rows[-1]["id"])
+
+def _changed_rows(df: pd.DataFrame, delta: pd.DataFrame) -> pd.DataFrame:
+    """去掉與快照內容完全相同的列（高水位重疊區會重複抓到）"""
+    if df.empty or delta.empty: return delta
+    cols = [c for c in delta.columns if c != "id" and not c.startswith("_")]
+    old  = (df.drop_duplicates("id").set_index("id").reindex(index=delta["id"], columns=cols)
+              .astype(object).fillna("\x00"))
+    same = (old.to_numpy() == delta[cols].to_numpy()).all(axis=1)
+    return delta[~same]
+
+def _merge_rows(df: pd.DataFrame, rows: pd.DataFrame) -> pd.DataFrame:
+    """依 id 以 rows 取代 / 新增到 df（順序之後由 _sort_projects 重排）"""
+    keep = df[~df["id"].isin(rows["id"])] if not df.empty else df
+    return pd.concat([keep.drop(columns="_order", errors="ignore"), rows], ignore_index=True)
+
+class ProjectStore:
+    """
+    process 共用的 projects 快照；df 只整個替換、不原地修改，各 session 可安全共用。
+    db / adb 為 pm/db.py 的同步 / 非同步連線池（或測試用的替身）。
+    """
+
+    def __init__(self, db, adb, page_size: int = PAGE_SIZE):
+        self.db, self.adb, self.page_size = db, adb, page_size
+        self.lock      = threading.Lock()
+        self.df        = pd.DataFrame()
+        self.hwm       = None    # 已同步到的最大 updated_at（UTC）
+        self.version   = 0       # 資料每變動一次 +1
+        self.synced_at = 0.0
+        self.full_at   = 0.0
+        self.force_ids = False
+        self.refetch_ids = set()   # 快照內容可能與資料庫不同的列（寫入佇列裡失敗 / 放棄的修改），下次同步重抓
+        self.last_sync = {}
+        self.feed      = None    # 變更訂閱（ChangeFeed），連線中就不必輪詢
+        self.replica   = None    # 本機副本（pm/replica.py），冷啟動 / 離線時先用它
+        self.reconciling = False
+        self.changes   = deque(maxlen=CHANGE_LOG_SIZE)   # (版本, 變動的 id 集合；None = 整張重載)
+        # 命中（不用連線）/ 增量同步 / 寫入後修補 / 即時事件 / 完整載入 次數
+        self.stats     = {"hit": 0, "delta": 0, "patch": 0, "live": 0, "full": 0}
+
+    def get(self) -> pd.DataFrame:
+        if self.reconciling:
+            # 冷啟動正在背景對帳：先給本機副本的資料，不等網路
+            self.stats["hit"] += 1
+            return self.df
+        with self.lock:
+            now = time.monotonic()
+            if not self.full_at and self.df.empty and self.replica is not None and self._load_replica():
+                self.reconciling = True
+                threading.Thread(target=self._reconcile, daemon=True, name="pm-reconcile").start()
+            elif not self.full_at or now - self.full_at > FULL_RESYNC_SEC:
+                self._full_load()
+            elif now - self.synced_at <= SYNC_INTERVAL or (self.synced_at and self.live):
+                self.stats["hit"] += 1
+            else:
+                try:
+                    self._delta_sync()
+                except Exception as e:
+                    # 增量失敗（例如缺 updated_at 欄）→ 改完整載入；再失敗就沿用舊快照，下次再試
+                    try:
+                        self._full_load()
+                    except Exception:
+                        self.synced_at = now
+                        self.last_sync = {"kind": "error", "error": str(e)}
+            return self.df
+
+    def mark_stale(self, check_ids: bool = False):
+        """下一次 get() 立即做增量同步（重新整理按鈕）"""
+        with self.lock:
+            self.synced_at = 0.0
+            self.force_ids = self.force_ids or check_ids
+
+    def refetch(self, ids):
+        """
+        這些列已先樂觀套用到快照、但修改最後沒有寫入（送出失敗 / 被放棄）：
+        下一次 get() 立即同步，並依 id 重抓資料庫目前的內容蓋回（增量同步只看 updated_at，抓不到它們）
+        """
+        ids = {str(i) for i in ids if i is not None}
+        if not ids: return
+        with self.lock:
+            self.refetch_ids |= ids
+            self.synced_at = 0.0
+
+    @property
+    def live(self) -> bool:
+        return self.feed is not None and self.feed.connected
+
+    def apply_saved(self, rows: list, deleted_ids=(), source: str = "patch"):
+        """
+        寫入成功後（或收到變更事件時），把列直接修補進快照、版本 +1，不重新載入。
+        與快照內容相同的列（例如自己剛存的列又從事件收到）略過，沒有實際變動就不升版本。
+        高水位不動：別人在這段時間寫入的列，下次增量同步仍會抓到。
+        """
+        if not rows and not deleted_ids: return
+        with self.lock:
+            df, changed = self.df, set()
+            if rows:
+                delta = _changed_rows(df, _normalize_page(rows))
+                if not delta.empty:
+                    df = _merge_rows(df, delta)
+                    changed |= set(delta["id"])
+            if deleted_ids and not df.empty:
+                gone = {str(i) for i in deleted_ids} & set(df["id"])
+                df = df[~df["id"].isin(gone)]
+                changed |= gone
+            if changed:
+                self._replace(_sort_projects(df), advance_hwm=False, changed=changed)
+            self.stats[source] += 1
+
+    def changed_since(self, version: int):
+        """version 之後變動過的 id；中間有整張重載或記錄已被擠掉 → None（視為全部都變了）"""
+        with self.lock:
+            if version >= self.version: return set()
+            entries = [(v, ids) for v, ids in self.changes if v > version]
+        if len(entries) < self.version - version or any(ids is None for _, ids in entries):
+            return None
+        return set().union(*(ids for _, ids in entries))
+
+    def _replace(self, df: pd.DataFrame, advance_hwm: bool = True, changed=None, persist: bool = True):
+        if advance_hwm:
+            self.hwm = _max_updated_at(df)
+        self.version += 1
+        df.attrs["version"] = self.version   # 每份快照帶著自己的版本，衍生快取用它當 key
+        self.df = df
+        self.changes.append((self.version, frozenset(changed) if changed is not None else None))
+        if persist and self.replica is not None:
+            if changed is None:
+                self.replica.replace_all(df, self.hwm, self.version)
+            else:
+                present = df[df["id"].isin(changed)] if not df.empty else df
+                self.replica.apply(present, set(changed) - set(present.get("id", ())), self.hwm, self.version)
+
+    def _load_replica(self) -> bool:
+        """本機副本 → 快照（版本照常 +1）；副本是空的回傳 False"""
+        t0 = time.perf_counter()
+        try:
+            raw, hwm = self.replica.load()
+        except Exception:
+            return False
+        if raw.empty: return False
+        self._replace(_sort_projects(_normalize_page(raw)), advance_hwm=False, persist=False)
+        self.hwm = pd.Timestamp(hwm) if hwm else None
+        self.full_at, self.synced_at, self.force_ids = time.monotonic(), 0.0, True
+        self.last_sync = {"kind": "replica", "rows": len(self.df), "seconds": round(time.perf_counter() - t0, 2)}
+        return True
+
+    def _reconcile(self):
+        """背景對帳：副本高水位之後的變動做增量同步（含 id 比對抓刪除）；失敗就繼續用副本，之後照常重試"""
+        try:
+            with self.lock:
+                try:
+                    self._delta_sync()
+                except Exception as e:
+                    try:
+                        self._full_load()
+                    except Exception:
+                        self.synced_at = time.monotonic()
+                        self.last_sync = {"kind": "error", "error": str(e)}
+        finally:
+            self.reconciling = False
+
+    def _full_load(self):
+        df = fetch_projects(self.db, self.adb, self.page_size)
+        self._replace(df)
+        self.stats["full"] += 1
+        self.full_at = self.synced_at = time.monotonic()
+        self.force_ids = False
+        self.refetch_ids.clear()
+        self.last_sync = {"kind": "full", **df.attrs.get("load_stats", {})}
+
+    def _delta_sync(self):
+        t0 = time.perf_counter()
+        db = self.adb
+        q = db.table("projects").select("*").order("updated_at").limit(self.page_size)
+        if self.hwm is not None:
+            q = q.gt("updated_at", (self.hwm - SYNC_OVERLAP).isoformat())
+        res_rows, res_count = db.gather([q, db.table("projects", "count").select("id", count="exact", head=True)])
+        rows, remote_n = res_rows.data or [], res_count.count
+        if len(rows) >= self.page_size:
+            # 變動太多，直接完整重載比較快
+            self._full_load(); return
+
+        df = self.df
+        changed, ids = 0, set()
+        if rows:
+            delta = _changed_rows(df, _normalize_page(rows))
+            changed = len(delta)
+            if changed:
+                df = _merge_rows(df, delta)
+                ids |= set(delta["id"])
+
+        removed = 0
+        if self.force_ids or (remote_n is not None and remote_n != len(df)):
+            remote_ids = _fetch_all_ids(self.db, self.page_size)
+            local_ids  = set(df["id"].astype(int)) if not df.empty else set()
+            gone    = local_ids - remote_ids
+            missing = remote_ids - local_ids
+            if gone:
+                df = df[~df["id"].astype(int).isin(gone)]
+                removed = len(gone)
+                ids |= {str(i) for i in gone}
+            if missing:
+                extra, want = [], sorted(missing)
+                for i in range(0, len(want), self.page_size):
+                    extra += self.db.read(self.db.table("projects", "bulk").select("*")
+                                          .in_("id", want[i:i+self.page_size])).data or []
+                if extra:
+                    df = _merge_rows(df, _normalize_page(extra))
+                    changed += len(extra)
+                    ids |= {str(r["id"]) for r in extra}
+            self.force_ids = False
+
+        if self.refetch_ids:
+            want = sorted(self.refetch_ids, key=int)
+            server = []
+            for i in range(0, len(want), self.page_size):
+                server += self.db.read(self.db.table("projects", "bulk").select("*")
+                                       .in_("id", want[i:i+self.page_size])).data or []
+            fresh = _changed_rows(df, _normalize_page(server)) if server else pd.DataFrame()
+            if not fresh.empty:
+                df = _merge_rows(df, fresh)
+                changed += len(fresh)
+                ids |= set(fresh["id"])
+            gone = (set(want) - {str(r["id"]) for r in server}) & (set(df["id"]) if not df.empty else set())
+            if gone:   # 資料庫裡已經沒有這筆
+                df = df[~df["id"].isin(gone)]
+                removed += len(gone)
+                ids |= gone
+            self.refetch_ids -= set(want)
+
+        if changed or removed:
+            self._replace(_sort_projects(df), changed=ids)
+        self.synced_at = time.monotonic()
+        self.stats["delta"] += 1
+        self.last_sync = {"kind": "delta", "rows": changed, "removed": removed,
+                          "seconds": round(time.perf_counter() - t0, 2)}
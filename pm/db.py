@@ -0,0 +1,133 @@
+"""
+Supabase（PostgREST）連線層：整個 process 共用一個連線池（keep-alive，有 h2 套件就用 HTTP/2 多工），
+依操作種類給不同逾時；冪等的讀取遇到連線錯誤 / 逾時會加隨機抖動重試，寫入不重試（交給 outbox）。
+AsyncSupabasePool 在自己的 event loop thread 上跑，submit() 回傳一般的 Future，
+讓載入器一次丟出多頁查詢、在同一個連線池上並行。
+"""
+import time
+import random
+import importlib.util
+import asyncio
+import threading
+
+import httpx
+from postgrest import SyncPostgrestClient, AsyncPostgrestClient
+from postgrest.constants import DEFAULT_POSTGREST_CLIENT_HEADERS
+
+# 各操作的逾時（秒）：count = head 計數、read = 一般查詢、bulk = 整頁載入、write = 寫入 / RPC
+OP_TIMEOUTS    = {"count": 5, "read": 10, "bulk": 30, "write": 20}
+MAX_CONNECTIONS = 20
+KEEPALIVE_SEC  = 60
+READ_RETRIES   = (0.2, 0.5, 1.5)   # 每次重試前等 0 ~ 2×此秒數（full jitter），錯開同時失敗的 session
+RETRY_ERRORS   = (httpx.TransportError,)   # 連不上 / 逾時 / 連線中斷；API 回錯（4xx/5xx 內容）不重試
+
+
+def http2_available() -> bool:
+    return importlib.util.find_spec("h2") is not None
+
+
+def _jitter(base: float) -> float:
+    return random.uniform(0, base * 2)
+
+
+class _BasePool:
+    def __init__(self, url: str, key: str, schema: str = "public", timeouts: dict = None,
+                 max_connections: int = MAX_CONNECTIONS, http2: bool = None):
+        self.rest_url = f"{url.rstrip('/')}/rest/v1"
+        self.schema = schema
+        self.headers = {**DEFAULT_POSTGREST_CLIENT_HEADERS, "apikey": key, "Authorization": f"Bearer {key}"}
+        self.timeouts = {**OP_TIMEOUTS, **(timeouts or {})}
+        self.http2 = http2_available() if http2 is None else http2
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections,
+                                   keepalive_expiry=KEEPALIVE_SEC)
+        self.stats = {"retries": 0, "errors": 0}
+
+    def _timeout(self, op: str) -> httpx.Timeout:
+        return httpx.Timeout(self.timeouts.get(op, self.timeouts["read"]), connect=min(5, self.timeouts["read"]))
+
+
+class SupabasePool(_BasePool):
+    """
+    同步版：table(name, op) / rpc(fn, params, op) 用法與 supabase Client 相同；
+    每種 op 一個 PostgREST client，共用同一個 transport（同一組連線），只差在逾時。
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.transport = httpx.HTTPTransport(http2=self.http2, limits=self.limits)
+        self.clients = {op: self._client(op) for op in self.timeouts}
+
+    def _client(self, op: str) -> SyncPostgrestClient:
+        pg = SyncPostgrestClient(self.rest_url, schema=self.schema, headers=self.headers)
+        headers = pg.session.headers
+        pg.session.close()
+        pg.session = httpx.Client(base_url=self.rest_url, headers=headers, transport=self.transport,
+                                  timeout=self._timeout(op), follow_redirects=True)
+        return pg
+
+    def table(self, name: str, op: str = "read"):
+        return self.clients.get(op, self.clients["read"]).from_(name)
+
+    def rpc(self, fn: str, params: dict, op: str = "write"):
+        return self.clients.get(op, self.clients["write"]).rpc(fn, params)
+
+    def read(self, query):
+        """執行冪等的查詢；連線錯誤 / 逾時依 READ_RETRIES 退避重試，最後一次仍失敗就丟出"""
+        for delay in (*READ_RETRIES, None):
+            try:
+                return query.execute()
+            except RETRY_ERRORS:
+                if delay is None:
+                    self.stats["errors"] += 1
+                    raise
+                self.stats["retries"] += 1
+                time.sleep(_jitter(delay))
+
+
+class AsyncSupabasePool(_BasePool):
+    """
+    非同步版：連線池綁在自己的 event loop 上（背景 thread 常駐），
+    table(...) 組好的查詢交給 submit() → concurrent.futures.Future，同步程式碼照常 result() / as_completed()。
+    """
+
+    def __init__(self, *args, max_inflight: int = MAX_CONNECTIONS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.inflight = asyncio.Semaphore(max_inflight)   # 同時在途的查詢數上限
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, daemon=True, name="pm-db-async").start()
+        self.transport = httpx.AsyncHTTPTransport(http2=self.http2, limits=self.limits)
+        self.clients = {op: self._client(op) for op in self.timeouts}
+
+    def _client(self, op: str) -> AsyncPostgrestClient:
+        pg = AsyncPostgrestClient(self.rest_url, schema=self.schema, headers=self.headers)
+        headers = pg.session.headers
+        # 它自己建的 client 用不到：在連線池的 loop 上關掉（同步版同樣先 close），不然每種 op 漏一個
+        asyncio.run_coroutine_threadsafe(pg.session.aclose(), self.loop).result()
+        pg.session = httpx.AsyncClient(base_url=self.rest_url, headers=headers, transport=self.transport,
+                                       timeout=self._timeout(op), follow_redirects=True)
+        return pg
+
+    def table(self, name: str, op: str = "read"):
+        return self.clients.get(op, self.clients["read"]).from_(name)
+
+    async def read(self, query):
+        for delay in (*READ_RETRIES, None):
+            try:
+                async with self.inflight:
+                    return await query.execute()
+            except RETRY_ERRORS:
+                if delay is None:
+                    self.stats["errors"] += 1
+                    raise
+                self.stats["retries"] += 1
+                await asyncio.sleep(_jitter(delay))
+
+    def submit(self, query):
+        """在連線池的 loop 上執行（含重試），立即回傳 Future"""
+        return asyncio.run_coroutine_threadsafe(self.read(query), self.loop)
+
+    def gather(self, queries: list) -> list:
+        """一次送出多個查詢並等全部完成，結果依原順序"""
+        async def _all():
+            return await asyncio.gather(*(self.read(q) for q in queries))
+        return asyncio.run_coroutine_threadsafe(_all(), self.loop).result()
@@ -0,0 +1,257 @@
+"""
+編輯與寫入：data_editor 的變動 → 要送出的 updates / inserts / deletes（只含變動欄位 + 版本），
+以及實際寫入 Supabase 的批次函式（db 為 pm/db.py 的連線池，store 為 pm/data.py 的共用快照）
+"""
+from datetime import date, datetime
+
+import pandas as pd
+
+from pm.config import STATUS_ZH_TO_KEY, PROCESS_COLS, date_col
+from pm.completion import compute_completion
+from pm.data import parse_process_dates
+
+# 更新只送有變動的欄位，並帶上編輯前看到的 updated_at（_expected）：
+# 資料庫裡的版本已經不同（別人先存了）→ 不寫入，改列為衝突，讓使用者在合併畫面決定。
+# 一批更新由 save_projects RPC（見 README）一次送出；資料庫還沒建這個 function 時改逐筆條件更新。
+SAVE_RPC = "save_projects"
+# 新增的列帶著用戶端產生的 client_id（資料庫有 unique 限制，見 README）：
+# 逾時後重送時，其實已經寫入的那幾筆不會變成重複的案件
+INSERT_KEY = "client_id"
+
+# 不送進 Supabase 的前端欄位（id 單獨處理，不放這裡）
+NON_DB_COLS = {"🗑 刪除", "status_zh", "_order"}
+
+
+# ── data_editor 變動 → 寫入內容 ────────────────────────────
+def clean_val(v) -> str:
+    """任何值轉乾淨字串，None/nan → 空字串；date物件 → YYYY/MM/DD"""
+    if v is None: return ""
+    if isinstance(v, (date, datetime)):
+        return v.strftime("%Y/%m/%d")  # 存到 DB 保留完整年份，顯示由 DateColumn format 控制
+    if not isinstance(v, str):
+        try:
+            if pd.isna(v): return ""
+        except (TypeError, ValueError): pass
+    return "" if str(v) in ("None","nan","NaN","none") else str(v)
+
+def build_row_dict(sec: str, base_row: pd.Series, changes: dict, now_iso: str) -> dict:
+    """合併原始列與本次變動，回傳整列 dict（實際送出的欄位由 changed_cols 挑出）"""
+    merged = base_row.to_dict()
+    merged.update(changes)
+    row_dict = {}
+    for k, v in merged.items():
+        if k in NON_DB_COLS or k.startswith("_") or k == "id": continue   # id 另外處理；_ 開頭為前端衍生欄
+        row_dict[k] = clean_val(v)
+    row_dict["section"]    = sec
+    row_dict["updated_at"] = now_iso
+    # 中文狀態下拉 → 英文 status_type（changes 裡的 status_zh 優先）
+    zh_label = clean_val(changes.get("status_zh", merged.get("status_zh","")))
+    if zh_label in STATUS_ZH_TO_KEY:
+        row_dict["status_type"] = STATUS_ZH_TO_KEY[zh_label]
+    # 備援推斷（status_type 仍然空）
+    if not row_dict.get("status_type"):
+        s = row_dict.get("status","")
+        if "製作中" in s and "停工" not in s: row_dict["status_type"] = "in_progress"
+        elif "待交站" in s: row_dict["status_type"] = "pending"
+        elif "停工" in s:  row_dict["status_type"] = "suspended"
+        elif "已交站" in s or "交站" in s or row_dict.get("completion") == "100%": row_dict["status_type"] = "completed"
+        else: row_dict["status_type"] = "not_started"
+
+    # ── 自動計算完成率（規則見 pm/completion.py；刪除日期時同步降低）──
+    row_dict["completion"] = compute_completion(pd.DataFrame([row_dict])).iloc[0]
+    return row_dict
+
+def with_typed_dates(row: dict, now: datetime = None) -> dict:
+    """row 裡有的工序日期文字欄 → 一併帶上對應的 date 欄（YYYY-MM-DD；空白 / 無法解析 = None）"""
+    cols = [c for c in PROCESS_COLS if c in row]
+    if not cols: return row
+    parsed = parse_process_dates(pd.Series([clean_val(row[c]) for c in cols], index=cols), now)
+    return {**row, **{date_col(c): None if pd.isna(v) else v.strftime("%Y-%m-%d") for c, v in parsed.items()}}
+
+def changed_cols(base_row: pd.Series, changes: dict, row_dict: dict) -> dict:
+    """只留真的有變的欄：使用者改過的欄 ＋ 跟著重算的 status_type / completion"""
+    keys = {"status_type" if k == "status_zh" else k for k in changes} | {"status_type", "completion"}
+    return {k: row_dict[k] for k in keys
+            if k in row_dict and k not in ("section", "updated_at")
+            and row_dict[k] != clean_val(base_row.get(k, ""))}
+
+def editor_changes(sec: str, original_df: pd.DataFrame, editor_state: dict, now_iso: str = None) -> tuple:
+    """
+    處理 data_editor 的 session_state 格式：
+    {"edited_rows": {str(row_idx): {col: val}},
+     "added_rows":  [{col: val}],
+     "deleted_rows":[row_idx]}
+    回傳 (updates, inserts, deletes, bases, errors)；前三者格式同 write_batch，
+    bases = {id: 修改前的值}（合併畫面用），errors = [(說明, 例外)]
+    """
+    now_iso = now_iso or datetime.now().isoformat()
+    updates, inserts, deletes, bases, errors = [], [], [], {}, []
+    # 1. 修改的列（只送變動欄位，帶上編輯前的 updated_at 檢查有沒有人先改過）
+    for row_idx, changes in editor_state.get("edited_rows", {}).items():
+        try:
+            idx = int(row_idx)
+            if idx >= len(original_df): continue
+            base       = original_df.iloc[idx]
+            record_id  = clean_val(base.get("id",""))   # ← 直接從原始列取 id
+            if not record_id or record_id in ("","None"): continue
+            row_dict = build_row_dict(sec, base, changes, now_iso)
+            diff     = changed_cols(base, changes, row_dict)
+            if not diff: continue
+            bases[record_id] = {k: clean_val(base.get(k, "")) for k in diff}
+            updates.append((f"更新失敗 row {row_idx}",
+                            {"id": int(record_id), **diff, "_expected": clean_val(base.get("updated_at", ""))}))
+        except Exception as e:
+            errors.append((f"更新失敗 row {row_idx}", e))
+
+    # 2. 新增的列
+    for new_row in editor_state.get("added_rows", []):
+        try:
+            empty    = pd.Series({c: "" for c in original_df.columns})
+            row_dict = build_row_dict(sec, empty, new_row, now_iso)
+            row_dict.pop("id", None)
+            inserts.append((f"新增失敗 {row_dict.get('case_no','')}", row_dict))
+        except Exception as e:
+            errors.append(("新增失敗", e))
+
+    # 3. 刪除列（勾選🗑後由編輯區按鈕處理，這裡處理 data_editor 內建刪除）
+    for row_idx in editor_state.get("deleted_rows", []):
+        try:
+            idx       = int(row_idx)
+            record_id = clean_val(original_df.iloc[idx].get("id","")) if idx < len(original_df) else ""
+            if record_id and record_id not in ("","None"):
+                deletes.append((f"刪除失敗 row {row_idx}", int(record_id)))
+        except Exception as e:
+            errors.append((f"刪除失敗 row {row_idx}", e))
+    return updates, inserts, deletes, bases, errors
+
+
+# ── 批次寫入 ──────────────────────────────────────────────
+def save_rows_checked(db, rows: list, state: dict) -> list:
+    """
+    依 id 更新 rows 裡有給的欄位（_expected 不符的列略過）；回傳實際寫入後的列。
+    state = {"ok": None / True / False}：RPC 是否可用（process 共用，試過一次就記住）
+    """
+    if state["ok"] is not False:
+        try:
+            res = db.rpc(SAVE_RPC, {"p_rows": rows}).execute().data or []
+            state["ok"] = True
+            return res
+        except Exception as e:
+            if state["ok"] or (SAVE_RPC not in str(e) and "PGRST202" not in str(e)): raise
+            state["ok"] = False
+    out = []
+    for r in rows:
+        q = (db.table("projects", "write")
+             .update({k: v for k, v in r.items() if k not in ("id", "_expected")}).eq("id", r["id"]))
+        if r.get("_expected"): q = q.eq("updated_at", r["_expected"])
+        out += q.execute().data or []
+    return out
+
+def insert_rows(db, rows: list, state: dict) -> list:
+    """
+    新增 rows；有 client_id 的用 upsert(ignore_duplicates) 送，已經存在的（上次逾時但其實寫入了）
+    不再新增，改抓回資料庫裡的那一列。資料庫還沒有 client_id 欄 / unique 限制時拿掉它改一般 insert
+    （state["client_id"] 記住結果，process 共用）。回傳寫入後的列。
+    """
+    keyed = [r for r in rows if r.get(INSERT_KEY)]
+    if keyed and len(keyed) == len(rows) and state.get("client_id") is not False:
+        try:
+            out = (db.table("projects", "write")
+                   .upsert(rows, on_conflict=INSERT_KEY, ignore_duplicates=True).execute().data or [])
+            state["client_id"] = True
+        except Exception as e:
+            if state.get("client_id") or (INSERT_KEY not in str(e) and "42P10" not in str(e)): raise
+            state["client_id"] = False
+        else:
+            got = {str(r.get(INSERT_KEY)) for r in out}
+            dup = [r[INSERT_KEY] for r in rows if str(r[INSERT_KEY]) not in got]
+            if dup:
+                out += db.read(db.table("projects").select("*").in_(INSERT_KEY, dup)).data or []
+            return out
+    return (db.table("projects", "write")
+            .insert([{k: v for k, v in r.items() if k != INSERT_KEY} for r in rows]).execute().data or [])
+
+def already_saved(payload: dict, server: dict) -> bool:
+    """資料庫目前的值就是這次要寫的（逾時但其實已寫入，重送時版本對不上）→ 不算衝突"""
+    return server is not None and all(clean_val(server.get(k)) == clean_val(v)
+                                      for k, v in payload.items() if k not in ("id", "_expected"))
+
+def fetch_current(db, rows: list) -> dict:
+    """衝突的列抓最新內容（合併畫面要用，快照也順便更新）：{id: 列；已被刪除 = None}"""
+    server = db.read(db.table("projects").select("*").in_("id", [r["id"] for r in rows])).data or []
+    by_id = {str(r["id"]): r for r in server}
+    return {str(r["id"]): by_id.get(str(r["id"])) for r in rows}
+
+def write_batch(db, store, rpc_state: dict, updates: list, inserts: list, deletes: list) -> tuple:
+    """
+    每種操作各只送一次請求：
+      updates → 一次 save_rows_checked（只含變動欄位 + _expected 版本）
+      inserts → 一個 bulk insert
+      deletes → 一個 delete().in_("id", [...])
+    參數都是 [(失敗時顯示的說明, 內容)]；整批失敗時改逐筆重送，找出是哪幾筆出錯。
+    回傳 (成功筆數, [(說明, 錯誤)], [(說明, 我的變動, 資料庫目前的列；已被刪除 = None)])
+    寫入成功的列會直接修補進共用快照（store.apply_saved），不必整張表重抓。
+    """
+    saved, failures = 0, []
+    written, deleted, stale = [], [], []
+
+    def _send(items, send):
+        nonlocal saved
+        if not items: return
+        try:
+            saved += len(items) - (send([v for _, v in items]) or 0)
+            return
+        except Exception:
+            pass
+        for label, v in items:
+            try:
+                saved += 1 - (send([v]) or 0)
+            except Exception as e:
+                failures.append((label, e))
+
+    def _update(rows):
+        res = save_rows_checked(db, rows, rpc_state)
+        written.extend(res)
+        ok = {str(r["id"]) for r in res}
+        lost = [r for r in rows if str(r["id"]) not in ok]
+        stale.extend(lost)
+        return len(lost)
+    def _insert(rows):
+        written.extend(insert_rows(db, rows, rpc_state))
+    def _delete(ids):
+        db.table("projects", "write").delete().in_("id", ids).execute()
+        deleted.extend(ids)
+
+    _send(updates, _update)
+    _send(inserts, _insert)
+    _send(deletes, _delete)
+
+    conflicts = []
+    if stale:
+        server = fetch_current(db, stale)
+        written.extend(r for r in server.values() if r)
+        labels = {str(v["id"]): label for label, v in updates}
+        conflicts = [(labels.get(str(r["id"]), ""), r, server[str(r["id"])]) for r in stale]
+    store.apply_saved(written, deleted)
+    return saved, failures, conflicts
+
+def send_ops(db, store, rpc_state: dict, kind: str, payloads: list) -> tuple:
+    """寫入佇列（pm/outbox.py）的送出函式，在背景 thread 執行：回傳 (寫入後的列, [(payload, 資料庫目前的列)])"""
+    conflicts, deleted = [], []
+    if kind == "update":
+        written = save_rows_checked(db, payloads, rpc_state)
+        ok = {str(r["id"]) for r in written}
+        stale = [p for p in payloads if str(p["id"]) not in ok]
+        if stale:
+            server = fetch_current(db, stale)
+            written = written + [r for r in server.values() if r]
+            conflicts = [(p, server[str(p["id"])]) for p in stale
+                         if not already_saved(p, server[str(p["id"])])]
+    elif kind == "insert":
+        written = insert_rows(db, payloads, rpc_state)
+    else:
+        deleted = [p["id"] for p in payloads]
+        db.table("projects", "write").delete().in_("id", deleted).execute()
+        written = []
+    store.apply_saved(written, deleted)
+    return written, conflicts
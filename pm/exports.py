@@ -0,0 +1,155 @@
+"""匯出引擎：Excel（openpyxl 唯寫模式串流寫出）、PDF（fpdf2，直接輸出 bytes）"""
+from io import BytesIO
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# ── Excel 版面 ────────────────────────────────────────────
+XLSX_COL_NAMES = {
+    "status":"施工順序","completion":"完成率","materials":"備料",
+    "case_no":"案號","project_name":"工程名稱","client":"業主",
+    "tracking":"備註","drawing":"製造圖面","pipe_support":"管撐製作",
+    "welding":"點焊","nde":"焊道NDE","sandblast":"噴砂",
+    "assembly":"組立","painting":"噴漆","pressure_test":"試壓",
+    "handover":"交站","handover_year":"交站年份","contact":"對應窗口",
+}
+XLSX_BG = {
+    "in_progress":"FFFF99","pending":"CCE8FF",
+    "not_started":"FFFFFF","suspended":"FFE0B2","completed":"F0F0F0",
+}
+XLSX_COL_WIDTHS = {"project_name":35,"tracking":30,"case_no":14,"client":12,
+                   "contact":12,"status":14,"completion":8,"materials":8}
+XLSX_HEADER_BG = "1A3A5C"
+XLSX_WEEK_COLOR = "C62828"
+PROGRESS_EVERY = 500   # 每寫幾列回報一次進度
+
+
+def _register_styles(wb) -> dict:
+    """每種底色各一組具名樣式（一般 / 本週紅字），全部格子共用，不再逐格建 Font/Fill"""
+    from openpyxl.styles import NamedStyle, PatternFill, Font, Alignment, Border, Side
+    thin = Side(style="thin", color="AAAAAA")
+    border = Border(left=thin, right=thin, top=thin, bottom=thin)
+    align = Alignment(vertical="center", wrap_text=False)
+
+    head = NamedStyle(name="pm_head", font=Font(bold=True, color="FFFFFF", name="Arial"),
+                      fill=PatternFill("solid", fgColor=XLSX_HEADER_BG),
+                      alignment=Alignment(horizontal="center", vertical="center"), border=border)
+    wb.add_named_style(head)
+    styles = {"head": "pm_head"}
+    for key, bg in {**XLSX_BG, "": "FFFFFF"}.items():
+        for wk in (False, True):
+            name = f"pm_{key or 'none'}{'_wk' if wk else ''}"
+            font = (Font(name="Arial", size=10, bold=True, color=XLSX_WEEK_COLOR) if wk
+                    else Font(name="Arial", size=10))
+            wb.add_named_style(NamedStyle(name=name, font=font, border=border, alignment=align,
+                                          fill=PatternFill("solid", fgColor=bg)))
+            styles[(key, wk)] = name
+    return styles
+
+
+def _styled_cells(ws, styles: dict) -> dict:
+    """每個具名樣式先做一個樣板格，之後的格子只複製它的樣式索引"""
+    from openpyxl.cell import WriteOnlyCell
+    out = {}
+    for k, name in styles.items():
+        c = WriteOnlyCell(ws, value=None)
+        c.style = name
+        out[k] = c._style
+    return out
+
+
+def build_xlsx(sheets: list, cols: list, progress=None) -> bytes:
+    """sheets：[(工作表名, 資料 df, 本週命中 df)]；以欄為單位取值，逐列串流寫出，回傳檔案 bytes
+    progress(已完成列數, 總列數)：選填，背景匯出用來回報進度"""
+    import openpyxl
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.utils import get_column_letter
+
+    wb = openpyxl.Workbook(write_only=True)
+    styles = _register_styles(wb)
+    total, done = sum(len(ds) for _, ds, _ in sheets), 0
+
+    for title, ds, hits in sheets:
+        ws = wb.create_sheet(title=str(title)[:31])
+        for ci, col in enumerate(cols, 1):
+            ws.column_dimensions[get_column_letter(ci)].width = XLSX_COL_WIDTHS.get(col, 12)
+        ws.freeze_panes = "A2"
+        tpl = _styled_cells(ws, styles)
+
+        head = []
+        for col in cols:
+            c = WriteOnlyCell(ws, value=XLSX_COL_NAMES.get(col, col))
+            c._style = tpl["head"]
+            head.append(c)
+        ws.row_dimensions[1].height = 18
+        ws.append(head)
+
+        n = len(ds)
+        if not n: continue
+        # 欄陣列：值、是否本週；列陣列：狀態底色
+        values = [ds[c].astype(object).where(ds[c].notna(), "").astype(str).replace({"None": ""}).to_numpy()
+                  if c in ds.columns else np.full(n, "", dtype=object) for c in cols]
+        week = [(hits[c].reindex(ds.index).fillna("") != "").to_numpy()
+                if hits is not None and c in hits.columns else np.zeros(n, dtype=bool) for c in cols]
+        status = ds["status_type"].astype(str).to_numpy() if "status_type" in ds.columns else np.full(n, "")
+        status = np.where(pd.Series(status).isin(list(XLSX_BG)).to_numpy(), status, "")
+
+        for ri in range(n):
+            st_key = status[ri]
+            plain, red = tpl[(st_key, False)], tpl[(st_key, True)]
+            row = []
+            for ci in range(len(cols)):
+                c = WriteOnlyCell(ws, value=values[ci][ri])
+                c._style = red if week[ci][ri] else plain   # 唯寫格寫完即丟，樣式陣列可共用
+                row.append(c)
+            ws.append(row)
+            done += 1
+            if progress and done % PROGRESS_EVERY == 0: progress(done, total)
+
+    buf = BytesIO()
+    wb.save(buf)
+    return buf.getvalue()
+
+
+# ── PDF 版面（固定，不必每次匯出重建）────────────────────
+PDF_LAYOUT = [   # (欄位, 表頭, 寬度)
+    ("status","施工順序",20), ("completion","完成率",11), ("materials","備料",7),
+    ("case_no","案號",22), ("project_name","工程名稱",55), ("client","業主",13),
+    ("tracking","備註",30), ("drawing","製造圖面",13), ("pipe_support","管撐",11),
+    ("welding","點焊",18), ("nde","NDE",11), ("sandblast","噴砂",11), ("assembly","組立",11),
+    ("painting","噴漆",11), ("pressure_test","試壓",11), ("handover","交站",15),
+    ("handover_year","年份",9), ("contact","窗口",13),
+]
+PDF_BG = {"in_progress":(255,255,153),"pending":(204,232,255),
+          "not_started":(255,255,255),"suspended":(255,224,178),"completed":(240,240,240)}
+
+
+def render_pdf(blocks: list, font_path: Path, progress=None) -> bytes:
+    """依 PDF_LAYOUT 產生 A3 橫式 PDF，直接輸出成 bytes（不經暫存檔）
+    blocks：[{title, cells{欄: [文字]}, wk{欄: [是否本週]}, bg[(r,g,b)], n}]"""
+    from fpdf import FPDF
+    pdf = FPDF(orientation="L", format="A3")
+    pdf.set_auto_page_break(auto=True, margin=10)
+    pdf.add_font("ZH", "", str(font_path))
+    total, done = sum(b["n"] for b in blocks), 0
+    for b in blocks:
+        pdf.add_page()
+        pdf.set_font("ZH", size=13); pdf.set_text_color(10,35,80)
+        pdf.cell(0,9,b["title"], new_x="LMARGIN", new_y="NEXT"); pdf.ln(1)
+        pdf.set_font("ZH", size=7); pdf.set_fill_color(29,71,157); pdf.set_text_color(255,255,255)
+        for _, h, w in PDF_LAYOUT:
+            pdf.cell(w,7,h,border=1,fill=True,align="C")
+        pdf.ln(); pdf.set_font("ZH",size=6); pdf.set_text_color(30,30,30)
+        for i in range(b["n"]):
+            pdf.set_fill_color(*b["bg"][i])
+            for k, _, w in PDF_LAYOUT:
+                # 本週日期 → 紅字
+                is_wk = b["wk"][k][i]
+                if is_wk: pdf.set_text_color(198,40,40)
+                pdf.cell(w,6,b["cells"][k][i],border=1,fill=True)
+                if is_wk: pdf.set_text_color(30,30,30)
+            pdf.ln()
+            done += 1
+            if progress and done % PROGRESS_EVERY == 0: progress(done, total)
+    return bytes(pdf.output())
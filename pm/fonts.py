@@ -0,0 +1,106 @@
+"""PDF 中文字型：在本機找字型檔，依匯出用到的字做子集並快取在磁碟"""
+import os
+import uuid
+import hashlib
+from pathlib import Path
+
+from pm.config import CACHE_DIR
+
+# 依序找：設定 CJK_FONT → 專案 fonts/ → 系統字型（packages.txt 的 fonts-noto-cjk）→ 之前下載過的 → 最後才下載
+# 找到後只取這次匯出用到的字做成子集，依字集快取在磁碟，之後同樣內容的匯出直接用
+FONT_CACHE_DIR = CACHE_DIR / "fonts"
+FONT_SUBSET_KEEP = 50
+BUNDLED_FONT_DIR = Path(__file__).resolve().parent.parent / "fonts"
+SYSTEM_CJK_FONTS = [
+    "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/noto-cjk/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/google-noto-cjk/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/truetype/noto/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/truetype/wqy/wqy-microhei.ttc",
+    "/System/Library/Fonts/PingFang.ttc",
+    "C:/Windows/Fonts/msjh.ttc",
+]
+FONT_URLS = [
+    "https://cdn.jsdelivr.net/gh/googlefonts/noto-cjk@main/Sans/SubsetOTF/SC/NotoSansSC-Regular.otf",
+    "https://github.com/googlefonts/noto-cjk/raw/main/Sans/SubsetOTF/SC/NotoSansSC-Regular.otf",
+    "https://fonts.gstatic.com/ea/notosanstc/v1/NotoSansTC-Regular.otf",
+]
+
+def _font_ok(p: Path) -> bool:
+    return p.is_file() and p.stat().st_size > 100_000
+
+def _collection_face(path: Path) -> int:
+    """.ttc 字型集：優先挑繁中（TC）那一個字面"""
+    if path.suffix.lower() != ".ttc": return 0
+    try:
+        from fontTools.ttLib import TTCollection
+        for i, f in enumerate(TTCollection(str(path), lazy=True).fonts):
+            if " TC" in str(f["name"].getDebugName(1)): return i
+    except Exception: pass
+    return 0
+
+def resolve_cjk_font(preferred: str = None):
+    """回傳 (字型路徑, ttc 字面編號)；完全找不到且無法下載時回傳 None"""
+    candidates = []
+    if preferred: candidates.append(Path(preferred))
+    if BUNDLED_FONT_DIR.is_dir():
+        candidates += sorted(p for p in BUNDLED_FONT_DIR.iterdir() if p.suffix.lower() in (".otf",".ttf",".ttc"))
+    candidates += [Path(p) for p in SYSTEM_CJK_FONTS]
+    downloaded = FONT_CACHE_DIR / "NotoSansCJK-download.otf"
+    candidates.append(downloaded)
+    for p in candidates:
+        if _font_ok(p): return p, _collection_face(p)
+    # 最後手段：下載一次存進快取目錄（之後重開容器前都不必再下載）
+    FONT_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    import urllib.request
+    for url in FONT_URLS:
+        try:
+            tmp = downloaded.with_suffix(".part")
+            urllib.request.urlretrieve(url, tmp)
+            if _font_ok(tmp):
+                tmp.replace(downloaded)
+                return downloaded, 0
+            tmp.unlink()
+        except Exception: pass
+    return None
+
+def cjk_font_for(text: str, preferred: str = None):
+    """只含 text 用到的字的子集字型檔（依字集快取）；找不到字型回傳 None"""
+    found = resolve_cjk_font(preferred)
+    if not found: return None
+    src, face = found
+    chars = "".join(sorted(set(text) | set(" …")))
+    key = hashlib.sha1(f"{src}|{src.stat().st_size}|{face}|{chars}".encode()).hexdigest()[:20]
+    FONT_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    # 只認完成的檔名：別的 session 正在寫的 .part 暫存檔不能拿來用
+    for ext in (".otf", ".ttf"):
+        hit = FONT_CACHE_DIR / f"subset-{key}{ext}"
+        try:
+            os.utime(hit)   # 更新 mtime，清理時才是「最近用過」而不是「最近建立」
+            return hit
+        except OSError:
+            pass
+    from fontTools import subset
+    from fontTools.ttLib import TTFont
+    font = TTFont(str(src), fontNumber=face)
+    opts = subset.Options()
+    opts.name_IDs = ["*"]
+    opts.notdef_outline = True
+    sub = subset.Subsetter(opts)
+    sub.populate(text=chars)
+    sub.subset(font)
+    out = FONT_CACHE_DIR / f"subset-{key}{'.otf' if 'CFF ' in font else '.ttf'}"
+    tmp = out.with_name(out.name + f".{uuid.uuid4().hex[:6]}.part")
+    font.save(str(tmp))
+    tmp.replace(out)   # 原子替換，多個 session 同時匯出也安全
+    # 只留最近用過的幾份子集（不動別人正在寫的 .part）
+    olds = sorted((p for p in FONT_CACHE_DIR.glob("subset-*") if p.suffix in (".otf", ".ttf")),
+                  key=_mtime, reverse=True)
+    for p in olds[FONT_SUBSET_KEEP:]:
+        try: p.unlink()
+        except OSError: pass
+    return out
+
+def _mtime(p: Path) -> float:
+    try: return p.stat().st_mtime
+    except OSError: return 0.0   # 剛被別的 session 清掉
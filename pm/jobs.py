@@ -0,0 +1,77 @@
+"""背景匯出佇列：同樣的匯出（格式 + 篩選 + 資料版本）只做一次，做好的檔案留在記憶體給所有人共用"""
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ExportJob:
+    """一件匯出工作：狀態 queued → running → done / failed，進度以列數計"""
+
+    def __init__(self, key: tuple, filename: str, mime: str):
+        self.key, self.filename, self.mime = key, filename, mime
+        self.state = "queued"
+        self.done, self.total = 0, 0
+        self.data: bytes = None
+        self.error: str = ""
+        self.created, self.finished = time.time(), None
+
+    def progress(self, done: int, total: int):
+        self.done, self.total = done, total
+
+    @property
+    def fraction(self) -> float:
+        if self.state == "done": return 1.0
+        return min(self.done / self.total, 1.0) if self.total else 0.0
+
+    @property
+    def pending(self) -> bool:
+        return self.state in ("queued", "running")
+
+
+class ExportJobs:
+    """匯出工作池：執行緒池跑 build(progress)，完成的工作依 key 快取（最多 keep 份，舊的先丟）"""
+
+    def __init__(self, workers: int = 2, keep: int = 16):
+        self.keep = keep
+        self._lock = threading.Lock()
+        self._jobs: "OrderedDict[tuple, ExportJob]" = OrderedDict()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pm-export")
+
+    def get(self, key: tuple) -> ExportJob:
+        with self._lock:
+            return self._jobs.get(key)
+
+    def submit(self, key: tuple, build, filename: str, mime: str) -> ExportJob:
+        """已有同 key 的工作（排隊中 / 進行中 / 已完成）就直接回傳它；失敗過的才重做"""
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None and job.state != "failed":
+                self._jobs.move_to_end(key)
+                return job
+            job = ExportJob(key, filename, mime)
+            self._jobs[key] = job
+            self._prune()
+        self._pool.submit(self._run, job, build)
+        return job
+
+    def _run(self, job: ExportJob, build):
+        job.state = "running"
+        try:
+            job.data = build(job.progress)
+            job.state = "done"
+        except Exception as e:
+            job.error, job.state = str(e), "failed"
+        job.finished = time.time()
+
+    def _prune(self):
+        finished = [k for k, j in self._jobs.items() if not j.pending]
+        for k in finished[:max(0, len(finished) - self.keep)]:
+            del self._jobs[k]
+
+    def stats(self) -> dict:
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return {"pending": sum(j.pending for j in jobs),
+                "cached": sum(j.state == "done" for j in jobs),
+                "bytes": sum(len(j.data) for j in jobs if j.data)}
@@ -0,0 +1,176 @@
+"""
+工序日期遷移：把文字欄（drawing、welding…，M/D、YYYY/MM/DD、YYYY-MM-DD 混用）解析後補進
+date 型別欄（drawing_date…），分批、可中斷續跑，無法解析的格子另外列成報表。
+
+    python -m pm.migrate_dates [--batch 500] [--dry-run] [--restart] [--report unparsed.csv]
+
+先在 Supabase 執行 README「工序日期欄」的 SQL 建好欄位，並更新 set_updated_at trigger（只補 date 欄時保留
+原本的 updated_at；沒更新的話第一筆寫入後就會停止，不會把整張表的 updated_at 都改掉）。連線資訊取環境變數 SUPABASE_URL / SUPABASE_KEY，
+沒有的話讀 .streamlit/secrets.toml。進度（處理到的 id）記在 ~/.cache/pm-system/migrate_dates.json，
+中斷後再執行會從那裡接著做；--restart 從頭掃一遍（已補好的格子不會重寫）。
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+from pm.config import PROCESS_COLS, COL_DISPLAY_NAMES, CACHE_DIR, date_col
+from pm.data import parse_process_dates
+from pm.editing import save_rows_checked
+
+CHECKPOINT_PATH = CACHE_DIR / "migrate_dates.json"
+BATCH_SIZE = 500
+SELECT_COLS = ["id", "case_no", "updated_at", "created_at", *PROCESS_COLS, *(date_col(c) for c in PROCESS_COLS)]
+
+
+def plan_batch(rows: list, now: datetime = None) -> tuple:
+    """
+    一批原始列 → (要寫回的 [{id, <欄>_date…, _expected}], 無法解析的 [(id, 案號, 欄, 原文)])
+    只補 date 欄還是空的格子；M/D 的年份以該列最後修改時間（沒有就用建立時間 / 現在）為基準判斷跨年。
+    """
+    df = pd.DataFrame(rows)
+    if df.empty: return [], []
+    now = now or datetime.now()
+    anchor = pd.Series(pd.NaT, index=df.index, dtype="datetime64[ns]")
+    for c in ("updated_at", "created_at"):
+        if c in df.columns:
+            ts = pd.to_datetime(df[c], errors="coerce", utc=True, format="ISO8601").dt.tz_convert(None)
+            anchor = anchor.fillna(ts.astype("datetime64[ns]"))
+    anchor = anchor.fillna(pd.Timestamp(now))
+
+    fills, unparsed = {}, []
+    for c in PROCESS_COLS:
+        if c not in df.columns: continue
+        text  = df[c].fillna("").astype(str).str.strip()
+        typed = df[date_col(c)] if date_col(c) in df.columns else pd.Series(None, index=df.index)
+        need  = (text != "") & typed.isna()
+        if not need.any(): continue
+        parsed = parse_process_dates(text[need], anchor[need])
+        for i, d in parsed.items():
+            if pd.isna(d):
+                unparsed.append((int(df.at[i, "id"]), df.at[i, "case_no"] if "case_no" in df.columns else "",
+                                 c, text[i]))
+            else:
+                fills.setdefault(i, {})[date_col(c)] = d.strftime("%Y-%m-%d")
+    updates = [{"id": int(df.at[i, "id"]), **vals, "_expected": df.at[i, "updated_at"] or ""}
+               for i, vals in fills.items()]
+    return updates, unparsed
+
+
+def backfill(db, batch_size: int = BATCH_SIZE, after: int = 0, dry_run: bool = False,
+             checkpoint: Path = CHECKPOINT_PATH, on_batch=None) -> dict:
+    """
+    依 id 分批掃過 projects，補上 date 欄；每批寫完把最後的 id 記進 checkpoint（dry_run 不寫也不記）。
+    寫入帶 _expected：讀取後被別人改過的列這批略過（app 寫入時會自己補 date 欄，或下次重跑再處理）。
+    第一筆先單獨寫入並確認 updated_at 沒變，trigger 還是舊版就丟出 RuntimeError（只動到那一筆）。
+    回傳統計 {"rows", "filled", "written", "skipped", "unparsed": [(id, 案號, 欄, 原文)], "after"}
+    """
+    stats = {"rows": 0, "filled": 0, "written": 0, "skipped": 0, "unparsed": [], "after": after}
+    rpc_state = {"ok": None}
+    probed = False
+    while True:
+        rows = db.read(db.table("projects", "bulk").select(",".join(SELECT_COLS))
+                       .gt("id", after).order("id").limit(batch_size)).data or []
+        if not rows: break
+        updates, unparsed = plan_batch(rows)
+        stats["rows"] += len(rows)
+        stats["filled"] += sum(len(u) - 2 for u in updates)
+        stats["unparsed"] += unparsed
+        if updates and not dry_run:
+            written, todo = [], updates
+            while todo and not probed:   # 先一筆一筆寫到有一筆真的寫入，確認 updated_at 沒被改
+                first, todo = todo[:1], todo[1:]
+                got = save_rows_checked(db, first, rpc_state)
+                check_updated_at(first, got)
+                written, probed = written + got, bool(got)
+            if todo:
+                written += save_rows_checked(db, todo, rpc_state)
+            stats["written"] += len(written)
+            stats["skipped"] += len(updates) - len(written)
+        after = stats["after"] = int(rows[-1]["id"])
+        if not dry_run:
+            save_checkpoint(checkpoint, after)
+        if on_batch: on_batch(stats)
+        if len(rows) < batch_size: break
+    return stats
+
+
+def check_updated_at(updates: list, written: list):
+    """補 date 欄的寫入不該改到 updated_at；被改了代表資料庫的 set_updated_at 還是舊版"""
+    expected = {str(u["id"]): u["_expected"] for u in updates}
+    moved = [r["id"] for r in written if r.get("updated_at") != expected.get(str(r["id"]))]
+    if moved:
+        raise RuntimeError(f"id {moved[0]} 的 updated_at 被寫入改掉了：請先在 Supabase 重新執行 README 裡的 "
+                           "set_updated_at function（只補 date 欄時保留原本的 updated_at），再重跑遷移")
+
+def load_checkpoint(path: Path = CHECKPOINT_PATH) -> int:
+    try:
+        return int(json.loads(Path(path).read_text())["after"])
+    except (OSError, ValueError, KeyError):
+        return 0
+
+
+def save_checkpoint(path: Path, after: int):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps({"after": after, "at": datetime.now().isoformat()}))
+    tmp.replace(path)
+
+
+def write_report(path: str, unparsed: list):
+    """無法解析的格子 → CSV（utf-8-sig，Excel 直接開）"""
+    pd.DataFrame([(i, no, COL_DISPLAY_NAMES.get(c, c), c, t) for i, no, c, t in unparsed],
+                 columns=["id", "案號", "工序", "欄位", "原文"]).to_csv(path, index=False, encoding="utf-8-sig")
+
+
+def _credentials() -> tuple:
+    url, key = os.environ.get("SUPABASE_URL"), os.environ.get("SUPABASE_KEY")
+    if not (url and key):
+        import tomllib
+        secrets = Path(".streamlit/secrets.toml")
+        if secrets.exists():
+            conf = tomllib.loads(secrets.read_text(encoding="utf-8"))
+            url, key = url or conf.get("SUPABASE_URL"), key or conf.get("SUPABASE_KEY")
+    if not (url and key):
+        sys.exit("請設定 SUPABASE_URL / SUPABASE_KEY（環境變數或 .streamlit/secrets.toml）")
+    return url, key
+
+
+def main(argv=None):
+    from pm.db import SupabasePool
+
+    ap = argparse.ArgumentParser(description="把工序日期文字欄補進 date 型別欄")
+    ap.add_argument("--batch", type=int, default=BATCH_SIZE, help="每批筆數（須 ≤ PostgREST 的 Max Rows）")
+    ap.add_argument("--dry-run", action="store_true", help="只解析與報告，不寫入資料庫")
+    ap.add_argument("--restart", action="store_true", help="忽略上次的進度，從頭開始")
+    ap.add_argument("--report", default="unparsed_dates.csv", help="無法解析的格子輸出到這個 CSV")
+    args = ap.parse_args(argv)
+
+    db = SupabasePool(*_credentials())
+    after = 0 if args.restart or args.dry_run else load_checkpoint()
+    if after:
+        print(f"從 id > {after} 接續（--restart 可從頭開始）")
+    t0 = time.perf_counter()
+    try:
+        stats = backfill(db, args.batch, after, args.dry_run, on_batch=lambda s: print(
+            f"  已掃 {s['rows']} 筆（到 id {s['after']}）· 補 {s['filled']} 格 · 無法解析 {len(s['unparsed'])} 格",
+            flush=True))
+    except RuntimeError as e:
+        sys.exit(f"⚠️ {e}")
+    note = "（dry run，未寫入）" if args.dry_run else f"、寫入 {stats['written']} 筆"
+    if stats["skipped"]:
+        note += f"、略過 {stats['skipped']} 筆（期間被修改，重跑 --restart 補上）"
+    print(f"完成：掃描 {stats['rows']} 筆、補上 {stats['filled']} 格{note}，{time.perf_counter() - t0:.1f} 秒")
+    if stats["unparsed"]:
+        write_report(args.report, stats["unparsed"])
+        print(f"⚠️ {len(stats['unparsed'])} 格無法解析，已列在 {args.report}（修正文字後重跑 --restart）")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+"""
+寫入佇列（write-ahead）：修改先寫進本機 SQLite 就算收到，背景 thread 再分批送到資料庫。
+連不上 / 逾時 → 依次數退避重送；container 重開後沒送出的修改仍在檔案裡，啟動時繼續送。
+"""
+import json
+import time
+import sqlite3
+import threading
+from pathlib import Path
+
+from pm.config import CACHE_DIR
+
+OUTBOX_PATH  = CACHE_DIR / "outbox.sqlite"
+FLUSH_DELAY  = 0.3    # 收到修改後等一下再送，連續編輯合併成同一批
+BATCH_SIZE   = 200
+BACKOFF_SEC  = (1, 2, 5, 10, 30, 60, 120, 300)
+MAX_TRIES    = 20     # 約一小時以上都送不出去才標成失敗（可在畫面上重送）
+# 連線層的錯誤（連不上 / 逾時）：整批照次數退避，不拆開逐筆送（每筆都會再等一次逾時）
+TRANSIENT_ERRORS = (TimeoutError, ConnectionError)
+# 衝突只顯示給原本的使用者；超過這麼久還沒被取走（例如重開網頁時網址沒帶原本的 ?user=），
+# 就列在「資料維護」讓任何人以修改為準重送或放棄
+UNCLAIMED_SEC = 600
+
+_SCHEMA = """
+create table if not exists ops (
+  seq     integer primary key autoincrement,
+  kind    text not null,              -- update / insert / delete
+  owner   text not null default '',   -- 哪位使用者的修改（衝突只顯示給他）
+  label   text not null default '',
+  payload text not null,              -- update：{id, 變動欄位..., _expected}；insert：整列；delete：{id}
+  base    text,                       -- update：修改前的值（合併畫面用）
+  state   text not null default 'pending',   -- pending / sending / failed / conflict
+  tries   integer not null default 0,
+  next_at real not null default 0,
+  error   text,
+  server  text,                       -- conflict：資料庫目前的列（已刪除 = null）
+  created real not null
+);
+create index if not exists ops_state on ops (state, seq);
+"""
+
+
+class Outbox:
+    """
+    send(kind, payloads) → (寫入後的列, 衝突 [(payload, 資料庫目前的列或 None)])，失敗就丟例外；
+    由呼叫端注入（實際連 Supabase，或測試用的替身）。transient：send 會丟出的連線層例外類別。
+    send 必須可以安全重送：逾時的那批可能其實已寫入（update 靠版本檢查、insert 靠 client_id，見 pm/editing.py）。
+    on_drop(ids)：修改最後沒有寫入（標成失敗 / 被放棄）時，以那些列的 id 呼叫，讓呼叫端把先前樂觀套用的
+    內容換回資料庫目前的值（例如 ProjectStore.refetch）；在持有佇列鎖以外呼叫，不應做太久的事。
+    """
+
+    def __init__(self, send, path: Path = OUTBOX_PATH, transient: tuple = TRANSIENT_ERRORS, on_drop=None):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.send = send
+        self.transient = tuple(transient)
+        self.on_drop = on_drop
+        self.cond = threading.Condition()
+        self.db = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None)
+        self.db.execute("pragma journal_mode=wal")
+        self.db.executescript(_SCHEMA)
+        # 上次關掉時正在送的 → 重新排隊（資料庫端是否已寫入不確定，重送是安全的）
+        self.db.execute("update ops set state='pending' where state='sending'")
+        self.stats = {"sent": 0, "batches": 0, "last_error": ""}
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True, name="pm-outbox").start()
+        return self
+
+    # ── 寫入端 ─────────────────────────────────────────────
+    def enqueue(self, kind: str, payload: dict, label: str = "", owner: str = "", base: dict = None):
+        """
+        立即返回。同一位使用者、對同一筆、從同一個版本（_expected）出發、還沒送出的 update 直接合併；
+        別人的修改或從不同版本出發的各自排隊，各自做版本檢查（不然會蓋掉別人的修改而不報衝突）。
+        """
+        with self.cond:
+            if kind == "update":
+                row = self.db.execute(
+                    "select seq, payload, base from ops where kind='update' and state='pending' and owner=? "
+                    "and json_extract(payload, '$.id') = ? and coalesce(json_extract(payload, '$._expected'), '') = ? "
+                    "order by seq desc limit 1",
+                    (owner, payload["id"], payload.get("_expected") or "")).fetchone()
+                if row:
+                    old, old_base = json.loads(row[1]), json.loads(row[2] or "{}")
+                    merged = {**old, **{k: v for k, v in payload.items() if k != "_expected"}}
+                    merged_base = {**(base or {}), **old_base}
+                    self.db.execute("update ops set payload=?, base=? where seq=?",
+                                    (json.dumps(merged, ensure_ascii=False),
+                                     json.dumps(merged_base, ensure_ascii=False), row[0]))
+                    self.cond.notify()
+                    return
+            self.db.execute(
+                "insert into ops (kind, owner, label, payload, base, created) values (?,?,?,?,?,?)",
+                (kind, owner, label, json.dumps(payload, ensure_ascii=False),
+                 json.dumps(base, ensure_ascii=False) if base is not None else None, time.time()))
+            self.cond.notify()
+
+    def counts(self) -> dict:
+        with self.cond:
+            rows = self.db.execute("select state, count(*) from ops group by state").fetchall()
+        c = dict(rows)
+        return {"pending": c.get("pending", 0) + c.get("sending", 0),
+                "failed": c.get("failed", 0), "conflict": c.get("conflict", 0)}
+
+    def failed(self) -> list:
+        with self.cond:
+            return self.db.execute("select seq, label, error from ops where state='failed' order by seq").fetchall()
+
+    def failed_ids(self) -> list:
+        """已標成失敗的修改涉及的列 id"""
+        with self.cond:
+            return self._row_ids("state='failed'")
+
+    def retry_failed(self):
+        with self.cond:
+            self.db.execute("update ops set state='pending', tries=0, next_at=0 where state='failed'")
+            self.cond.notify()
+
+    def discard_failed(self):
+        with self.cond:
+            ids = self._row_ids("state='failed'")
+            self.db.execute("delete from ops where state='failed'")
+        self._dropped(ids)
+
+    def take_conflicts(self, owner: str) -> list:
+        """取出（並移除）這位使用者的衝突：[(label, payload, base, 資料庫目前的列)]"""
+        with self.cond:
+            rows = self.db.execute("select seq, label, payload, base, server from ops "
+                                   "where state='conflict' and owner=? order by seq", (owner,)).fetchall()
+            if rows:
+                self.db.execute(f"delete from ops where seq in ({','.join('?' * len(rows))})",
+                                [r[0] for r in rows])
+        return [(label, json.loads(p), json.loads(b or "{}"), json.loads(srv) if srv else None)
+                for _, label, p, b, srv in rows]
+
+    def unclaimed_conflicts(self, older_than: float = UNCLAIMED_SEC) -> list:
+        """超過 older_than 秒沒人取走的衝突：[(seq, payload, 資料庫目前的列或 None, 建立時間)]"""
+        with self.cond:
+            rows = self.db.execute("select seq, payload, server, created from ops where state='conflict' "
+                                   "and created <= ? order by seq", (time.time() - older_than,)).fetchall()
+        return [(seq, json.loads(p), json.loads(srv) if srv else None, created) for seq, p, srv, created in rows]
+
+    def resend_conflicts(self, seqs: list):
+        """以修改為準：拿掉版本檢查重新排隊（覆蓋資料庫目前的值）；那筆已被刪除的直接丟掉"""
+        with self.cond:
+            for seq in seqs:
+                row = self.db.execute("select payload, server from ops where seq=? and state='conflict'",
+                                      (seq,)).fetchone()
+                if not row: continue
+                if not row[1]:
+                    self.db.execute("delete from ops where seq=?", (seq,))
+                    continue
+                p = {k: v for k, v in json.loads(row[0]).items() if k != "_expected"}
+                self.db.execute("update ops set state='pending', payload=?, server=null, tries=0, next_at=0 "
+                                "where seq=?", (json.dumps(p, ensure_ascii=False), seq))
+            self.cond.notify()
+
+    def discard_conflicts(self, seqs: list):
+        if not seqs: return
+        where = f"state='conflict' and seq in ({','.join('?' * len(seqs))})"
+        with self.cond:
+            ids = self._row_ids(where, list(seqs))
+            self.db.execute(f"delete from ops where {where}", list(seqs))
+        self._dropped(ids)
+
+    def _row_ids(self, where: str, params: list = ()) -> list:
+        """符合條件的 update / delete 操作的列 id（新增的列還沒進快照，不必換回）"""
+        return [r[0] for r in self.db.execute(f"select json_extract(payload, '$.id') from ops where {where} "
+                                               "and kind in ('update', 'delete')", params).fetchall()]
+
+    def _dropped(self, ids: list):
+        if ids and self.on_drop is not None:
+            try: self.on_drop(ids)
+            except Exception: pass
+
+    # ── 背景送出 ───────────────────────────────────────────
+    def _next_batch(self) -> list:
+        """已到時間的待送修改中最早一筆起，連續同一種操作、每筆列最多一個，最多 BATCH_SIZE 筆（維持先後順序）"""
+        rows = self.db.execute("select seq, kind, payload, tries, owner from ops where state='pending' "
+                               "and next_at <= ? order by seq limit ?", (time.time(), BATCH_SIZE)).fetchall()
+        batch, ids = [], set()
+        for seq, kind, payload, tries, owner in rows:
+            payload = json.loads(payload)
+            # 同一筆的第二個修改留到下一批：前一個寫完才知道它該帶哪個版本，衝突也才對得上是哪一個
+            if kind != rows[0][1] or (payload.get("id") is not None and payload["id"] in ids): break
+            ids.add(payload.get("id"))
+            batch.append((seq, kind, payload, tries, owner))
+        if batch:
+            self.db.execute(f"update ops set state='sending' where seq in ({','.join('?' * len(batch))})",
+                            [b[0] for b in batch])
+        return batch
+
+    def _wait_sec(self) -> float:
+        row = self.db.execute("select min(next_at) from ops where state='pending'").fetchone()
+        return None if row[0] is None else max(row[0] - time.time(), FLUSH_DELAY)
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while True:
+                    wait = self._wait_sec()
+                    if wait is not None and wait <= FLUSH_DELAY: break
+                    self.cond.wait(wait)
+            time.sleep(FLUSH_DELAY)
+            with self.cond:
+                batch = self._next_batch()
+            if batch:
+                self._flush(batch)
+
+    def _flush(self, batch: list):
+        kind = batch[0][1]
+        try:
+            written, conflicts = self.send(kind, [b[2] for b in batch])
+        except self.transient as e:
+            return self._failed(batch, e)
+        except Exception as e:
+            if len(batch) == 1:
+                return self._failed(batch, e)
+            # 資料庫回錯（某幾筆內容有問題）→ 逐筆重送找出是哪幾筆；途中連線斷了，剩下的整批退避
+            for i, item in enumerate(batch):
+                try:
+                    res = self.send(kind, [item[2]])
+                except self.transient as e1:
+                    return self._failed(batch[i:], e1)
+                except Exception as e1:
+                    self._failed([item], e1)
+                else:
+                    self._done([item], *res)
+            return
+        self._done(batch, written, conflicts)
+
+    def _done(self, batch: list, written: list, conflicts: list):
+        lost = {str(p.get("id")): srv for p, srv in conflicts}
+        # 衝突時 written 裡也有資料庫目前的列（拿來修補快照），那不是這次寫入的版本
+        new_version = {str(r.get("id")): r.get("updated_at") for r in written
+                       if r.get("updated_at") and str(r.get("id")) not in lost}
+        with self.cond:
+            for seq, kind, payload, _, owner in batch:
+                rid = str(payload.get("id"))
+                if kind == "update" and rid in lost:
+                    srv = lost[rid]
+                    self.db.execute("update ops set state='conflict', server=? where seq=?",
+                                    (json.dumps(srv, ensure_ascii=False) if srv else None, seq))
+                    continue
+                self.db.execute("delete from ops where seq=?", (seq,))
+                # 同一位使用者之後又從同一個版本改了這筆：改用剛寫入的新版本當 _expected，不然會跟自己衝突。
+                # 別人的、或從其他版本出發的不動，照常做版本檢查
+                if kind != "update" or not payload.get("_expected") or rid not in new_version: continue
+                for seq2, p2 in self.db.execute(
+                        "select seq, payload from ops where kind='update' and state='pending' and owner=? "
+                        "and json_extract(payload, '$.id') = ? and json_extract(payload, '$._expected') = ?",
+                        (owner, payload["id"], payload["_expected"])).fetchall():
+                    p2 = {**json.loads(p2), "_expected": new_version[rid]}
+                    self.db.execute("update ops set payload=? where seq=?", (json.dumps(p2, ensure_ascii=False), seq2))
+            self.stats["sent"] += len(batch) - len(lost)
+            self.stats["batches"] += 1
+
+    def _failed(self, batch: list, err: Exception):
+        now, gave_up = time.time(), []
+        with self.cond:
+            for seq, kind, payload, tries, _ in batch:
+                tries += 1
+                state = "failed" if tries >= MAX_TRIES else "pending"
+                self.db.execute("update ops set state=?, tries=?, next_at=?, error=? where seq=?",
+                                (state, tries, now + BACKOFF_SEC[min(tries, len(BACKOFF_SEC)) - 1], str(err), seq))
+                if state == "failed" and kind in ("update", "delete"):
+                    gave_up.append(payload.get("id"))
+            self.stats["last_error"] = str(err)
+        self._dropped(gave_up)
@@ -0,0 +1,122 @@
+"""變更訂閱：每個 server process 一個背景 listener，把 insert / update / delete 事件合併後交給共用快照"""
+import time
+import asyncio
+import threading
+
+FLUSH_SEC     = 0.5    # 事件先累積這麼久再一次套用，連續大量變更只重排一次
+RECONNECT_SEC = (1, 2, 5, 10, 30)
+
+
+def parse_payload(payload) -> tuple:
+    """Supabase Realtime 的 postgres_changes 內容 → (kind, 新列, 舊列)；kind 為 insert / update / delete"""
+    d = payload.get("data", payload) if isinstance(payload, dict) else {}
+    kind = str(d.get("type") or d.get("eventType") or "").rsplit(".", 1)[-1].lower()
+    return kind, d.get("record") or d.get("new") or {}, d.get("old_record") or d.get("old") or {}
+
+
+class LocalBackend:
+    """本機 / 測試用：publish() 直接把事件送進 feed，不必連線"""
+
+    def run(self, emit, set_connected):
+        self._emit = emit
+        set_connected(True)
+
+    def publish(self, kind: str, row: dict):
+        self._emit(kind, row)
+
+
+class SupabaseRealtimeBackend:
+    """訂閱 Supabase Realtime 的 postgres_changes；斷線依 RECONNECT_SEC 退避重連"""
+
+    def __init__(self, url: str, key: str, table: str = "projects", schema: str = "public"):
+        self.url, self.key, self.table, self.schema = url, key, table, schema
+
+    def run(self, emit, set_connected):
+        asyncio.run(self._main(emit, set_connected))
+
+    async def _main(self, emit, set_connected):
+        from supabase import acreate_client
+        tries = 0
+        while True:
+            try:
+                client = await acreate_client(self.url, self.key)
+                channel = client.channel(f"pm-{self.table}")
+
+                def _on_change(payload):
+                    kind, row, old = parse_payload(payload)
+                    emit(kind, old if kind == "delete" else row)
+
+                def _on_status(status, err=None):
+                    set_connected(str(status).rsplit(".", 1)[-1].upper() == "SUBSCRIBED")
+
+                channel.on_postgres_changes("*", schema=self.schema, table=self.table, callback=_on_change)
+                await channel.subscribe(_on_status)
+                tries = 0
+                while getattr(client.realtime, "is_connected", True):
+                    await asyncio.sleep(1)
+            except Exception:
+                pass
+            set_connected(False)
+            await asyncio.sleep(RECONNECT_SEC[min(tries, len(RECONNECT_SEC) - 1)])
+            tries += 1
+
+
+class ChangeFeed:
+    """
+    backend 在背景 thread 收事件（emit），flush thread 每 FLUSH_SEC 秒把同一 id 的事件合併成
+    最後狀態，呼叫 apply(更新 / 新增的列, 刪除的 id)。
+    連線中斷後重新訂閱時呼叫 on_reconnect()，讓快照補一次增量同步，補回斷線期間漏掉的變更。
+    """
+
+    def __init__(self, backend, apply, on_reconnect=None, flush_sec: float = FLUSH_SEC):
+        self.backend, self.apply, self.on_reconnect = backend, apply, on_reconnect
+        self.flush_sec = flush_sec
+        self.cond = threading.Condition()
+        self.upserts, self.deletes = {}, set()
+        self.connected, self._ever = False, False
+        self.stats = {"events": 0, "flushes": 0, "last_event": None}
+
+    def start(self):
+        threading.Thread(target=self.backend.run, args=(self.emit, self.set_connected),
+                         daemon=True, name="pm-realtime").start()
+        threading.Thread(target=self._flush_loop, daemon=True, name="pm-realtime-flush").start()
+        return self
+
+    def emit(self, kind: str, row: dict):
+        rid = row.get("id")
+        if rid is None or kind not in ("insert", "update", "delete"): return
+        rid = str(rid)
+        with self.cond:
+            if kind == "delete":
+                self.upserts.pop(rid, None)
+                self.deletes.add(rid)
+            else:
+                self.deletes.discard(rid)
+                self.upserts[rid] = row
+            self.stats["events"] += 1
+            self.stats["last_event"] = time.time()
+            self.cond.notify()
+
+    def set_connected(self, ok: bool):
+        with self.cond:
+            was, self.connected = self.connected, ok
+            reconnect = ok and not was and self._ever
+            self._ever = self._ever or ok
+        if reconnect and self.on_reconnect:
+            self.on_reconnect()
+
+    def _flush_loop(self):
+        while True:
+            with self.cond:
+                while not self.upserts and not self.deletes:
+                    self.cond.wait()
+            time.sleep(self.flush_sec)
+            with self.cond:
+                rows, deleted = list(self.upserts.values()), list(self.deletes)
+                self.upserts, self.deletes = {}, set()
+            try:
+                self.apply(rows, deleted)
+                self.stats["flushes"] += 1
+            except Exception:
+                # 套用失敗（例如欄位格式意外）→ 交給下一次增量同步補上
+                if self.on_reconnect: self.on_reconnect()
@@ -0,0 +1,118 @@
+"""
+projects 的本機唯讀副本（SQLite）：載入器每次同步後寫入，冷啟動先從這裡顯示，
+Supabase 連不上時也能瀏覽；分組統計可以直接下 SQL。
+"""
+import sqlite3
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from pm.config import CACHE_DIR
+
+REPLICA_PATH = CACHE_DIR / "replica.sqlite"
+GROUP_COLS = {"section", "status_type", "handover_year", "client", "contact"}   # 可分組 / 篩選的欄
+
+
+def _quote(col: str) -> str:
+    return '"' + col.replace('"', '""') + '"'
+
+
+class Replica:
+    """寫入在單一背景 thread 依序執行（不卡住載入器）；讀取各自開連線（WAL 模式可與寫入同時進行）"""
+
+    def __init__(self, path: Path = REPLICA_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pm-replica")
+        self.version = 0      # 最後寫完的快照版本
+        with self._connect() as db:
+            db.execute("pragma journal_mode=wal")
+            db.execute("create table if not exists meta (key text primary key, value text)")
+
+    @contextmanager
+    def _connect(self):
+        db = sqlite3.connect(str(self.path), timeout=10)
+        try:
+            with db: yield db    # 正常結束 commit、例外 rollback
+        finally:
+            db.close()
+
+    # ── 讀取 ───────────────────────────────────────────────
+    def load(self) -> tuple:
+        """(原始列 DataFrame, 高水位 updated_at 字串)；沒有副本 → (空 DataFrame, None)"""
+        with self._connect() as db:
+            if not db.execute("select 1 from sqlite_master where name='projects'").fetchone():
+                return pd.DataFrame(), None
+            df = pd.read_sql_query("select * from projects", db)
+            row = db.execute("select value from meta where key='hwm'").fetchone()
+        return df, row[0] if row else None
+
+    def group_counts(self, by: list, where: dict = None) -> pd.DataFrame:
+        """select by..., count(*) from projects where 欄 in (...) group by by...；欄位限 GROUP_COLS"""
+        cols = [c for c in by if c in GROUP_COLS]
+        conds, params = [], []
+        for c, vals in (where or {}).items():
+            if c not in GROUP_COLS or not vals: continue
+            conds.append(f"coalesce({_quote(c)}, '') in ({','.join('?' * len(vals))})")
+            params += [str(v) for v in vals]
+        sel = ", ".join(f"coalesce({_quote(c)}, '') as {_quote(c)}" for c in cols)
+        sql = (f"select {sel + ', ' if sel else ''}count(*) as n from projects"
+               + (f" where {' and '.join(conds)}" if conds else "")
+               + (f" group by {', '.join(_quote(c) for c in cols)}" if cols else ""))
+        with self._connect() as db:
+            return pd.read_sql_query(sql, db, params=params)
+
+    # ── 寫入（背景）────────────────────────────────────────
+    def replace_all(self, df: pd.DataFrame, hwm, version: int):
+        self.writer.submit(self._replace_all, _raw(df), hwm, version)
+
+    def apply(self, rows: pd.DataFrame, deleted_ids, hwm, version: int):
+        self.writer.submit(self._apply, _raw(rows), list(deleted_ids), hwm, version)
+
+    def _replace_all(self, raw: pd.DataFrame, hwm, version: int):
+        with self.lock, self._connect() as db:
+            db.execute("drop table if exists projects")
+            cols = ", ".join(f"{_quote(c)} {'integer primary key' if c == 'id' else 'text'}" for c in raw.columns)
+            db.execute(f"create table projects ({cols})")
+            self._insert(db, raw)
+            self._set_meta(db, hwm)
+        self.version = version
+
+    def _apply(self, raw: pd.DataFrame, deleted_ids: list, hwm, version: int):
+        with self.lock, self._connect() as db:
+            if not db.execute("select 1 from sqlite_master where name='projects'").fetchone():
+                return
+            have = {r[1] for r in db.execute("pragma table_info(projects)")}
+            for c in raw.columns:
+                if c not in have: db.execute(f"alter table projects add column {_quote(c)} text")
+            if deleted_ids:
+                db.executemany("delete from projects where id = ?", [(int(i),) for i in deleted_ids])
+            self._insert(db, raw)
+            self._set_meta(db, hwm)
+        self.version = version
+
+    @staticmethod
+    def _insert(db, raw: pd.DataFrame):
+        if raw.empty: return
+        cols = list(raw.columns)
+        db.executemany(f"insert or replace into projects ({', '.join(map(_quote, cols))}) "
+                       f"values ({', '.join('?' * len(cols))})",
+                       raw.itertuples(index=False, name=None))
+
+    @staticmethod
+    def _set_meta(db, hwm):
+        db.execute("insert or replace into meta values ('hwm', ?)", (None if hwm is None else str(hwm),))
+
+
+def _raw(df: pd.DataFrame) -> pd.DataFrame:
+    """只留資料庫欄位（去掉 _ 開頭的衍生欄），全部轉字串、id 轉整數"""
+    cols = [c for c in df.columns if not str(c).startswith("_")]
+    raw = df[cols].astype(str)
+    if "id" in raw.columns:
+        ids = pd.to_numeric(raw["id"], errors="coerce")
+        raw = raw[ids.notna()].assign(id=ids[ids.notna()].astype(int))
+    return raw
@@ -0,0 +1,282 @@
+"""
+畫面呈現：全站 CSS、本週日期索引、篩選索引、分區 HTML 表格、統計卡 / 分區標籤、PDF 每格文字
+（全部是純函式，快取與 Streamlit 元件由 app.py 負責）
+"""
+import html
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from pm.config import STATUS_CONFIG, PROCESS_COLS, DISPLAY_COLS, COL_DISPLAY_NAMES, WEEK_COLS, dt_col
+from pm.exports import PDF_LAYOUT, PDF_BG
+
+APP_CSS = """
+<style>
+  /* ══ 基礎 ══ */
+  .block-container { padding-top: 0.3rem !important; padding-left: 0.5rem !important; padding-right: 0.5rem !important; }
+  header[data-testid="stHeader"] { background: transparent; }
+
+  /* ══ 自訂統計卡（HTML，完全控制顏色）══ */
+  .kpi-grid {
+    display: grid;
+    grid-template-columns: repeat(3, 1fr);
+    gap: 8px; margin-bottom: 10px;
+  }
+  .kpi-card {
+    background: #1a3a5c; border-radius: 10px;
+    padding: 10px 8px; text-align: center;
+    border: 1px solid #2a5080;
+  }
+  .kpi-label { color: #90caf9; font-size: 12px; font-weight: 700; margin-bottom: 2px; }
+  .kpi-value { color: #ffffff; font-size: 1.6rem; font-weight: 900; line-height: 1.1; }
+
+  /* ══ 分區標題 ══ */
+  .section-header {
+    background: linear-gradient(90deg, #0d2137, #1a3a5c); color: #fff;
+    padding: 10px 14px; border-radius: 8px;
+    font-size: 15px; font-weight: 800; margin: 12px 0 6px 0; letter-spacing: 1px;
+  }
+
+  /* ══ 按鈕：強制白底深字，深色模式也清楚 ══ */
+  .stButton > button {
+    border-radius: 18px !important;
+    font-size: 14px !important;
+    font-weight: 700 !important;
+    min-height: 44px !important;
+    padding: 4px 10px !important;
+    background-color: #ffffff !important;
+    color: #111111 !important;
+    border: 1.5px solid #999999 !important;
+  }
+  /* 選中（primary）：深藍底白字 */
+  .stButton > button[kind="primaryFormSubmit"],
+  .stButton > button[kind="primary"] {
+    background-color: #1a3a5c !important;
+    color: #ffffff !important;
+    border: none !important;
+  }
+
+  /* ══ 圖例列 ══ */
+  .legend-bar {
+    display: flex; gap: 8px; flex-wrap: wrap;
+    background: #1e3a5f; padding: 8px 12px; border-radius: 8px;
+    margin-bottom: 8px; font-size: 12px; font-weight: 600;
+    color: #e3f0ff; align-items: center; border: 1px solid #2a5080;
+  }
+  .color-box {
+    width: 13px; height: 13px; border-radius: 3px;
+    border: 1px solid #888; display: inline-block; vertical-align: middle;
+  }
+
+  /* ══ 工程卡片（手機用）══ */
+  .project-card {
+    background: #fff; border-radius: 10px; padding: 12px 14px;
+    margin-bottom: 8px; border-left: 5px solid #1a3a5c;
+    box-shadow: 0 1px 4px rgba(0,0,0,0.12);
+  }
+  .project-card.status-in_progress  { border-left-color: #e6c800; background: #fffff0; }
+  .project-card.status-pending       { border-left-color: #2196f3; background: #e8f4ff; }
+  .project-card.status-not_started   { border-left-color: #90a4ae; background: #fafafa; }
+  .project-card.status-suspended     { border-left-color: #ff7043; background: #fff3ee; }
+  .project-card.status-completed     { border-left-color: #757575; background: #f5f5f5; }
+  .card-title { font-size: 15px; font-weight: 800; color: #0d2137; margin-bottom: 4px; }
+  .card-sub   { font-size: 12px; color: #444; margin: 2px 0; }
+  .card-badge {
+    display: inline-block; border-radius: 12px; padding: 2px 10px;
+    font-size: 11px; font-weight: 700; margin: 4px 4px 0 0;
+  }
+  .card-red { color: #c62828; font-weight: 900; }
+
+  /* ══ dataframe 字色 ══ */
+  [data-testid="stDataFrame"] td { color: #111 !important; font-size: 13px !important; }
+  [data-testid="stDataFrame"] th { color: #fff !important; font-size: 12px !important; }
+
+  /* ══ 分區唯讀表格（列底色由 tr.st-<狀態> 決定，見 TABLE_STATUS_CSS）══ */
+  .pm-table-wrap { overflow-x: auto; max-height: 420px; overflow-y: auto; }
+  .pm-table { border-collapse: collapse; width: 100%; font-family: sans-serif; }
+  .pm-table th {
+    background: #1a3a5c; color: #fff; padding: 6px 8px;
+    white-space: nowrap; font-size: 12px; border: 1px solid #2a5080;
+    position: sticky; top: 0;
+  }
+  .pm-table td {
+    background: #ffffff; padding: 5px 7px; font-size: 12px;
+    border: 1px solid #ddd; white-space: nowrap; color: #111;
+  }
+  .pm-table .wk { color: #c62828; font-weight: 900; }
+</style>
+"""
+# 表格列底色：每個狀態一個 CSS class
+TABLE_STATUS_CSS = "".join(
+    f".pm-table tr.st-{k} td {{ background: {v['bg']}; }}\n" for k, v in STATUS_CONFIG.items())
+
+# ── 本週判斷 ──────────────────────────────────────────────
+def week_start(now: datetime = None) -> datetime:
+    """本週一 00:00"""
+    now = now or datetime.now()
+    ws  = now - timedelta(days=now.weekday())
+    return ws.replace(hour=0, minute=0, second=0, microsecond=0)
+
+# 格子內的日期片段：M/D（例如 2/1、2/26）或 YYYY-MM-DD
+_WEEK_FRAG_RE = r"(?<!\d)(?P<md>\d{1,2}/\d{1,2})(?!\d)|(?P<iso>\d{4}-\d{2}-\d{2})"
+_DATE_FRAG_RE = r"((?<!\d)\d{1,2}/\d{1,2}(?!\d)|\d{4}-\d{2}-\d{2})"
+
+def short_date_text(s: pd.Series) -> pd.Series:
+    """YYYY/MM/DD → M/D（與表格 / PDF 顯示一致），其他寫法不動"""
+    m = s.str.extract(r"\d{4}/(\d{1,2})/(\d{1,2})")
+    return s.where(m[0].isna(), m[0].str.lstrip("0") + "/" + m[1].str.lstrip("0"))
+
+def build_week_index(df: pd.DataFrame, now: datetime = None) -> dict:
+    """
+    一次找出所有格子裡落在本週（週一到週日）的日期片段：
+      hits    : 與 df 同 index、欄位為 WEEK_COLS 的 DataFrame，值 = 第一個本週日期片段（沒有 = ""）
+      updated : updated_at 是否在本週（🔴 本週更新）
+    工序欄直接用已解析的日期（_dt_<欄名>，與工時分析同一份）；其他文字欄裡的 M/D 一律視為今年。
+    """
+    now = now or datetime.now()
+    ws  = pd.Timestamp(week_start(now))
+    we  = ws + pd.Timedelta(days=7)
+    cols = [c for c in WEEK_COLS if c in df.columns]
+    hits = pd.DataFrame("", index=df.index, columns=cols)
+    parsed = [c for c in cols if c in PROCESS_COLS and dt_col(c) in df.columns]
+    text_cols = [c for c in cols if c not in parsed]
+    if len(df) and text_cols:
+        # 以畫面上的短日期比對，找到的片段才能直接拿去標紅
+        text = df[text_cols].astype(str)
+        for c in text_cols:
+            if c in PROCESS_COLS:
+                text[c] = short_date_text(text[c])
+        frags = text.stack().str.extractall(_WEEK_FRAG_RE)
+        if not frags.empty:
+            md  = frags["md"].str.extract(r"(\d+)/(\d+)").astype(float)
+            dt  = pd.to_datetime(pd.DataFrame({"year": now.year, "month": md[0], "day": md[1]},
+                                              index=frags.index), errors="coerce")
+            dt  = dt.fillna(pd.to_datetime(frags["iso"], errors="coerce", format="%Y-%m-%d"))
+            first = frags[(dt >= ws) & (dt < we)].groupby(level=[0, 1]).head(1)
+            if not first.empty:
+                frag = first["md"].fillna(first["iso"]).droplevel(-1)
+                hits[text_cols] = frag.unstack().reindex(index=df.index, columns=text_cols).fillna("")
+    for c in parsed:
+        wk = (df[dt_col(c)] >= ws) & (df[dt_col(c)] < we)
+        if wk.any():
+            text = short_date_text(df.loc[wk, c].astype(str))
+            hits.loc[wk, c] = text.str.extract(_DATE_FRAG_RE, expand=False).fillna(text)
+    updated = pd.Series(False, index=df.index)
+    if "updated_at" in df.columns:
+        ts = pd.to_datetime(df["updated_at"], errors="coerce", utc=True, format="ISO8601").dt.tz_localize(None)
+        updated = (ts >= ws) & (ts < we)
+    return {"hits": hits, "updated": updated}
+
+def week_key(now: datetime = None) -> tuple:
+    """本週索引的時間 key（ISO 年週 + 年份，M/D 以今年解析）"""
+    now = now or datetime.now()
+    iso = now.isocalendar()
+    return (iso[0], iso[1], now.year)
+
+# ── 篩選引擎 ──────────────────────────────────────────────
+# 每個資料版本建一次索引：每列一個小寫搜尋字串 + 各狀態 / 分區 / 年份的布林 bitmap；
+# 查詢結果（列位置）再依篩選條件快取，切換狀態按鈕只是幾個 bitmap 的 AND / OR
+SEARCH_COLS = ["project_name", "case_no", "client", "contact"]
+
+def build_filter_index(df: pd.DataFrame) -> dict:
+    blob = df[SEARCH_COLS[0]].astype(str)
+    for c in SEARCH_COLS[1:]:
+        blob = blob + "\x1f" + df[c].astype(str)   # 分隔字元，避免跨欄誤配
+    def bitmaps(col):
+        codes = df[col].astype("category")
+        return {str(k): (codes == k).to_numpy() for k in codes.cat.categories}
+    return {
+        "n":       len(df),
+        "blob":    blob.str.lower().reset_index(drop=True),
+        "status":  bitmaps("status_type"),
+        "section": bitmaps("section"),
+        "year":    bitmaps("handover_year"),
+    }
+
+def query_filter_index(idx: dict, statuses: tuple, search: str, year: str, section: str) -> np.ndarray:
+    none = np.zeros(idx["n"], dtype=bool)
+    mask = np.ones(idx["n"], dtype=bool)
+    if statuses:
+        mask &= np.logical_or.reduce([idx["status"].get(k, none) for k in statuses])
+    if year != "全部年份":
+        mask &= idx["year"].get("" if year == "未填年份" else year, none)
+    if section != "全部分區":
+        mask &= idx["section"].get(section, none)
+    pos = np.flatnonzero(mask)
+    if search:
+        # 關鍵字一律當純文字比對（不走 regex），不分大小寫
+        hit = idx["blob"].iloc[pos].str.contains(search.lower(), regex=False).to_numpy()
+        pos = pos[hit]
+    return pos
+
+# ── 分區唯讀表格 ──────────────────────────────────────────
+TABLE_PAGE_ROWS = 200   # 超過這個筆數改分頁顯示，只產生目前這一頁的 HTML
+
+def render_table_html(df_rows: pd.DataFrame, hits: pd.DataFrame) -> str:
+    """
+    整欄向量化組出表格 HTML：每欄一次轉字串 / 短日期 / 跳脫，
+    本週日期片段包 <span class="wk">，列底色用 tr 的 class，不再每格寫 inline style。
+    """
+    disp_cols = [c for c in DISPLAY_COLS if c in df_rows.columns]
+    th_html = "".join(f"<th>{COL_DISPLAY_NAMES.get(c,c)}</th>" for c in disp_cols)
+    status  = df_rows["status_type"].astype(str) if "status_type" in df_rows.columns \
+              else pd.Series("", index=df_rows.index)
+    rows = '<tr class="st-' + status + '">'
+    for c in disp_cols:
+        text = df_rows[c].astype(str)
+        if c in PROCESS_COLS:
+            text = short_date_text(text)
+        text = text.map(html.escape)
+        if c in hits.columns:
+            frag = hits[c].reindex(df_rows.index).fillna("")
+            wk = frag != ""
+            if wk.any():
+                text[wk] = [t.replace(f, f'<span class="wk">{f}</span>')
+                            for t, f in zip(text[wk], frag[wk])]
+        rows = rows + "<td>" + text + "</td>"
+    rows = rows + "</tr>"
+    return (f'<div class="pm-table-wrap"><table class="pm-table">'
+            f'<thead><tr>{th_html}</tr></thead><tbody>{"".join(rows)}</tbody></table></div>')
+
+# ── 統計卡 / 分區標籤 ──────────────────────────────────────
+KPI_ITEMS = [("📋 全部", None), ("⚙ 製作中", "in_progress"), ("📦 待交站", "pending"),
+             ("⏳ 未開始", "not_started"), ("⏸ 停工", "suspended"), ("✅ 已完成", "completed")]
+
+def kpi_cards_html(counts: dict, total: int) -> str:
+    """counts：{status_type: 件數}"""
+    cards = "".join(f"""<div class='kpi-card'>
+          <div class='kpi-label'>{label}</div>
+          <div class='kpi-value'>{total if key is None else int(counts.get(key, 0))}</div>
+        </div>""" for label, key in KPI_ITEMS)
+    return f"<div class='kpi-grid'>{cards}</div>"
+
+def section_badges_html(counts: dict, n_week: int) -> str:
+    """分區標題後的各狀態件數 ＋ 本週更新數量"""
+    badges = ""
+    for k, cfg in STATUS_CONFIG.items():
+        n = int(counts.get(k, 0))
+        if n:
+            badges += (f'<span style="background:{cfg["btn"]};color:{cfg["text"]};'
+                       f'border-radius:10px;padding:1px 9px;font-size:11px;'
+                       f'margin-left:6px;font-weight:700;">{cfg["label"]} {n}</span>')
+    if n_week:
+        badges += (f'<span style="background:#e53935;color:#fff;border-radius:10px;'
+                   f'padding:1px 9px;font-size:11px;margin-left:6px;font-weight:700;">'
+                   f'🔴 本週更新 {n_week}</span>')
+    return badges
+
+# ── PDF 匯出：每格文字（版面在 pm/exports.py）──────────────
+def pdf_section_block(title: str, ds: pd.DataFrame, hits: pd.DataFrame) -> dict:
+    """一個分區要印的內容：標題、每格文字（短日期 / 截斷）、列底色、本週紅字旗標"""
+    cells, wk = {}, {}
+    for k, _, _ in PDF_LAYOUT:
+        text = ds[k].astype(str).str.strip() if k in ds.columns else pd.Series("", index=ds.index)
+        text = text.replace({"None":"","nan":"","-":""})
+        if k in PROCESS_COLS:
+            text = short_date_text(text)
+        cells[k] = text.where(text.str.len() <= 16, text.str[:15] + "…").tolist()
+        wk[k] = ((hits[k].reindex(ds.index).fillna("") != "") if k in hits.columns
+                 else pd.Series(False, index=ds.index)).tolist()
+    bgs = [PDF_BG.get(s, (255,255,255)) for s in ds["status_type"].astype(str)]
+    return {"title": title, "cells": cells, "wk": wk, "bg": bgs, "n": len(ds)}